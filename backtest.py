@@ -3,27 +3,532 @@
 import sys
 import os
 import itertools
+import inspect
+import struct
 import collections
-from datetime import datetime
+import heapq
+import timeit
+import multiprocessing
+import bisect
+import array
+import operator
+from datetime import datetime, timedelta
 import csv
+import gzip
+import bz2
 import decimal
 D = decimal.Decimal
 decimal.getcontext().prec = 6
+_INF = float('inf')
+_NAN = float('nan')
+
+#numpy is optional, without it BarSeries falls back to array.array
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+#lzma is optional, it's only needed for .xz inputs
+try:
+	import lzma
+except ImportError:
+	try:
+		from backports import lzma
+	except ImportError:
+		lzma = None
 
 class InvalidOrderException(Exception): pass
 class InvalidStateException(Exception): pass
 class InvalidBarException(Exception): pass
 class InvalidLevelException(Exception): pass
 
+EPOCH = datetime(1970, 1, 1)
+
+#datetime <-> integer seconds since the epoch, bar dates are naive
+def dt2ts(dt):
+	d = dt - EPOCH
+	return d.days * 86400 + d.seconds
+
+def ts2dt(ts):
+	return EPOCH + timedelta(seconds=int(ts))
+
+###
+# numeric backends
+#
+# prices, position sizes and money all go through NUM, one of
+#	DecimalNumbers	Decimal at the context's 6 digits, for audit runs (default)
+#	FloatNumbers	floats, fast but inexact
+#	TickNumbers	Ticks, exact fixed point on python ints, faster than Decimal
+# pick one with set_numbers() before making any bars, orders or positions,
+# values from different backends don't mix. strategies make constants
+# with num(), e.g. b.cl - num('0.0020'), so they work with any of them.
+#
+# each takes an optional dict of per symbol precision, {'USDJPY': 2,
+# 'EURUSD': 5}, prices parsed for those symbols are rounded to it. with
+# ticks that makes a price an integer count of the symbol's tick.
+###
+
+#sums are done in a wide context so they stay exact
+_WIDE = decimal.Context(prec=28)
+
+class _NoContext(object):
+	def __enter__(self):
+		return self
+	def __exit__(self, *exc):
+		return False
+_NOCTX = _NoContext()
+
+class DecimalNumbers(object):
+
+	name = 'decimal'
+
+	def __init__(self, precision=None):
+		self.precision = dict(precision or {})
+
+	def __str__(self):
+		return "%s %s" % (self.name, self.precision)
+
+	#a number or numeric string as this backend's type
+	def num(self, x):
+		if isinstance(x, decimal.Decimal):
+			return x
+		return D(str(x))
+
+	#a price field of a bar for sym, from text
+	def price(self, sym, s):
+		p = D(s)
+		if sym in self.precision:
+			p = p.quantize(D(1).scaleb(-self.precision[sym]), context=_WIDE)
+		return p
+
+	#what exact running sums are done in
+	def wide(self):
+		return decimal.localcontext(_WIDE)
+
+class FloatNumbers(DecimalNumbers):
+
+	name = 'float'
+
+	def num(self, x):
+		if type(x) is float:
+			return x
+		return float(x)
+
+	#rounded from the text, half even as the others round
+	def price(self, sym, s):
+		if sym in self.precision:
+			return float(DecimalNumbers.price(self, sym, s))
+		return float(s)
+
+	def wide(self):
+		return _NOCTX
+
+class TickNumbers(DecimalNumbers):
+
+	name = 'ticks'
+
+	def num(self, x):
+		if type(x) is Ticks:
+			return x
+		return Ticks(x)
+
+	def price(self, sym, s):
+		p = Ticks(s)
+		if sym in self.precision:
+			p = p.rescale(self.precision[sym])
+		return p
+
+	def wide(self):
+		return _NOCTX
+
+NUMBERS = {'decimal': DecimalNumbers, 'float': FloatNumbers, 'ticks': TickNumbers}
+NUM = DecimalNumbers()
+
+###
+# use backend, a name from NUMBERS or an instance, precision is the per
+# symbol precision for a name. returns the one it replaced
+###
+def set_numbers(backend, precision=None):
+
+	global NUM
+
+	if isinstance(backend, basestring):
+		if backend not in NUMBERS:
+			raise ValueError("unknown numeric backend %s, one of %s" % (backend, 
+				", ".join(sorted(NUMBERS))))
+		backend = NUMBERS[backend](precision)
+	old = NUM
+	NUM = backend
+	return old
+
+#x in the current backend's type
+def num(x):
+	return NUM.num(x)
+
+###
+# exact fixed point numbers
+#
+# the value is v / 10**e with v a python int, so + and - are exact and
+# plain integer sums. * and ** keep up to PLACES places and / gives 
+# PLACES, all rounding half even. //, % and divmod() work as they do
+# for a Decimal. formats with %f, %d and str() like a Decimal would.
+# comparing with a float compares as floats.
+###
+_POW10 = [10 ** i for i in xrange(40)]
+
+def _pow10(n):
+	if n < 40:
+		return _POW10[n]
+	return 10 ** n
+
+#n / d rounded half even, d > 0
+def _div_even(n, d):
+	(q, r) = divmod(n, d)
+	r += r
+	if r > d or (r == d and q & 1):
+		q += 1
+	return q
+
+#a comparison, against a float it's done as floats
+def _compare(op):
+	def f(self, o):
+		if type(o) is float:
+			return op(float(self), o)
+		o = _other(o)
+		if o is NotImplemented:
+			return o
+		(a, b, e) = self._align(o)
+		return op(a, b)
+	return f
+
+def _ticks(v, e):
+	t = object.__new__(Ticks)
+	t.v = v
+	t.e = e
+	return t
+
+class Ticks(object):
+
+	__slots__ = ('v', 'e')
+
+	PLACES = 12
+
+	def __init__(self, x=0):
+		t = type(x)
+		if t is Ticks:
+			(self.v, self.e) = (x.v, x.e)
+			return
+		if t is int or t is long:
+			(self.v, self.e) = (x, 0)
+			return
+		if t is float:
+			if x != x or x == _INF or x == -_INF:
+				raise ValueError("cannot make Ticks from %r" % x)
+			x = repr(x)
+		elif not isinstance(x, basestring):
+			x = str(x)
+		(i, dot, f) = x.strip().partition('.')
+		try:
+			if 'e' in f or 'E' in f or 'e' in i or 'E' in i:
+				raise ValueError
+			(self.v, self.e) = (int(i + f), len(f))
+		except ValueError:
+			#exponents and anything odd, Decimal raises if it's not a number
+			(sign, digits, exp) = D(x).as_tuple()
+			if not isinstance(exp, (int, long)):
+				raise ValueError("cannot make Ticks from %r" % x)
+			v = int(''.join(map(str, digits)))
+			if sign:
+				v = -v
+			if exp > 0:
+				(self.v, self.e) = (v * _pow10(exp), 0)
+			else:
+				(self.v, self.e) = (v, -exp)
+
+	#the same value with e places, rounded half even if that's fewer
+	def rescale(self, e):
+		if e >= self.e:
+			return _ticks(self.v * _pow10(e - self.e), e)
+		return _ticks(_div_even(self.v, _pow10(self.e - e)), e)
+
+	#without trailing zeros
+	def normalize(self):
+		(v, e) = (self.v, self.e)
+		while e and not v % 10:
+			v //= 10
+			e -= 1
+		return _ticks(v, e)
+
+	def __reduce__(self):
+		return (Ticks, (str(self),))
+
+	def __str__(self):
+		(v, e) = (self.v, self.e)
+		if not e:
+			return str(v)
+		s = str(abs(v)).rjust(e + 1, '0')
+		return "%s%s.%s" % (v < 0 and '-' or '', s[:-e], s[-e:])
+
+	def __repr__(self):
+		return "Ticks('%s')" % self
+
+	def __format__(self, spec):
+		if not spec:
+			return str(self)
+		return format(float(self), spec)
+
+	def __float__(self):
+		if not self.e:
+			return float(self.v)
+		return self.v / float(_pow10(self.e))
+
+	def __int__(self):
+		q = abs(self.v) // _pow10(self.e)
+		return -q if self.v < 0 else q
+	__long__ = __int__
+	__trunc__ = __int__
+
+	def __nonzero__(self):
+		return self.v != 0
+
+	def __hash__(self):
+		t = self.normalize()
+		if not t.e:
+			return hash(t.v)
+		return hash(float(t))
+
+	def __neg__(self):
+		return _ticks(-self.v, self.e)
+
+	def __pos__(self):
+		return self
+
+	def __abs__(self):
+		if self.v < 0:
+			return _ticks(-self.v, self.e)
+		return self
+
+	#(a, b, e) the two values as ints over the same 10**e
+	def _align(self, o):
+		if self.e == o.e:
+			return (self.v, o.v, self.e)
+		if self.e > o.e:
+			return (self.v, o.v * _pow10(self.e - o.e), self.e)
+		return (self.v * _pow10(o.e - self.e), o.v, o.e)
+
+	def __add__(self, o):
+		o = _other(o)
+		if o is NotImplemented:
+			return o
+		(a, b, e) = self._align(o)
+		return _ticks(a + b, e)
+	__radd__ = __add__
+
+	def __sub__(self, o):
+		o = _other(o)
+		if o is NotImplemented:
+			return o
+		(a, b, e) = self._align(o)
+		return _ticks(a - b, e)
+
+	def __rsub__(self, o):
+		o = _other(o)
+		if o is NotImplemented:
+			return o
+		return o - self
+
+	def __mul__(self, o):
+		o = _other(o)
+		if o is NotImplemented:
+			return o
+		(v, e) = (self.v * o.v, self.e + o.e)
+		if e > Ticks.PLACES:
+			return _ticks(_div_even(v, _pow10(e - Ticks.PLACES)), Ticks.PLACES)
+		return _ticks(v, e)
+	__rmul__ = __mul__
+
+	def __div__(self, o):
+		o = _other(o)
+		if o is NotImplemented:
+			return o
+		if not o.v:
+			raise ZeroDivisionError("Ticks division by zero")
+		(n, d) = (self.v, o.v)
+		if d < 0:
+			(n, d) = (-n, -d)
+		k = Ticks.PLACES - self.e + o.e
+		if k >= 0:
+			v = _div_even(n * _pow10(k), d)
+		else:
+			v = _div_even(n, d * _pow10(-k))
+		return _ticks(v, Ticks.PLACES).normalize()
+	__truediv__ = __div__
+
+	def __rdiv__(self, o):
+		o = _other(o)
+		if o is NotImplemented:
+			return o
+		return o / self
+	__rtruediv__ = __rdiv__
+
+	#as Decimal, the quotient is truncated and the remainder takes the
+	#sign of the dividend
+	def __floordiv__(self, o):
+		o = _other(o)
+		if o is NotImplemented:
+			return o
+		(a, b, e) = self._align(o)
+		q = abs(a) // abs(b)
+		return _ticks(-q if (a < 0) != (b < 0) else q, 0)
+
+	def __mod__(self, o):
+		o = _other(o)
+		if o is NotImplemented:
+			return o
+		(a, b, e) = self._align(o)
+		r = abs(a) % abs(b)
+		return _ticks(-r if a < 0 else r, e)
+
+	def __rmod__(self, o):
+		o = _other(o)
+		if o is NotImplemented:
+			return o
+		return o % self
+
+	def __rfloordiv__(self, o):
+		o = _other(o)
+		if o is NotImplemented:
+			return o
+		return o // self
+
+	def __divmod__(self, o):
+		o = _other(o)
+		if o is NotImplemented:
+			return o
+		return (self // o, self % o)
+
+	def __rdivmod__(self, o):
+		o = _other(o)
+		if o is NotImplemented:
+			return o
+		return (o // self, o % self)
+
+	#whole powers are exact (to PLACES places, as *), others go through
+	#Decimal at 28 digits. there's no three argument pow
+	def __pow__(self, o, mod=None):
+		if mod is not None:
+			return NotImplemented
+		o = _other(o)
+		if o is NotImplemented:
+			return o
+		n = o.normalize()
+		if n.e:
+			t = Ticks(_WIDE.power(D(str(self)), D(str(o))))
+		elif n.v < 0:
+			return _ticks(1, 0) / (self ** -n.v)
+		else:
+			t = _ticks(self.v ** n.v, self.e * n.v)
+		if t.e > Ticks.PLACES:
+			return t.rescale(Ticks.PLACES)
+		return t
+
+	def __rpow__(self, o):
+		o = _other(o)
+		if o is NotImplemented:
+			return o
+		return o ** self
+
+	__eq__ = _compare(operator.eq)
+	__ne__ = _compare(operator.ne)
+	__lt__ = _compare(operator.lt)
+	__le__ = _compare(operator.le)
+	__gt__ = _compare(operator.gt)
+	__ge__ = _compare(operator.ge)
+
+#the other operand of an arithmetic op as Ticks
+def _other(o):
+	t = type(o)
+	if t is Ticks:
+		return o
+	if t is int or t is long or t is float or isinstance(o, decimal.Decimal):
+		return Ticks(o)
+	return NotImplemented
+
+###
+# helpers for parsing whole columns of dates at once with numpy
+###
+
+#view a column of date strings as a (rows, width) matrix of digit values
+def _char_matrix(col, width):
+	col = np.ascontiguousarray(col)
+	if col.itemsize < width:
+		raise InvalidBarException("date field shorter than %d chars" % width)
+	return col.view(np.uint8).reshape(len(col), col.itemsize).astype(np.int64) - 48
+
+#the number made from digit columns i to j
+def _digits(c, i, j):
+	d = c[:, i:j]
+	if ((d < 0) | (d > 9)).any():
+		raise InvalidBarException("non digit in date field")
+	v = d[:, 0]
+	for k in xrange(1, j - i):
+		v = v * 10 + d[:, k]
+	return v
+
+#days since the epoch for arrays of year, month and day
+def _epoch_days(y, m, d):
+	y = y - (m <= 2)
+	era = y // 400
+	yoe = y - era * 400
+	doy = (153 * ((m + 9) % 12) + 2) // 5 + d - 1
+	doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+	return era * 146097 + doe - 719468
+
+###
+# pickling for the slotted classes (Bar, Order, Position), which python 2
+# only does by itself from protocol 2, and shelve uses 0. the state is
+# every slot that's set, from the class and its bases
+###
+def _slot_state(self):
+	state = {}
+	for c in type(self).__mro__:
+		for k in c.__dict__.get('__slots__', ()):
+			if hasattr(self, k):
+				state[k] = getattr(self, k)
+	return state
+
+def _set_slots(self, state):
+	for (k, v) in state.iteritems():
+		setattr(self, k, v)
+
 ###
 # Basic bar object
 # 
 # pass a string containing the data representing the bar
 #
 # contains the basic data open/high/low/close date & time.
+# slotted, as a long run makes a lot of them. subclasses that add fields
+# should give their own __slots__
 ###
 class Bar(object):
 
+	__slots__ = ('date', 'symbol', 'op', 'hi', 'lo', 'cl')
+	__getstate__ = _slot_state
+	__setstate__ = _set_slots
+
+	#line layout used by load_bars, the number of fields and
+	#which hold the open, high, low and close. the date is always first
+	NCOLS = 6
+	PRICE_COLS = (2, 3, 4, 5)
+
+	@staticmethod
+	def bulk_dates(col):
+		"""parse a numpy column of dates to epoch seconds, as __init__ does one at a time"""
+
+		c = _char_matrix(col, 11)
+		days = _epoch_days(_digits(c, 0, 4), _digits(c, 4, 6), _digits(c, 6, 8))
+		return days * 86400 + _digits(c, 9, 11) * 3600
+
 	def __init__(self, sym, str):
 
 		#20010102-230000,EURUSD,0.9507,0.9509,0.9505,0.9506
@@ -35,11 +540,23 @@ class Bar(object):
 		#self.hi = float(hgh)
 		#self.lo = float(lw)
 		#self.cl = float(cls)
-		self.op = D(opn)
-		self.hi = D(hgh)
-		self.lo = D(lw)
-		self.cl = D(cls)
-
+		self.op = NUM.price(sym, opn)
+		self.hi = NUM.price(sym, hgh)
+		self.lo = NUM.price(sym, lw)
+		self.cl = NUM.price(sym, cls)
+
+	@classmethod
+	def from_values(cls, sym, date, op, hi, lo, cl):
+		"""build a bar from already parsed values rather than a line of text"""
+
+		b = cls.__new__(cls)
+		b.date = date
+		b.symbol = sym
+		b.op = op
+		b.hi = hi
+		b.lo = lo
+		b.cl = cl
+		return b
 
 	def __merge_bar(self, b):
 		"""aggregate the high, low and close of a new bar. The timestamp will remain the same, the close will be updated to the new bar"""
@@ -68,6 +585,15 @@ class Bar(object):
 
 class YahooBar(Bar):
 
+	__slots__ = ()
+	NCOLS = 7
+	PRICE_COLS = (1, 2, 3, 4)
+
+	@staticmethod
+	def bulk_dates(col):
+		c = _char_matrix(col, 10)
+		return _epoch_days(_digits(c, 0, 4), _digits(c, 5, 7), _digits(c, 8, 10)) * 86400
+
 	def __init__(self, sym, str):
 
 		#20010102-230000,EURUSD,0.9507,0.9509,0.9505,0.9506
@@ -78,10 +604,538 @@ class YahooBar(Bar):
 		#self.hi = float(hgh)
 		#self.lo = float(lw)
 		#self.cl = float(cls)
-		self.op = D(opn)
-		self.hi = D(hgh)
-		self.lo = D(lw)
-		self.cl = D(cls)
+		self.op = NUM.price(sym, opn)
+		self.hi = NUM.price(sym, hgh)
+		self.lo = NUM.price(sym, lw)
+		self.cl = NUM.price(sym, cls)
+
+###
+# columnar bar history
+#
+# keeps the date (as seconds since the epoch) and open/high/low/close of
+# a symbols bars in contiguous arrays rather than a list of Bar objects.
+# with numpy the columns are numpy arrays, and a trailing window such as
+# bars.cl[-200:] is a view, not a copy. without numpy they are
+# array.array's and slices are copies.
+#
+# indexing, slicing and iterating still give Bar objects (of bartype)
+# built from the columns, so strategies written against a list of bars
+# keep working, e.g. [x.cl for x in self.bars[sym][-200:]]
+#
+# prec is the number of decimal places prices are given back with, if
+# it is None they are given back as the shortest repr of the float
+#
+# with maxlen only the last maxlen bars are kept, in columns of twice
+# that. once they fill up the bars kept are moved back to the front,
+# so each bar is copied about once and the columns stay contiguous.
+# indexes and slices are over the bars kept (bars[-1] is still the last
+# one), total counts every bar appended. views such as bars.cl[-200:] 
+# are only good until the next append.
+###
+def _column(i):
+	def get(self):
+		return self._cols[i][self._start:self._n]
+	return property(get)
+
+class BarSeries(object):
+
+	FIELDS = ('date', 'op', 'hi', 'lo', 'cl')
+	TYPES = ('int64', 'float64', 'float64', 'float64', 'float64')
+	CODES = ('l', 'd', 'd', 'd', 'd')
+
+	def __init__(self, symbol=None, bartype=Bar, size=1024, prec=None, maxlen=None):
+		if maxlen is not None:
+			if maxlen < 1:
+				raise ValueError("BarSeries maxlen must be at least 1, got %r" % (maxlen,))
+			size = 2 * maxlen
+		self.symbol = symbol
+		self.bartype = bartype
+		self.prec = prec
+		self.maxlen = maxlen
+		self.total = 0
+		self._view = False
+		#the bars kept are rows _start to _n of the columns
+		self._start = 0
+		self._n = 0
+		if np is None:
+			self._cols = [array.array(c) for c in BarSeries.CODES]
+		else:
+			self._cols = [np.empty(size, dtype=t) for t in BarSeries.TYPES]
+
+	@classmethod
+	def _wrap(cls, symbol, bartype, cols, prec=None):
+		#a read only series over existing columns
+		s = cls.__new__(cls)
+		s.symbol = symbol
+		s.bartype = bartype
+		s.prec = prec
+		s.maxlen = None
+		s._view = True
+		s._start = 0
+		s._n = s.total = len(cols[0])
+		s._cols = cols
+		return s
+
+	date = _column(0)
+	op = _column(1)
+	hi = _column(2)
+	lo = _column(3)
+	cl = _column(4)
+	open = op
+	high = hi
+	low = lo
+	close = cl
+
+	def __len__(self):
+		return self._n - self._start
+
+	def __str__(self):
+		return "BarSeries: %s, %d bars" % (self.symbol, len(self))
+
+	def _grow(self, need=0):
+		size = max(2 * len(self._cols[0]), need, 1024)
+		for i, c in enumerate(self._cols):
+			a = np.empty(size, dtype=c.dtype)
+			a[:self._n] = c[:self._n]
+			self._cols[i] = a
+
+	#move the bars kept to the front of the columns
+	def _compact(self):
+		(a, b) = (self._start, self._n)
+		for c in self._cols:
+			if np is None:
+				del c[:a]
+			else:
+				c[:b - a] = c[a:b]
+		(self._start, self._n) = (0, b - a)
+
+	#after adding bars, drop what's past maxlen
+	def _trim(self):
+		if self.maxlen is not None and self._n - self._start > self.maxlen:
+			self._start = self._n - self.maxlen
+
+	def append(self, b):
+
+		if self._view:
+			raise InvalidStateException("cannot append to a BarSeries view")
+
+		vals = (dt2ts(b.date), float(b.op), float(b.hi), float(b.lo), float(b.cl))
+		if self.maxlen is not None and self._n == 2 * self.maxlen:
+			self._compact()
+		n = self._n
+		if np is None:
+			for c, v in zip(self._cols, vals):
+				c.append(v)
+		else:
+			if n == len(self._cols[0]):
+				self._grow()
+			for c, v in zip(self._cols, vals):
+				c[n] = v
+		self._n = n + 1
+		self.total += 1
+		self._trim()
+
+	def extend(self, cols):
+		"""append whole columns, a sequence of date, op, hi, lo, cl arrays"""
+
+		if self._view:
+			raise InvalidStateException("cannot append to a BarSeries view")
+
+		m = len(cols[0])
+		self.total += m
+		if self.maxlen is not None:
+			if m > self.maxlen:
+				cols = [c[m - self.maxlen:] for c in cols]
+				m = self.maxlen
+			if self._n + m > 2 * self.maxlen:
+				self._compact()
+		n = self._n
+		if np is None:
+			for c, v in zip(self._cols, cols):
+				c.extend(v)
+		else:
+			if n + m > len(self._cols[0]):
+				self._grow(n + m)
+			for c, v in zip(self._cols, cols):
+				c[n:n + m] = v
+		self._n = n + m
+		self._trim()
+
+	def row(self, i):
+		"""build the Bar for index i"""
+
+		n = self._n - self._start
+		if i < 0:
+			i += n
+		if i < 0 or i >= n:
+			raise IndexError("BarSeries index out of range")
+		i += self._start
+		(dt, op, hi, lo, cl) = [c[i] for c in self._cols]
+		sym = self.symbol
+		return self.bartype.from_values(sym, ts2dt(dt), self._price(op, sym),
+			self._price(hi, sym), self._price(lo, sym), self._price(cl, sym))
+
+	#parsed from text as a line's price would be, so the backend's per
+	#symbol precision applies
+	def _price(self, x, sym):
+		if self.prec is None:
+			return NUM.price(sym, repr(float(x)))
+		return NUM.price(sym, '%.*f' % (self.prec, x))
+
+	def __getitem__(self, i):
+
+		if isinstance(i, slice):
+			return BarSeries._wrap(self.symbol, self.bartype, 
+				[c[self._start:self._n][i] for c in self._cols], self.prec)
+		return self.row(i)
+
+	def __iter__(self):
+		return self._iter(self.symbol)
+
+	#the bars, symbol sym, built a block at a time: dates are converted
+	#in one go and each distinct price once per block, not per field
+	def _iter(self, sym, block=4096):
+		i = 0
+		while i < len(self):
+			for b in self._rows(sym, i, min(i + block, len(self))):
+				yield b
+			i += block
+
+	def _rows(self, sym, i, j):
+		cols = [c[self._start + i:self._start + j] for c in self._cols]
+		if np is None:
+			dates = [ts2dt(ts) for ts in cols[0]]
+			memo = {}
+			prices = []
+			for c in cols[1:]:
+				vals = []
+				for x in c:
+					p = memo.get(x)
+					if p is None:
+						p = memo[x] = self._price(x, sym)
+					vals.append(p)
+				prices.append(vals)
+		else:
+			dates = cols[0].astype('datetime64[s]').tolist()
+			(uniq, inv) = np.unique(np.concatenate(cols[1:]), return_inverse=True)
+			conv = [self._price(x, sym) for x in uniq.tolist()]
+			vals = [conv[k] for k in inv.tolist()]
+			m = j - i
+			prices = [vals[k * m:(k + 1) * m] for k in xrange(4)]
+		make = self.bartype.from_values
+		return [make(sym, d, op, hi, lo, cl) for (d, op, hi, lo, cl) in zip(dates, *prices)]
+
+###
+# reading inputs
+#
+# open_input opens a path, decompressing .gz, .bz2 and .xz files as 
+# they are read, so archives don't have to be unpacked to disk first.
+# iter_lines gives the lines of anything with read() (read in blocks of
+# block_size and split in one go, rather than a readline() per line), 
+# of anything with just readline(), or of any other iterable of lines, 
+# such as a generator. lines are stripped, blank ones and a header (a 
+# first line not starting with a digit) are left out. items that aren't
+# strings, e.g. Bars from a generator, are passed through as they are.
+###
+def open_input(path):
+
+	if path.endswith('.gz'):
+		return gzip.open(path, 'rb')
+	if path.endswith('.bz2'):
+		return bz2.BZ2File(path, 'r')
+	if path.endswith('.xz'):
+		if lzma is None:
+			raise ImportError("reading %s needs the lzma module (backports.lzma on python 2)" % path)
+		return lzma.open(path, 'rb')
+	return open(path, 'rb')
+
+#the stripped, non blank lines of each block, less a header
+def _blocks(f, block_size):
+	rest = ''
+	first = True
+	while rest is not None:
+		data = f.read(block_size)
+		if data:
+			lines = (rest + data).split('\n')
+			rest = lines.pop()
+		else:
+			(lines, rest) = ([rest], None)
+		lines = filter(None, [l.strip() for l in lines])
+		if first and lines:
+			first = False
+			if not lines[0][0].isdigit():
+				del lines[0]
+		yield lines
+
+def _items(lines):
+	first = True
+	for l in lines:
+		if isinstance(l, basestring):
+			l = l.strip()
+			if not l:
+				continue
+			if first and not l[0].isdigit():
+				first = False
+				continue
+		first = False
+		yield l
+
+def iter_lines(f, block_size=1<<20):
+
+	if hasattr(f, 'read'):
+		return itertools.chain.from_iterable(_blocks(f, block_size))
+	if hasattr(f, 'readline') and not hasattr(f, '__iter__'):
+		f = iter(f.readline, '')
+	return _items(f)
+
+###
+# bulk loader
+#
+# reads a whole file of bars in large chunks and parses each chunk in one
+# pass with numpy, rather than a bartype object per line. the bartype
+# describes the line layout (NCOLS, PRICE_COLS, bulk_dates). a bartype
+# whose __init__ is not from the class declaring the layout (e.g. a
+# subclass parsing some other format), or running without numpy, falls
+# back to parsing each line with the bartype itself.
+#
+# a leading header line (one not starting with a digit) is skipped.
+# pass the result to BackTest.add_input in place of a file.
+###
+def _parse_chunk(chunk, bartype):
+
+	chunk = chunk.replace('\r', '')
+	while '\n\n' in chunk:
+		chunk = chunk.replace('\n\n', '\n')
+	chunk = chunk.strip('\n')
+	if len(chunk) == 0:
+		return None
+
+	vals = chunk.replace('\n', ',').split(',')
+	if len(vals) % bartype.NCOLS != 0:
+		raise InvalidBarException("expected %d fields per line for %s" % (bartype.NCOLS, bartype.__name__))
+	a = np.array(vals).reshape(len(vals) // bartype.NCOLS, bartype.NCOLS)
+	cols = [bartype.bulk_dates(a[:, 0])]
+	prec = 0
+	for i in bartype.PRICE_COLS:
+		cols.append(a[:, i].astype(np.float64))
+		prec = max(prec, _col_places(a[:, i]))
+	return (cols, prec)
+
+#the most decimal places of any value in a column of numeric strings
+def _col_places(col):
+	col = np.ascontiguousarray(col)
+	if len(col) == 0:
+		return 0
+	c = col.view(np.uint8).reshape(len(col), col.itemsize)
+	after = np.cumsum(c == ord('.'), axis=1) > 0
+	return int((after & (c >= ord('0')) & (c <= ord('9'))).sum(axis=1).max())
+
+def _has_bulk(bartype):
+	if np is None:
+		return False
+	for c in inspect.getmro(bartype):
+		if '__init__' in vars(c):
+			return 'bulk_dates' in vars(c)
+	return False
+
+def load_bars(inf, sym, bartype=Bar, chunk_size=1<<24):
+
+	opened = isinstance(inf, basestring)
+	if opened:
+		inf = open_input(inf)
+	try:
+		return _load_bars(inf, sym, bartype, chunk_size)
+	finally:
+		if opened:
+			inf.close()
+
+def _load_bars(inf, sym, bartype, chunk_size):
+
+	series = BarSeries(sym, bartype)
+	bulk = _has_bulk(bartype)
+	rest = ''
+	header = None
+	while True:
+		data = inf.read(chunk_size)
+		eof = len(data) == 0
+		data = rest + data
+		rest = ''
+
+		#only know if there is a header once we have the whole first line
+		if header is None:
+			if not eof and data.find('\n') == -1:
+				rest = data
+				continue
+			header = len(data) > 0 and not data[0].isdigit()
+			if header:
+				idx = data.find('\n')
+				data = '' if idx == -1 else data[idx + 1:]
+
+		if eof:
+			chunk = data
+		else:
+			idx = data.rfind('\n')
+			if idx == -1:
+				rest = data
+				continue
+			chunk = data[:idx]
+			rest = data[idx + 1:]
+
+		if bulk:
+			got = _parse_chunk(chunk, bartype)
+			if got is not None:
+				#enough places for every price seen, so none are rounded
+				(cols, prec) = got
+				if series.prec is None or prec > series.prec:
+					series.prec = prec
+				series.extend(cols)
+		else:
+			for line in chunk.split('\n'):
+				line = line.strip()
+				if len(line):
+					#the same error as the bulk path gives
+					try:
+						b = bartype(sym, line)
+					except (ValueError, IndexError, decimal.DecimalException), e:
+						raise InvalidBarException("bad line %r: %s" % (line, e))
+					series.append(b)
+
+		if eof:
+			break
+	return series
+
+#series oldest first, as the run plays them. csvs straight from yahoo
+#are newest first, those are given back reversed
+def oldest_first(series):
+	if len(series) > 1 and series.date[0] > series.date[-1]:
+		cols = [c[::-1] for c in (series.date, series.op, series.hi, series.lo, series.cl)]
+		return BarSeries._wrap(series.symbol, series.bartype, cols, series.prec)
+	return series
+
+###
+# binary bar files
+#
+# a 64 byte header then each column of a BarSeries stored as a little
+# endian array, date (int64) then op/hi/lo/cl (float64). the header is
+#	magic 'MBAR', version, price precision (-1 for none), row count,
+#	symbol (32 bytes), bartype name (16 bytes)
+#
+# convert once with write_bars(path, load_bars(...)) or csv2bars.py, then
+# open_bars() maps the file rather than reading it. every process using
+# the same file shares the page cache and pays no parsing cost.
+# add_input also takes the path of a bar file directly.
+###
+BARFILE_EXT = '.mbar'
+BARFILE_MAGIC = 'MBAR'
+BARFILE_VERSION = 1
+BARFILE_HDR = struct.Struct('<4sHhQ32s16s')
+BARFILE_TYPES = ('<i8', '<f8', '<f8', '<f8', '<f8')
+
+def write_bars(path, series):
+
+	n = len(series)
+	prec = -1 if series.prec is None else series.prec
+	f = open(path, 'wb')
+	f.write(BARFILE_HDR.pack(BARFILE_MAGIC, BARFILE_VERSION, prec, n, 
+		series.symbol or '', series.bartype.__name__))
+	for name, t in zip(BarSeries.FIELDS, BARFILE_TYPES):
+		col = getattr(series, name)
+		if np is None:
+			col = array.array(col.typecode, col)
+			if sys.byteorder != 'little':
+				col.byteswap()
+			col.tofile(f)
+		else:
+			f.write(np.ascontiguousarray(col, dtype=t).tostring())
+	f.close()
+
+def open_bars(path, sym=None):
+
+	if np is None:
+		raise InvalidStateException("open_bars needs numpy")
+
+	f = open(path, 'rb')
+	hdr = f.read(BARFILE_HDR.size)
+	f.close()
+	if len(hdr) != BARFILE_HDR.size:
+		raise InvalidBarException("%s: not a bar file" % path)
+	(magic, ver, prec, n, fsym, tname) = BARFILE_HDR.unpack(hdr)
+	if magic != BARFILE_MAGIC or ver != BARFILE_VERSION:
+		raise InvalidBarException("%s: not a version %d bar file" % (path, BARFILE_VERSION))
+
+	if sym is None:
+		sym = fsym.rstrip('\0')
+	bartype = globals().get(tname.rstrip('\0'), Bar)
+	if not (inspect.isclass(bartype) and issubclass(bartype, Bar)):
+		bartype = Bar
+	cols = []
+	if n > 0:
+		mm = np.memmap(path, dtype=np.uint8, mode='r')
+		if len(mm) < BARFILE_HDR.size + 40 * n:
+			raise InvalidBarException("%s: truncated bar file" % path)
+		for i, t in enumerate(BARFILE_TYPES):
+			off = BARFILE_HDR.size + 8 * n * i
+			cols.append(mm[off:off + 8 * n].view(t))
+	else:
+		cols = [np.empty(0, dtype=t) for t in BARFILE_TYPES]
+	return BarSeries._wrap(sym, bartype, cols, None if prec < 0 else prec)
+
+###
+# read a newest first file (e.g. from yahoo) oldest line first
+#
+# readline() gives the data lines from the end of the file back to the
+# start, with blank lines dropped. blocks are read from the end of the
+# file so memory use is one block however large the file is, and nothing
+# is written to disk.
+#
+#	bt.add_input('SPY', ReverseFile('table.csv'), YahooBar)
+# 
+# the header line is kept in .header rather than returned, pass 
+# header=False if there isn't one
+###
+class ReverseFile(object):
+
+	def __init__(self, f, header=True, block_size=1<<20):
+
+		if isinstance(f, basestring):
+			f = open(f, 'rb')
+		self.f = f
+		self.block_size = block_size
+		f.seek(0)
+		self.header = f.readline() if header else None
+		self._start = f.tell()
+		f.seek(0, 2)
+		self._pos = f.tell()
+		#lines of the current block, and the start of its first line
+		#which may continue in the block before it
+		self._lines = []
+		self._part = ''
+
+	def _read_block(self):
+		n = min(self.block_size, self._pos - self._start)
+		self._pos -= n
+		self.f.seek(self._pos)
+		lines = (self.f.read(n) + self._part).split('\n')
+		self._part = lines[0]
+		self._lines = lines[1:]
+
+	def readline(self):
+
+		while True:
+			while len(self._lines) == 0:
+				if self._pos <= self._start:
+					if len(self._part) == 0:
+						return ''
+					self._lines = [self._part]
+					self._part = ''
+				else:
+					self._read_block()
+			line = self._lines.pop()
+			if len(line.strip()):
+				return line + '\n'
+
+	def __iter__(self):
+		return iter(self.readline, '')
 
 class Order(object):
 
@@ -104,12 +1158,22 @@ class Order(object):
 
 	id_iter = itertools.count(1)
 
+	__slots__ = ('id', '_book', '_clock', '_clock_base', '_nbars', 'symbol', 'type',
+		'_level', 'dir', '_size', '_cancels', 'cancel_parent', '_triggers',
+		'trigger_parent', 'link', '_state')
+	__getstate__ = _slot_state
+	__setstate__ = _set_slots
+
 	def __init__(self, symbol=None, dir=None, type=None, level=None, size=None, parent=None, link=None):
 		self.id = self.id_iter.next()
-		self.nbars = 0
+		#set by the OrderBook while the order is active
+		self._book = None
+		self._clock = None
+		self._nbars = 0
 		self.symbol = symbol
 		self.type = type
-		self.level = level
+		#not on a book yet, so there's nothing to relevel
+		self._level = None if level is None else NUM.num(level)
 		self.dir = dir
 		self.size = size 
 		self._cancels = []
@@ -118,17 +1182,31 @@ class Order(object):
 		self.trigger_parent = parent 
 		self.link = link
 		self._state = Order.UNSUB
-		self.nbars = 0
 
 	def __get_level(self):
 		return self._level
 	def __set_level(self, x):
-		if not x is None and not isinstance(x, decimal.Decimal):
-			self._level = D(str(x))
-		else:
-			self._level = x 
+		if not x is None:
+			x = NUM.num(x)
+		old = getattr(self, '_level', None)
+		self._level = x 
+		#moving an active order, e.g. a trailing stop
+		if self._book is not None:
+			self._book._relevel(self, old)
 	level = property(__get_level, __set_level)
 
+	#bars spent active, while active it runs off the order book's bar
+	#count for the symbol rather than being bumped every bar
+	def __get_nbars(self):
+		if self._clock is None:
+			return self._nbars
+		return self._nbars + self._clock[0] - self._clock_base
+	def __set_nbars(self, x):
+		self._nbars = x
+		if self._clock is not None:
+			self._clock_base = self._clock[0]
+	nbars = property(__get_nbars, __set_nbars)
+
 	def __eq__(self, other):
 
 		if self.id == other.id:
@@ -282,9 +1360,14 @@ class Order(object):
 #the orderbook
 class OrderBook(object):
 	
-	def __init__(self, debug=False):
+	###
+	# pass an Archive to have filled and cancelled orders written to it
+	# rather than kept in _done, only their counts are kept
+	###
+	def __init__(self, debug=False, archive=None):
 		#self.symbol = 'OrderBook'
 		self.debug = debug
+		self.archive = archive
 		#though about a list indexed by id here but either we would
 		#have a bunch of empty slots that we have to manage ourselves
 		#if orders are assigned id's but not submitted
@@ -292,29 +1375,106 @@ class OrderBook(object):
 		#repsenstation of order.id 
 		self._orders = {} 
 		self._done = {}
+		#indexes of orders by state, and of the active orders by symbol
+		#kept up to date as orders change state rather than searching
+		#_orders/_done. each keeps the order things entered that state
+		self._states = dict((s, collections.OrderedDict()) for s in Order.StateList)
+		self._sym_active = {}
+		#per symbol the active market orders, and a sorted list of
+		#(level, seq, id) for the rest. seq is when the order became
+		#active, fills are returned in that order
+		self._sym_market = {}
+		self._sym_levels = {}
+		self._seqs = {}
+		self._seq_iter = itertools.count()
+		#get_fills calls so far, for Order.nbars
+		self._clock = [0]
+		self._ndone = {Order.FILLED: 0, Order.CANCELLED: 0}
 
 	def __str__(self):
 		s = "OrderBook: Active=%d, Filled=%d, Cancelled=%d" % (
-			len(self.active), len(self.filled), 
-			len(self.cancelled))
+			len(self._states[Order.ACTIVE]), self._ndone[Order.FILLED], 
+			self._ndone[Order.CANCELLED])
 		return(s)
 
 	def __active_ids(self):
-		return [oid for oid in self._orders if self._orders[oid].state == Order.ACTIVE]
+		return self._states[Order.ACTIVE].keys()
 	active = property(__active_ids)
 
 	def __pending_ids(self):
-		return [oid for oid in self._orders if self._orders[oid].state == Order.PENDING]
+		return self._states[Order.PENDING].keys()
 	pending = property(__pending_ids)
 
 	def __cancelled_ids(self):
-		return [oid for oid in self._done if self._done[oid].state == Order.CANCELLED]
+		return self._states[Order.CANCELLED].keys()
 	cancelled = property(__cancelled_ids)
 
 	def __filled_ids(self):
-		return [oid for oid in self._done if self._done[oid].state == Order.FILLED]
+		return self._states[Order.FILLED].keys()
 	filled = property(__filled_ids)
 
+	# the active orders for a symbol, oldest first
+	def sym_active(self, sym):
+		return self._sym_active.get(sym, {}).values()
+
+	###
+	# move an order to a new state, updating the indexes
+	###
+	def _set_state(self, o, state):
+
+		old = self._states[o.state]
+		if o.id in old:
+			del old[o.id]
+			if o.state == Order.ACTIVE:
+				self._deactivate(o)
+		o.state = state
+		if state == Order.ACTIVE:
+			self._activate(o)
+		if state in self._ndone:
+			self._ndone[state] += 1
+			if self.archive is not None:
+				self.archive.write_order(o)
+				return
+			self._done[o.id] = o
+		self._states[state][o.id] = o
+
+	def _activate(self, o):
+
+		seq = self._seqs[o.id] = self._seq_iter.next()
+		self._sym_active.setdefault(o.symbol, collections.OrderedDict())[o.id] = o
+		self._index(o, o.level, seq)
+		o._clock = self._clock
+		o._clock_base = o._clock[0]
+		o._book = self
+
+	def _deactivate(self, o):
+
+		del self._sym_active[o.symbol][o.id]
+		self._unindex(o, o.level, self._seqs.pop(o.id))
+		o._nbars = o.nbars
+		o._clock = None
+		o._book = None
+
+	def _index(self, o, level, seq):
+		if o.type == Order.MARKET:
+			self._sym_market.setdefault(o.symbol, collections.OrderedDict())[o.id] = o
+		elif level is not None: #no level, never fills
+			bisect.insort(self._sym_levels.setdefault(o.symbol, []), (level, seq, o.id))
+
+	def _unindex(self, o, level, seq):
+		if o.type == Order.MARKET:
+			del self._sym_market[o.symbol][o.id]
+		elif level is not None:
+			levels = self._sym_levels[o.symbol]
+			i = bisect.bisect_left(levels, (level, seq, o.id))
+			del levels[i]
+
+	#an active order's level was changed from old
+	def _relevel(self, o, old):
+		seq = self._seqs[o.id]
+		self._unindex(o, old, seq)
+		self._index(o, o.level, seq)
+
 	###
 	# add an order to the queue
 	#
@@ -335,13 +1495,13 @@ class OrderBook(object):
 
 	def _add_single(self, order):
 
-		if not order.triggered():
-			order.state = Order.ACTIVE
-		else: # will only become active if its parent fills 
-			order.state = Order.PENDING
-
 		if self._orders.has_key(order.id):
 			raise InvalidOrderException('duplicate order id: %d' % order.id)
+
+		if not order.triggered():
+			self._set_state(order, Order.ACTIVE)
+		else: # will only become active if its parent fills 
+			self._set_state(order, Order.PENDING)
 		
 		#need to sanity check orders, e.g. if a buy stop < cur_price
 		#it would be triggered immediately
@@ -379,8 +1539,7 @@ class OrderBook(object):
 			return False
 		
 		o = self._orders[order_id]
-		o.state = Order.CANCELLED
-		self._done[o.id] = o
+		self._set_state(o, Order.CANCELLED)
 		del self._orders[o.id]
 		if self.debug:
 			print "OrderBook: Cancelled order id %d" % (o.id)
@@ -404,11 +1563,10 @@ class OrderBook(object):
 		if self.debug:
 			print "OrderBook: book fill order id %d" % (order.id)
 		o = self._orders[order.id]
-		o.state = Order.FILLED
-		self._done[o.id] = o
+		self._set_state(o, Order.FILLED)
 		del self._orders[o.id]
 		for t in o.triggers:
-			self._orders[t].state = Order.ACTIVE
+			self._set_state(self._orders[t], Order.ACTIVE)
 			if self.debug:
 				print "OrderBook: Pending -> Active %s" % (self._orders[t])
 		for c in o.cancels:
@@ -422,93 +1580,138 @@ class OrderBook(object):
 
 	###
 	# all this will do is return what orders have been hit
+	#
+	# only the active orders for the bar's symbol are looked at. every
+	# active order's nbars counts the call, whatever the symbol, by one
+	# clock for the book rather than touching each order
+	#
+	# limit/stop levels are kept sorted per symbol, so the orders with
+	# levels in [bar.lo, bar.hi] are a range of that list. fills are 
+	# returned in the order they became active, as they would be from
+	# walking sym_active()
 	### 
 
 	def get_fills(self, bar):
 
+		sym = bar.symbol
+		self._clock[0] += 1
+
+		#market orders always fill
+		#fill them at the close or open ...?
+		#o.level = bar.cl
+		#o.level = bar.op
+		#or u can enter what ever fill u want by setting 
+		#the level when order placed (i.e. set it to the close)
+		#this seems decidely error prone
+		hits = [(self._seqs[oid], o) for (oid, o) in self._sym_market.get(sym, {}).iteritems()]
+
+		levels = self._sym_levels.get(sym)
+		if levels:
+			i = bisect.bisect_left(levels, (bar.lo,))
+			j = bisect.bisect_right(levels, (bar.hi, _INF))
+			if i < j:
+				active = self._sym_active[sym]
+				hits.extend([(seq, active[oid]) for (level, seq, oid) in levels[i:j]])
+		
+		hits.sort()
+		return [o for (seq, o) in hits]
+
+	def _get_fills_scan(self, bar):
+
+		#the plain walk over the active orders that get_fills replaces,
+		#kept as the reference for what it should return
 		fills = []
-		#whats in the active list
-		for oid in self.active: 
-			o = self._orders[oid]
-			o.nbars += 1
-			#make sure the order symbol matches the sym of this bar
-			if o.symbol != bar.symbol:
-				continue
+		for o in self.sym_active(bar.symbol): 
 			if o.type == Order.MARKET:
-				#fill them at the close or open ...?
-				#o.level = bar.cl
-				#o.level = bar.op
-				#or u can enter what ever fill u want by setting 
-				#the level when order placed (i.e. set it to the close)
-				#this seems decidely error prone
 				fills.append(o)
 			elif o.level >= bar.lo and o.level <= bar.hi: #welp
 				fills.append(o)
-			#elif o.dir == Order.STOP:
-			#	if o.dir == Order.BUY and (o.level >= b.lo and o.level <= b.hi):
-			#		fills.append(o)	
-			#	elif o.dir == Order.SELL and (o.level >= b.lo and o.level <= b.hi):
-			#		fills.append(o)
-			#elif o.dir == Order.LIMIT:
-			#	if o.dir == Order.BUY and (o.level >= b.lo and o.level <= b.hi):
-			#		fills.append(o)
-			#	elif o.dir == Order.SELL and (o.level >= b.lo and o.level <= b.hi)
 		return fills 
 		
 class Position(object):
 
+	__slots__ = ('_cell', 'symbol', 'dt', '_entry', '_size', '_nbars', '_nb_base',
+		'_mark', '_mark_clock', '_exit', 'order_id')
+	__getstate__ = _slot_state
+	__setstate__ = _set_slots
+
 	#xxx should probably raise an exception with no entry price as value depends on it
 	# and positionlist depends on value
 	def __init__(self, symbol=None, dt=None, entry=None, size=None, order_id=None, exit=None):
+		#the PositionList's running value for the symbol, while open
+		self._cell = None
 		self.symbol = symbol
 		self.dt = dt #entry date/time
-		self.entry = entry
-		self.size = size 
+		#not in a PositionList yet, so the fields are set directly
+		if entry is not None:
+			entry = NUM.num(entry)
+		self._entry = entry
+		self._size = None if size is None else NUM.num(size)
 		#how long open
-		self.nbars = 0
+		self._nbars = 0
 		#cur price
-		self.mark = entry 
+		self._mark = entry 
 		#exit price
-		self.exit = exit 
+		self._exit = None if exit is None else NUM.num(exit)
 		self.order_id = order_id 
 
 	def __get_value(self):
-		return (self.mark - self.entry) * self.size
+		cell = self._cell
+		if cell is not None and cell.clock != self._mark_clock:
+			return (cell.mark - self._entry) * self._size
+		return (self._mark - self._entry) * self._size
 
 	value = property(__get_value)
 
-	def __set_entry(self, x):
-		if not x is None and not isinstance(x, decimal.Decimal):
-			self._entry = D(str(x))
+	#entry, mark and size feed the PositionList's running value, so
+	#changing them on an open position goes through its _OpenSym
+	def _set(self, name, x):
+		if not x is None:
+			x = NUM.num(x)
+		cell = self._cell
+		if cell is None:
+			setattr(self, name, x)
 		else:
-			self._entry = x
+			cell.touch(self)
+			setattr(self, name, x)
+			cell.settle(self)
+
+	def __set_entry(self, x):
+		self._set('_entry', x)
 	def __get_entry(self):
 		return self._entry
 	entry = property(__get_entry, __set_entry)
 
+	#once PositionList.mark() has marked the symbol, an open position's
+	#mark and nbars come from there
 	def __set_mark(self, x):
-		if not x is None and not isinstance(x, decimal.Decimal):
-			self._mark = D(str(x))
-		else:
-			self._mark = x
+		self._set('_mark', x)
 	def __get_mark(self):
+		if self._cell is not None and self._cell.clock != self._mark_clock:
+			return self._cell.mark
 		return self._mark
 	mark = property(__get_mark, __set_mark)
+
+	def __set_nbars(self, x):
+		self._nbars = x
+		if self._cell is not None:
+			self._nb_base = self._cell.clock
+	def __get_nbars(self):
+		if self._cell is None:
+			return self._nbars
+		return self._nbars + self._cell.clock - self._nb_base
+	nbars = property(__get_nbars, __set_nbars)
 	
 	def __set_size(self, x):
-		if not x is None and not isinstance(x, decimal.Decimal):
-			self._size = D(str(x))
-		else:
-			self._size = x
+		self._set('_size', x)
 	def __get_size(self):
 		return self._size
 	size = property(__get_size, __set_size)
 
 	def __set_exit(self, x):
-		if not x is None and not isinstance(x, decimal.Decimal):
-			self._exit = D(str(x))
-		else:
-			self._exit = x
+		if not x is None:
+			x = NUM.num(x)
+		self._exit = x
 	def __get_exit(self):
 		return self._exit
 	exit = property(__get_exit, __set_exit)
@@ -524,16 +1727,121 @@ class Position(object):
 			s = "%s,%s,%s,%d,%.2f" % (self.symbol, str(self.entry), str(self.exit), self.nbars, self.value)
 		return(s)
 
+###
+# the open positions of one symbol, for PositionList's running value
+#
+# positions marked by mark_all() since they were opened (or since their
+# mark/entry/size were last set by hand) are summed, and are worth
+# mark * size - cost between them. the rest are pending and valued one
+# by one until the next mark_all(). while a position is open its mark
+# and nbars read through to here, so marking a symbol doesn't touch each
+# position. sums are done in the backend's wide context so they stay
+# exact.
+###
+
+class _OpenSym(object):
+
+	def __init__(self, owner):
+		self.owner = owner
+		self.mark = None
+		self.clock = 0
+		self.size = 0
+		self.cost = 0
+		self.pending = collections.OrderedDict()
+		self.pvalue = 0
+		self.value = 0
+		#positions open in it
+		self.n = 0
+
+	#called in the wide context
+	def _update(self):
+		v = self.pvalue
+		if self.mark is not None:
+			v += self.mark * self.size - self.cost
+		self.owner._value += v - self.value
+		self.value = v
+
+	def add(self, p):
+		p._cell = self
+		p._mark_clock = p._nb_base = self.clock
+		self.n += 1
+		self.pending[id(p)] = p
+		self.settle(p)
+
+	#p's mark/entry/size are about to change, take it out of the totals
+	def touch(self, p):
+		with NUM.wide():
+			if id(p) in self.pending:
+				self.pvalue -= (p._mark - p._entry) * p._size
+				return
+			self.size -= p._size
+			self.cost -= p._entry * p._size
+		p._mark = self.mark
+		p._mark_clock = self.clock
+		self.pending[id(p)] = p
+
+	#and put it back once they have
+	def settle(self, p):
+		with NUM.wide():
+			self.pvalue += (p._mark - p._entry) * p._size
+			self._update()
+
+	def remove(self, p):
+		self.touch(p)
+		del self.pending[id(p)]
+		p._nbars = p.nbars
+		p._cell = None
+		self.n -= 1
+		with NUM.wide():
+			if self.n:
+				self._update()
+				return
+			#the last one, start the totals over so what's left of
+			#rounding (with floats) doesn't carry on, and sum the
+			#owner's total again from the cells
+			self.size = self.cost = self.pvalue = self.value = 0
+			self.owner._value = sum(c.value for c in self.owner._cells.itervalues())
+
+	def mark_all(self, level):
+		with NUM.wide():
+			for p in self.pending.itervalues():
+				self.size += p._size
+				self.cost += p._entry * p._size
+			self.pending.clear()
+			self.pvalue = 0
+			self.mark = level
+			self.clock += 1
+			self._update()
+
 class PositionList(object):
 
 	#position closed callback
 	def cb_noop(self, p):
 		pass
 
-	def __init__(self, close_cb=None, open_cb=None):
-		self.open = []
+	###
+	# pass an Archive to have closed and rewound positions written to it
+	# rather than kept in closed/rewinded. stats has the running totals
+	# either way
+	#
+	# open positions are kept in a dict in the order they were opened, 
+	# with indexes by symbol and by order id, so looking one up doesn't
+	# mean searching them all. open gives them back as a list.
+	#
+	# the value of the open positions is kept up to date per symbol as
+	# positions are opened, closed, rewound and marked (see _OpenSym), so
+	# value() doesn't depend on how many positions are open
+	###
+	def __init__(self, close_cb=None, open_cb=None, archive=None):
+		self._open = collections.OrderedDict()
+		self._sym = {}
+		self._by_order = {}
+		self._cells = {}
+		self._value = 0
 		self.closed = []
 		self.rewinded = []
+		self.archive = archive
+		self.stats = PosStats()
 		if close_cb is None:
 			self.close_cb = self.cb_noop
 		else:
@@ -544,33 +1852,53 @@ class PositionList(object):
 		else:
 			self.open_cb = open_cb
 
+	def __get_open(self):
+		return self._open.values()
+	open = property(__get_open)
+
+	def _insert(self, p):
+		k = id(p)
+		self._open[k] = p
+		self._sym.setdefault(p.symbol, collections.OrderedDict())[k] = p
+		self._by_order.setdefault(p.order_id, []).append(p)
+		cell = self._cells.get(p.symbol)
+		if cell is None:
+			cell = self._cells[p.symbol] = _OpenSym(self)
+		cell.add(p)
+
+	def _remove(self, p):
+		k = id(p)
+		if k not in self._open:
+			raise ValueError("position is not open: %s" % p)
+		del self._open[k]
+		del self._sym[p.symbol][k]
+		ps = self._by_order[p.order_id]
+		ps.remove(p)
+		if len(ps) == 0:
+			del self._by_order[p.order_id]
+		self._cells[p.symbol].remove(p)
+
 	def mark(self, bar):
 
-		for p in self.open:
-			if p.symbol != bar.symbol:
-				continue
-			p.mark = bar.cl
-			p.nbars += 1
+		cell = self._cells.get(bar.symbol)
+		if cell is not None:
+			cell.mark_all(bar.cl)
 
 	def __find_pos(self, order_id):
-		for p in self.open:
-			if p.order_id == order_id:
-				return(p)
-
-		#for p in self.rewinded:
-		#	if p.order_id == order_id:
-		#		return(p)
+		ps = self._by_order.get(order_id)
+		if ps:
+			return ps[0]
 		return None
 
 	def rewind(self, order_id):
 
-		for p in self.open[:]:
-			if p.order_id == order_id:
-				self.open.remove(p)
-				self.rewinded.append(p)
-				#print 'PositionList rewinded %s' % p.order_id
-				return p
-		return None
+		p = self.__find_pos(order_id)
+		if p is None:
+			return None
+		self._remove(p)
+		self._retire(p, Archive.REWOUND)
+		#print 'PositionList rewinded %s' % p.order_id
+		return p
 				
 	#take an order and make it a position
 	#i.e. an order from the orderbook has been filled
@@ -629,8 +1957,8 @@ class PositionList(object):
 			p.mark = final_level
 			p.exit = final_level	
 			#take it off the open
-			self.open.remove(p)
-			self.closed.append(p)
+			self._remove(p)
+			self._retire(p, Archive.CLOSED)
 			#call the position closed call back
 			self.close_cb(p)
 
@@ -644,7 +1972,7 @@ class PositionList(object):
 			else:
 				entry_level = order.level
 			p = Position(symbol=order.symbol, dt=dt, entry=entry_level, size=order.size, order_id=order.id)
-			self.open.append(p)
+			self._insert(p)
 			self.open_cb(p)
 			#print "added pos for order id %d" % order.id
 			#print [x.order_id for x in self.open]
@@ -652,7 +1980,7 @@ class PositionList(object):
 			
 	def close_all(self, mark_level=None):
 	
-		for p in self.open[:]:
+		for p in self._open.values():
 			self.close(p, mark_level)
 
 	def close(self, p, mark_level=None):
@@ -664,73 +1992,643 @@ class PositionList(object):
 			m = mark_level
 
 		p.exit = m
-		self.open.remove(p)
-		self.closed.append(p)
+		self._remove(p)
+		self._retire(p, Archive.CLOSED)
 		self.close_cb(p)
 
+	#a position is closed or rewound, keep it or archive it
+	def _retire(self, p, kind):
+
+		if kind == Archive.CLOSED:
+			self.stats.add(p)
+			lst = self.closed
+		else:
+			self.stats.nrewound += 1
+			lst = self.rewinded
+		if self.archive is None:
+			lst.append(p)
+		else:
+			self.archive.write_position(p, kind)
+
 	def net_size(self):
 		sum = 0
-		for p in self.open:
+		for p in self._open.itervalues():
 			sum += p.size
 		return sum
 
 	def value(self):
+		return +self._value
+
+	def _value_scan(self):
+
+		#the sum over every open position value() replaces
 		val = 0
-		for p in self.open:
+		for p in self._open.itervalues():
 			val += p.value
 		return val	
 
 	def sym_open(self, sym):
-		return [p for p in self.open if p.symbol == sym]
+		return self._sym.get(sym, {}).values()
 		
+###
+# running win/loss totals of closed positions, what print_summary needs
+# without going back over every closed position
+###
+class PosStats(object):
+
+	def __init__(self, positions=()):
+		self.nwin = 0
+		self.nlos = 0
+		self.nbe = 0
+		self.totwin = 0
+		self.totlos = 0
+		self.nrewound = 0
+		for p in positions:
+			self.add(p)
+
+	def add(self, p):
+		v = p.value
+		if v == 0:
+			self.nbe += 1
+		elif v > 0:
+			self.nwin += 1
+			self.totwin += v
+		else:
+			self.nlos += 1
+			self.totlos += v
+
+	def __get_nclosed(self):
+		return self.nwin + self.nlos + self.nbe
+	nclosed = property(__get_nclosed)
+
+	def __str__(self):
+		return "PosStats: %d won %d los %d be, won %.2f lost %.2f, %d rewound" % (
+			self.nwin, self.nlos, self.nbe, self.totwin, self.totlos, self.nrewound)
+
+###
+# append only log of finished orders and positions
+#
+# used by OrderBook and PositionList (see BackTest(archive=...)) so a long
+# run doesn't hold every filled/cancelled order and closed position. 
+# each record is a kind byte and symbol length, the symbol, then a fixed
+# size struct. prices are stored as doubles and None as nan.
+#
+# iterating an Archive (or Archive.read(path)) gives back ArchivedOrder
+# and ArchivedPosition tuples, e.g. PosStats(Archive.read(path).positions())
+# for the print_summary totals of a finished run
+###
+ArchivedOrder = collections.namedtuple('ArchivedOrder', 
+	'id symbol state type dir level size nbars trigger_parent cancel_parent link')
+
+class ArchivedPosition(collections.namedtuple('ArchivedPosition', 
+	'kind symbol order_id dt entry exit mark size nbars')):
+
+	__slots__ = ()
+
+	def __get_value(self):
+		return (self.mark - self.entry) * self.size
+	value = property(__get_value)
+
+	def __get_closed(self):
+		return self.kind == Archive.CLOSED
+	closed = property(__get_closed)
+
+class Archive(object):
+
+	ORDER = 'O'
+	CLOSED = 'C'
+	REWOUND = 'R'
+
+	_HDR = struct.Struct('<cB')
+	_ORDER = struct.Struct('<qbbbddiqqq')
+	_POS = struct.Struct('<qqddddi')
+	_NODATE = -(1 << 63)
+
+	def __init__(self, path, mode='ab'):
+		self.path = path
+		self.f = open(path, mode) if mode else None
+
+	#an archive to read back, e.g. from a previous run
+	@classmethod
+	def read(cls, path):
+		return cls(path, None)
+
+	def _write(self, kind, sym, body):
+		sym = sym or ''
+		self.f.write(Archive._HDR.pack(kind, len(sym)) + sym + body)
+
+	def write_order(self, o):
+		self._write(Archive.ORDER, o.symbol, Archive._ORDER.pack(o.id, o.state, 
+			o.type or 0, o.dir or 0, _f(o.level), _f(o.size), o.nbars, 
+			o.trigger_parent or 0, o.cancel_parent or 0, o.link or 0))
+
+	def write_position(self, p, kind):
+		dt = Archive._NODATE if p.dt is None else dt2ts(p.dt)
+		self._write(kind, p.symbol, Archive._POS.pack(p.order_id or 0, dt, 
+			_f(p.entry), _f(p.exit), _f(p.mark), _f(p.size), p.nbars))
+
+	def flush(self):
+		if self.f is not None:
+			self.f.flush()
+
+	#it can still be read after
+	def close(self):
+		if self.f is not None:
+			self.f.close()
+			self.f = None
+
+	def __iter__(self):
+
+		if self.f is not None:
+			self.f.flush()
+		f = open(self.path, 'rb')
+		hs = Archive._HDR.size
+		while True:
+			hdr = f.read(hs)
+			if len(hdr) < hs:
+				break
+			(kind, n) = Archive._HDR.unpack(hdr)
+			sym = f.read(n) or None
+			if kind == Archive.ORDER:
+				v = Archive._ORDER.unpack(f.read(Archive._ORDER.size))
+				yield ArchivedOrder(v[0], sym, v[1], v[2] or None, v[3] or None, 
+					_d(v[4]), _d(v[5]), v[6], v[7] or None, v[8] or None, v[9] or None)
+			else:
+				v = Archive._POS.unpack(f.read(Archive._POS.size))
+				dt = None if v[1] == Archive._NODATE else ts2dt(v[1])
+				yield ArchivedPosition(kind, sym, v[0] or None, dt, _d(v[2]), 
+					_d(v[3]), _d(v[4]), _d(v[5]), v[6])
+		f.close()
+
+	def orders(self):
+		return (r for r in self if isinstance(r, ArchivedOrder))
+
+	def positions(self, kind=CLOSED):
+		return (r for r in self if isinstance(r, ArchivedPosition) and r.kind == kind)
+
+#number <-> double for the archive, None as nan
+def _f(x):
+	return _NAN if x is None else float(x)
+
+def _d(x):
+	return None if x != x else NUM.num(repr(x))
+
+###
+# equity curve
+#
+# keeps (date, equity) as epoch seconds and doubles in growable arrays
+# rather than a list of tuples, iterating gives back (datetime, Decimal)
+# tuples as eqvals used to hold. sample picks what is kept
+#	EquityCurve.EVERY_BAR (the default), every value recorded
+#	EquityCurve.EOD, the last value of each day
+#	an int N, every Nth value
+# the last value recorded is always kept once finish() is called.
+#
+# sink is an optional path or file that kept values are written to as
+# the run goes, csv lines of date,equity or with binary=True '<qd' 
+# records. flushed every flush_every values and at finish(). with 
+# keep=False nothing is held in memory, the sink gets everything.
+###
+class EquityCurve(object):
+
+	EVERY_BAR = 1
+	EOD = 'eod'
+	RECORD = struct.Struct('<qd')
+
+	def __init__(self, sample=EVERY_BAR, sink=None, binary=False, keep=True, flush_every=4096):
+		self.sample = sample
+		self.binary = binary
+		self.keep = keep
+		self.flush_every = flush_every
+		if isinstance(sink, basestring):
+			sink = open(sink, 'wb')
+		self.sink = sink
+		self._buf = []
+		self._count = 0
+		#last value recorded if it wasn't kept
+		self._pending = None
+		self._n = 0
+		if np is None:
+			self._cols = [array.array('l'), array.array('d')]
+		else:
+			self._cols = [np.empty(1024, dtype='int64'), np.empty(1024, dtype='float64')]
+
+	#the values kept always start at row 0, for _column
+	_start = 0
+	date = _column(0)
+	value = _column(1)
+
+	#a curve over existing arrays of dates (epoch seconds) and values
+	@classmethod
+	def from_arrays(cls, dates, values, **kw):
+		eq = cls(**kw)
+		if np is None:
+			eq._cols = [array.array('l', dates), array.array('d', values)]
+		else:
+			eq._cols = [np.array(dates, dtype='int64'), np.array(values, dtype='float64')]
+		eq._n = len(eq._cols[0])
+		return eq
+
+	def __len__(self):
+		return self._n
+
+	def __str__(self):
+		return "EquityCurve: %d values" % (self._n)
+
+	def record(self, dt, v):
+
+		self._count += 1
+		if self.sample == EquityCurve.EOD:
+			if self._pending is not None and self._pending[0].date() != dt.date():
+				self._keep(*self._pending)
+			self._pending = (dt, v)
+		elif (self._count - 1) % self.sample == 0:
+			self._keep(dt, v)
+			self._pending = None
+		else:
+			self._pending = (dt, v)
+
+	#compatible with the list eqvals used to be
+	def append(self, x):
+		self.record(*x)
+
+	def _keep(self, dt, v):
+
+		ts = dt2ts(dt)
+		v = float(v)
+		if self.keep:
+			n = self._n
+			if np is None:
+				self._cols[0].append(ts)
+				self._cols[1].append(v)
+			else:
+				if n == len(self._cols[0]):
+					for i, c in enumerate(self._cols):
+						a = np.empty(2 * n, dtype=c.dtype)
+						a[:n] = c
+						self._cols[i] = a
+				self._cols[0][n] = ts
+				self._cols[1][n] = v
+			self._n = n + 1
+
+		if self.sink is not None:
+			if self.binary:
+				self._buf.append(EquityCurve.RECORD.pack(ts, v))
+			else:
+				self._buf.append("%s,%r\n" % (dt, v))
+			if len(self._buf) >= self.flush_every:
+				self.flush()
+
+	def flush(self):
+		if self.sink is not None and len(self._buf):
+			self.sink.write(''.join(self._buf))
+			self._buf = []
+			self.sink.flush()
+
+	#end of the run, keep the last value and flush the sink
+	def finish(self):
+		if self._pending is not None:
+			self._keep(*self._pending)
+			self._pending = None
+		self.flush()
+
+	def _row(self, i):
+		return (ts2dt(self._cols[0][i]), _f2d(self._cols[1][i]))
+
+	def __getitem__(self, i):
+		if isinstance(i, slice):
+			return [self._row(j) for j in xrange(*i.indices(self._n))]
+		if i < 0:
+			i += self._n
+		if i < 0 or i >= self._n:
+			raise IndexError("EquityCurve index out of range")
+		return self._row(i)
+
+	def __iter__(self):
+		for i in xrange(self._n):
+			yield self._row(i)
+
+	#read back a binary sink
+	@staticmethod
+	def read(path):
+		f = open(path, 'rb')
+		rs = EquityCurve.RECORD.size
+		while True:
+			r = f.read(rs)
+			if len(r) < rs:
+				break
+			(ts, v) = EquityCurve.RECORD.unpack(r)
+			yield (ts2dt(ts), _f2d(v))
+		f.close()
+
+#a double back to the decimal it was made from
+def _f2d(x):
+	s = repr(float(x))
+	if s.endswith('.0'):
+		s = s[:-2]
+	return NUM.num(s)
+
+###
+# the worker side of BackTest.run_by_symbol, runs symbol i of the 
+# forked BackTest and sends back what the merge needs
+###
+_by_sym = None
+
+def _run_sym(i):
+
+	(bt, syms, first_id) = _by_sym
+	sym = syms[i]
+	Order.id_iter = itertools.count(first_id + i * BackTest.ORDER_ID_BLOCK)
+	bt.inputs = [x for x in bt.inputs if x[0] == sym]
+
+	now = [None]
+	retired = []
+	points = []
+	next_bar = bt.next_bar
+	def track_bar(sym, b):
+		now[0] = b.date
+		next_bar(sym, b)
+	retire = bt.poslist._retire
+	def track_retire(p, kind):
+		retired.append((now[0], kind, p))
+		retire(p, kind)
+	def track_eqvals(b):
+		if not bt._warming(b):
+			points.append((b.date, bt.poslist._value))
+	bt.next_bar = track_bar
+	bt.poslist._retire = track_retire
+	bt.update_eqvals = track_eqvals
+	bt.run()
+
+	#the open ones without their link to this poslist
+	opn = []
+	for p in bt.poslist.open:
+		q = Position(symbol=p.symbol, dt=p.dt, entry=p.entry, size=p.size, order_id=p.order_id)
+		q.mark = p.mark
+		q.nbars = p.nbars
+		opn.append(q)
+	tf = dict((name, bt.tf_bars[name][sym]) for name in bt.tf_bars if sym in bt.tf_bars[name])
+	return (bt.bars[sym], retired, points, opn, tf)
+
+###
+# an indicator worked out for every bar before the run, see 
+# BackTest.precompute
+#
+# values[i] is the value after the i'th bar of the history, so value 
+# reads the one for the bars before the one in bar_close, as a per bar
+# indicator would. nan (not ready) reads as None
+###
+class Precomputed(object):
+
+	def __init__(self, bars, values):
+		self.bars = bars
+		self.values = values
+
+	def __get_count(self):
+		return self.bars.total
+	count = property(__get_count)
+
+	def __get_value(self):
+		k = self.bars.total
+		if k == 0:
+			return None
+		v = float(self.values[k - 1])
+		if v != v:
+			return None
+		return v
+	value = property(__get_value)
+
+	def __get_ready(self):
+		return self.value is not None
+	ready = property(__get_ready)
+
+	def __float__(self):
+		return float(self.value)
+
+	def __str__(self):
+		return "Precomputed: %s" % (self.value)
+
+	#nothing to do, the history moving on moves value
+	def update(self, b):
+		pass
+
+#a timedelta or a number of seconds as whole seconds
+def _seconds(x):
+	if isinstance(x, timedelta):
+		return x.days * 86400 + x.seconds
+	return int(x)
+
+###
+# builds bars of a longer period from one symbol's bars as they arrive
+#
+# the bars go into buckets of period (a timedelta or seconds) counted 
+# from the epoch plus offset. by default weekly buckets start on a 
+# monday, others at midnight. a bucket's bar is complete once a bar of a
+# later bucket turns up (add returns it then) or the data ends (flush).
+# the bar built is a new one of the same class, dated at the start of
+# its bucket, the bars fed in aren't changed
+###
+class Resampler(object):
+
+	def __init__(self, period, offset=None):
+		self.period = _seconds(period)
+		if self.period < 1:
+			raise ValueError("resample period must be at least a second")
+		if offset is None:
+			#the epoch was a thursday
+			offset = 4 * 86400 if self.period % (7 * 86400) == 0 else 0
+		self.offset = _seconds(offset)
+		self.bar = None
+		self._start = None
+
+	#add the next bar, returns the bar it completed or None
+	def add(self, b):
+		ts = dt2ts(b.date) - self.offset
+		start = ts - ts % self.period
+		if start == self._start:
+			self.bar.merge(b)
+			return None
+		done = self.bar
+		self._start = start
+		self.bar = b.__class__.from_values(b.symbol, ts2dt(start + self.offset), b.op, b.hi, b.lo, b.cl)
+		return done
+
+	#the bar in progress, None if there isn't one
+	def flush(self):
+		(done, self.bar, self._start) = (self.bar, None, None)
+		return done
+
+###
+# several series for one symbol as one, in the order run() plays them:
+# by date, and ties in the order of the series
+def _concat(parts):
+
+	if len(parts) == 1:
+		return parts[0]
+	first = parts[0]
+	cols = [[getattr(s, name) for s in parts] for name in BarSeries.FIELDS]
+	if np is None:
+		cols = [array.array(code, [x for c in cs for x in c]) for (code, cs) in zip(BarSeries.CODES, cols)]
+		order = sorted(xrange(len(cols[0])), key=cols[0].__getitem__)
+		cols = [array.array(c.typecode, [c[i] for i in order]) for c in cols]
+	else:
+		cols = [np.concatenate(cs) for cs in cols]
+		order = np.argsort(cols[0], kind='mergesort')
+		cols = [c[order] for c in cols]
+	precs = [s.prec for s in parts]
+	prec = None if None in precs else max(precs)
+	return BarSeries._wrap(first.symbol, first.bartype, cols, prec)
+
+#the rows of a series next_bar doesn't skip as weekends
+def _weekdays(series):
+
+	cols = [series.date, series.op, series.hi, series.lo, series.cl]
+	#1970-01-01 was a thursday
+	if np is None:
+		keep = [i for (i, ts) in enumerate(cols[0]) if (ts // 86400 + 3) % 7 < 5]
+		if len(keep) == len(series):
+			return series
+		cols = [array.array(c.typecode, [c[i] for i in keep]) for c in cols]
+	else:
+		keep = (cols[0] // 86400 + 3) % 7 < 5
+		if keep.all():
+			return series
+		cols = [c[keep] for c in cols]
+	return BarSeries._wrap(series.symbol, series.bartype, cols, series.prec)
+
+###
+# per phase timings of a run, set bt.profiler = Profiler() to turn it on
+#
+# run() and next_bar() time each phase with lap(), adding up the time 
+# and number of calls per phase, and bar_close's times go in a
+# histogram as well. with no profiler all they do is check for one.
+# report() gives it all back as a dict, str() as a table
+###
+class Profiler(object):
+
+	#upper bounds of the bar_close histogram buckets, in seconds
+	BUCKETS = (1e-6, 1e-5, 1e-4, 1e-3, 1e-2, 1e-1, 1.0)
+
+	def __init__(self, clock=timeit.default_timer):
+		self.clock = clock
+		self.reset()
+
+	def reset(self):
+		self.times = collections.OrderedDict()
+		self.calls = collections.OrderedDict()
+		self.hist = [0] * (len(Profiler.BUCKETS) + 1)
+		self.nbars = 0
+		self.elapsed = 0.0
+
+	#add the time since t to phase, returns now for the next lap
+	def lap(self, phase, t):
+		now = self.clock()
+		if phase in self.times:
+			self.times[phase] += now - t
+			self.calls[phase] += 1
+		else:
+			self.times[phase] = now - t
+			self.calls[phase] = 1
+		return now
+
+	def latency(self, dt):
+		self.hist[bisect.bisect_left(Profiler.BUCKETS, dt)] += 1
+
+	def report(self):
+
+		total = sum(self.times.itervalues())
+		phases = collections.OrderedDict()
+		for (k, t) in self.times.iteritems():
+			n = self.calls[k]
+			phases[k] = {'time': t, 'calls': n, 'mean': t / n, 
+				'share': t / total if total else 0.0}
+		bounds = list(Profiler.BUCKETS) + [_INF]
+		return {'bars': self.nbars, 'elapsed': self.elapsed,
+			'bars_per_sec': self.nbars / self.elapsed if self.elapsed else 0.0,
+			'phases': phases, 'bar_close_hist': zip(bounds, self.hist)}
+
+	def __str__(self):
+
+		r = self.report()
+		s = "%d bars in %.3fs, %.0f bars/s\n" % (r['bars'], r['elapsed'], r['bars_per_sec'])
+		s += "%-12s %10s %10s %10s %6s\n" % ("phase", "time", "calls", "mean", "share")
+		for (k, p) in r['phases'].iteritems():
+			s += "%-12s %9.4fs %10d %9.2fus %5.1f%%\n" % (k, p['time'], p['calls'], 
+				p['mean'] * 1e6, p['share'] * 100)
+		s += "bar_close latency\n"
+		for (b, n) in r['bar_close_hist']:
+			s += "  <= %-8s %d\n" % (b == _INF and "inf" or "%gs" % b, n)
+		return s
+
 class BackTest(object):
 
-	def __init__(self, equity=100000):
-		deq = D(str(equity))
+	#how many past bars of each symbol self.bars keeps, None for all of
+	#them. set it to what the strategy looks back over (indicators keep
+	#their own state, they don't need it), see BarSeries maxlen
+	lookback = None
+
+	#a datetime, bars before it only warm up: they go into self.bars, the
+	#indicators and the longer timeframes, but bar_close and the timeframe
+	#callbacks aren't called for them and no equity is recorded, so the
+	#run's trades and equity start there. see walkforward.py
+	trade_from = None
+
+	###
+	# archive is an optional path or Archive, if given finished orders and
+	# positions are written there instead of being kept in memory. a path
+	# is truncated, each run starts a new archive. to add to an existing
+	# one pass Archive(path), which appends
+	###
+	def __init__(self, equity=100000, archive=None):
+		deq = NUM.num(equity)
 		self.equity = deq #equity
 		self.max_equity = self.min_equity = deq #equity
 		self.max_risk = 0.01
-		self.eqvals = []
+		self.eqvals = EquityCurve()
+		#a Profiler to time the phases of the run, see Profiler
+		self.profiler = None
 		self.bars = {} 
 		self.inputs = []
-		self.book = OrderBook(debug=False)
-		self.poslist = PositionList(close_cb=self.close_cb, open_cb=self.open_cb)
+		#(name, class, args, kwargs) and per symbol {name: indicator}
+		self._ind_specs = []
+		self._pre_specs = []
+		self.indicators = {}
+		#(name, period, offset, syms, callback), per symbol its resamplers
+		#and per timeframe {sym: BarSeries} of the completed bars
+		self._timeframes = []
+		self._resamplers = {}
+		self.tf_bars = {}
+		#sym: (BarSeries, period) of finer bars, see add_detail
+		self._details = {}
+		if isinstance(archive, basestring):
+			archive = Archive(archive, 'wb')
+		self.archive = archive
+		self.book = OrderBook(debug=False, archive=archive)
+		self.poslist = PositionList(close_cb=self.close_cb, open_cb=self.open_cb, archive=archive)
 		
 
 	def __get_max_equity(self):
 		return self._max_equity
 	def __set_max_equity(self, x):
-		if not isinstance(x, decimal.Decimal):
-			self._max_equity = D(str(x))
-		else:
-			self._max_equity = x
+		self._max_equity = NUM.num(x)
 	max_equity = property(__get_max_equity, __set_max_equity)
 
 	def __get_min_equity(self):
 		return self._min_equity
 	def __set_min_equity(self, x):
-		if not isinstance(x, decimal.Decimal):
-			self._min_equity = D(str(x))
-		else:
-			self._min_equity = x
+		self._min_equity = NUM.num(x)
 	min_equity = property(__get_min_equity, __set_min_equity)
 
 	def __get_equity(self):
 		return self._equity
 	def __set_equity(self, x):
-		if not isinstance(x, decimal.Decimal):
-			self._equity = D(str(x))
-		else:
-			self._equity = x
+		self._equity = NUM.num(x)
 	equity = property(__get_equity, __set_equity)
 
 	def __get_max_risk(self):
 		return self._max_risk
 	def __set_max_risk(self, x):
-		if not isinstance(x, decimal.Decimal):
-			self._max_risk = D(str(x))
-		else:
-			self._max_risk = x
+		self._max_risk = NUM.num(x)
 	max_risk = property(__get_max_risk, __set_max_risk)
 
 	#override this
@@ -741,6 +2639,11 @@ class BackTest(object):
 	def close_cb(self, p):
 
 		self.on_close(p)
+		self._add_closed(p)
+
+		#print "BackTest close callback() pos: %.2f, equity %.2f" % (p.value, self.equity)
+
+	def _add_closed(self, p):
 
 		self.equity += p.value
 		if self.equity > self.max_equity:
@@ -748,8 +2651,6 @@ class BackTest(object):
 		elif self.equity < self.min_equity:
 			self.min_equity = self.equity
 
-		#print "BackTest close callback() pos: %.2f, equity %.2f" % (p.value, self.equity)
-
 	#overload this to be passed the position as it is opened
 	def on_open(self, p):
 		pass
@@ -759,38 +2660,363 @@ class BackTest(object):
 
 	###
 	# add an input source from which to read bar data	
-	# pass the string symbol, input object that supports readline()
-	# and an optional bar type for parsing the input 
+	# pass the string symbol, an input and an optional bar type for
+	# parsing it. the input can be a file or anything else with read()
+	# or readline(), a path (.gz, .bz2 and .xz are decompressed as they
+	# are read), or any iterable of lines or Bars such as a generator.
+	# it can also be a BarSeries, e.g. from load_bars(), or the path of
+	# a bar file which is memory mapped, in which case the bars are
+	# already parsed and bartype is not used
 	def add_input(self, sym, inf, bartype=Bar):
 
 		#print 'adding sym %s' % sym
 		self.inputs.append((sym, inf, bartype))
-		self.bars[sym] = []
+		self.bars[sym] = BarSeries(sym, bartype, maxlen=self.lookback)
+		self._sym_indicators(sym)
+
+	###
+	# register an indicator, see indicators.py
+	# each symbol gets its own cls(*args, **kw), kept in 
+	# self.indicators[sym][name] and updated as bars are added to the
+	# history, so in bar_close it covers the bars before the current one
+	def add_indicator(self, name, cls, *args, **kw):
+
+		self._ind_specs.append((name, cls, args, kw))
+		for inds in self.indicators.itervalues():
+			inds[name] = cls(*args, **kw)
+
+	def _sym_indicators(self, sym):
+
+		inds = self.indicators.get(sym)
+		if inds is None:
+			inds = self.indicators[sym] = {}
+			for (name, cls, args, kw) in self._ind_specs:
+				inds[name] = cls(*args, **kw)
+		return inds
+
+	###
+	# register an indicator computed for the whole series before the run
+	# the inputs must already be loaded, a BarSeries from load_bars or a 
+	# bar file. self.indicators[sym][name] is then a Precomputed, which 
+	# reads like the indicator would in bar_close, but without the per
+	# bar update. see Indicator.compute in indicators.py
+	def precompute(self, name, cls, *args, **kw):
+
+		self._pre_specs.append((name, cls, args, kw))
+
+	def _precompute(self):
+
+		series = {}
+		for (sym, f, bartype) in self.inputs:
+			if isinstance(f, basestring) and f.endswith(BARFILE_EXT):
+				f = open_bars(f, sym)
+			if not isinstance(f, BarSeries):
+				raise InvalidStateException("%s: precomputed indicators need a BarSeries or bar file input, see load_bars" % sym)
+			series.setdefault(sym, []).append(f)
+		for (sym, parts) in series.items():
+			#a symbol's inputs are played merged by date, so compute
+			#over them merged the same way
+			f = _weekdays(_concat(parts))
+			inds = self._sym_indicators(sym)
+			for (name, cls, args, kw) in self._pre_specs:
+				inds[name] = Precomputed(self.bars[sym], cls.compute(f, *args, **kw))
+
+	###
+	# attach finer bars for sym, used only to settle bars that hit orders 
+	# which cancel each other (a stop loss and take profit, say). rather
+	# than rewinding the parent, the finer bars within the bar (from its
+	# date to period, a timedelta or seconds, later) are played in order
+	# and the first of the orders one of them hits alone fills. if a finer
+	# bar hits more than one, or none do, it's rewound as before.
+	#
+	# inf is a BarSeries, a bar file path (memory mapped, so only the
+	# parts looked at are read) or anything load_bars takes, oldest first
+	def add_detail(self, sym, inf, period, bartype=Bar):
+
+		if isinstance(inf, basestring) and inf.endswith(BARFILE_EXT):
+			inf = open_bars(inf, sym)
+		elif not isinstance(inf, BarSeries):
+			inf = load_bars(inf, sym, bartype)
+		self._details[sym] = (inf, _seconds(period))
+
+	###
+	# which of orders, which all hit b, the finer bars say was hit first,
+	# None if they can't tell
+	def _drill(self, b, orders):
+
+		d = self._details.get(b.symbol)
+		if d is None:
+			return None
+		(fine, period) = d
+		start = dt2ts(b.date)
+		dates = fine.date
+		if np is None:
+			(i, j) = (bisect.bisect_left(dates, start), bisect.bisect_left(dates, start + period))
+		else:
+			(i, j) = np.searchsorted(dates, [start, start + period])
+		(los, his) = (fine.lo, fine.hi)
+		levels = [(o, None if o.type == Order.MARKET else float(o.level)) for o in orders]
+		for k in xrange(i, j):
+			(lo, hi) = (los[k], his[k])
+			hit = [o for (o, lvl) in levels if lvl is None or lo <= lvl <= hi]
+			if len(hit) == 1:
+				return hit[0]
+			if hit:
+				return None
+		return None
+
+	###
+	# add a timeframe, bars of period (a timedelta or seconds) built as the
+	# bars of syms (all of them by default) are played, see Resampler.
+	# when one completes cb(sym, bar) is called, self.bar_close_<name> if
+	# cb isn't given, before the bar that completed it is processed. with
+	# several timeframes they're called in the order they were added. the
+	# completed bars are kept in self.tf_bars[name][sym], a BarSeries, 
+	# which like self.bars holds the ones before the bar in cb
+	def add_timeframe(self, name, period, syms=None, cb=None, offset=None):
+
+		if cb is None:
+			cb = getattr(self, 'bar_close_' + name, None)
+		if cb is None:
+			raise InvalidStateException("timeframe %s: pass cb or define bar_close_%s" % (name, name))
+		self._timeframes.append((name, period, offset, syms, cb))
+		self.tf_bars[name] = {}
+		#a bad period shows up now rather than at the first bar
+		Resampler(period, offset)
+
+	def _resample(self, sym, b):
+
+		rs = self._resamplers.get(sym)
+		if rs is None:
+			rs = self._resamplers[sym] = [(name, Resampler(period, offset), cb) 
+				for (name, period, offset, syms, cb) in self._timeframes
+				if syms is None or sym in syms]
+		warming = self._warming(b)
+		for (name, r, cb) in rs:
+			done = r.add(b)
+			if done is not None:
+				self._tf_close(name, sym, done, None if warming else cb)
+
+	def _tf_close(self, name, sym, b, cb):
+
+		if cb is not None:
+			cb(sym, b)
+		hist = self.tf_bars[name].get(sym)
+		if hist is None:
+			hist = self.tf_bars[name][sym] = BarSeries(sym, b.__class__)
+		hist.append(b)
+
+	#close the timeframe bars still in progress at the end of the data
+	def _flush_timeframes(self):
+
+		for (sym, rs) in self._resamplers.iteritems():
+			for (name, r, cb) in rs:
+				done = r.flush()
+				if done is not None:
+					self._tf_close(name, sym, done, cb)
+
+	#b is before trade_from
+	def _warming(self, b):
+		return self.trade_from is not None and b.date < self.trade_from
 
 	###
 	# update the current equity level
-	# if you don't want this done every bar, override it and check the bar date
-	# e.g. tracking end of day equity for an hourly strategy, hourly bars, daily equity
+	# if you don't want this done every bar, set eqvals to an EquityCurve
+	# with the sampling you want, e.g. tracking end of day equity for an 
+	# hourly strategy, EquityCurve(sample=EquityCurve.EOD)
 	def update_eqvals(self, b):
-		self.eqvals.append((b.date, self.equity + self.poslist.value()))
+		if self._warming(b):
+			return
+		self.eqvals.record(b.date, self.equity + self.poslist.value())
 
 	#run the strat, you set the input by calling add_input() before 
+	#bars from all the inputs are played in date order, and the equity
+	#is updated once all the bars for a date have been seen
 	def run(self):
 
-		# ugh ... clean this up
-		done = False
-		while done == False:
-			for (sym, f, bartype) in self.inputs:
-				#print "Sym: %s" % sym
-				line = f.readline().strip()
-				#print 'line: %s' % line
-				if len(line) == 0:
-					done = True
-					break
-				b = bartype(sym, line)
-				self.next_bar(sym, b)
-			self.update_eqvals(b)
+		prof = self.profiler
+		if prof is not None:
+			start = t = prof.clock()
+		if self._pre_specs:
+			self._precompute()
+			if prof is not None:
+				t = prof.lap('precompute', t)
+		last = None
+		for (sym, b) in self._merge():
+			#the time since the last bar is the merge getting this one
+			if prof is not None:
+				t = prof.lap('merge', t)
+				prof.nbars += 1
+			if last is not None and b.date != last.date:
+				self.update_eqvals(last)
+				if prof is not None:
+					t = prof.lap('eqvals', t)
+			self.next_bar(sym, b)
+			if prof is not None:
+				t = prof.clock()
+			last = b
+		if self._timeframes:
+			self._flush_timeframes()
+		if last is not None:
+			self.update_eqvals(last)
+		self.eqvals.finish()
+		#so Archive.read(path) sees the whole run
+		if self.archive is not None:
+			self.archive.flush()
+		if prof is not None:
+			t = prof.lap('eqvals', t)
+			prof.elapsed += t - start
+
+	#close the archive, if there is one, once done with the results
+	def close(self):
+		if self.archive is not None:
+			self.archive.close()
+
+	###
+	# merge the inputs into one stream of (sym, bar) in date order
+	#
+	# keeps a heap with the next bar of each input, so it's O(log N) per
+	# bar for N inputs. bars with the same date come out in the order the
+	# inputs were added, and it runs until every input is exhausted
+	def _merge(self):
+
+		heap = []
+		for i, (sym, f, bartype) in enumerate(self.inputs):
+			feed = self._feed(sym, f, bartype)
+			b = next(feed, None)
+			if b is not None:
+				heap.append((b.date, i, sym, b, feed))
+		heapq.heapify(heap)
+
+		while heap:
+			(dt, i, sym, b, feed) = heap[0]
+			yield (sym, b)
+			b = next(feed, None)
+			if b is None:
+				heapq.heappop(heap)
+			else:
+				heapq.heapreplace(heap, (b.date, i, sym, b, feed))
+
+	###
+	# generator of the bars from one input
+	# paths are only opened here, as the run gets to them, see open_input
+	# and iter_lines for what else an input can be
+	def _feed(self, sym, f, bartype):
+
+		opened = False
+		if isinstance(f, basestring):
+			if f.endswith(BARFILE_EXT):
+				f = open_bars(f, sym)
+			else:
+				f = open_input(f)
+				opened = True
+
+		if isinstance(f, BarSeries):
+			for b in f._iter(sym):
+				yield b
+			return
+
+		try:
+			for line in iter_lines(f):
+				if isinstance(line, Bar):
+					yield line
+				else:
+					yield bartype(sym, line)
+		finally:
+			if opened:
+				f.close()
 	
+	###
+	# run each symbol in its own process, then merge them
+	#
+	# for strategies where each symbol trades on its own, i.e. not 
+	# sizing off the shared equity or looking at other symbols' bars or
+	# positions. each worker is a fork of this BackTest with only one
+	# symbol's inputs, so it has its own book and positions. their closed
+	# and rewound positions are then replayed here in the order the
+	# serial run() would close them (by date, then input order), giving 
+	# the same equity, max/min, stats and closed list, and the equity 
+	# curve is rebuilt from each symbol's open value at each date. 
+	# positions still open are added to poslist, so close_all() works.
+	#
+	# on_open and on_close run in the workers as positions open and
+	# close. the replay calls on_close here again, in the same order, so
+	# whatever it keeps on self ends up in this BackTest. on_open isn't
+	# called again for the positions still open
+	#
+	# the order book isn't merged, and order ids in worker i start at 
+	# i * ORDER_ID_BLOCK past where they were so they stay unique
+	###
+	ORDER_ID_BLOCK = 1 << 32
+
+	def run_by_symbol(self, processes=None):
+
+		global _by_sym
+		if self.archive is not None:
+			raise InvalidStateException("run_by_symbol doesn't support an archive")
+
+		syms = []
+		for (sym, f, bartype) in self.inputs:
+			if sym not in syms:
+				syms.append(sym)
+		if processes == 1 or len(syms) < 2:
+			return self.run()
+		if processes is None:
+			processes = multiprocessing.cpu_count()
+
+		first_id = Order.id_iter.next()
+		_by_sym = (self, syms, first_id)
+		try:
+			#a fresh fork for each symbol, a worker's BackTest is used up
+			pool = multiprocessing.Pool(min(processes, len(syms)), maxtasksperchild=1)
+			try:
+				res = pool.map(_run_sym, xrange(len(syms)), chunksize=1)
+			finally:
+				pool.terminate()
+				pool.join()
+		finally:
+			_by_sym = None
+		Order.id_iter = itertools.count(first_id + len(syms) * BackTest.ORDER_ID_BLOCK)
+
+		#(date, input, seq, kind, position), in the order run() would retire them
+		events = []
+		#(date, input, open value)
+		points = []
+		for (i, (bars, retired, pts, opn, tf)) in enumerate(res):
+			self.bars[syms[i]] = bars
+			for (name, hist) in tf.iteritems():
+				self.tf_bars[name][syms[i]] = hist
+			events.extend((dt, i, j, kind, p) for (j, (dt, kind, p)) in enumerate(retired))
+			points.extend((dt, i, v) for (dt, v) in pts)
+		events.sort(key=lambda e: e[:3])
+		points.sort(key=lambda e: e[:2])
+
+		k = 0
+		values = [0] * len(syms)
+		for (j, (dt, i, v)) in enumerate(points):
+			values[i] = v
+			if j + 1 < len(points) and points[j + 1][0] == dt:
+				continue
+			#what closed up to this date, then the equity at its end
+			while k < len(events) and events[k][0] <= dt:
+				(edt, ei, seq, kind, p) = events[k]
+				self.poslist._retire(p, kind)
+				if kind == Archive.CLOSED:
+					self.close_cb(p)
+				k += 1
+			with NUM.wide():
+				v = sum(values)
+			self.eqvals.record(dt, self.equity + (+v))
+		for (edt, ei, seq, kind, p) in events[k:]:
+			self.poslist._retire(p, kind)
+			if kind == Archive.CLOSED:
+				self.close_cb(p)
+		self.eqvals.finish()
+
+		opn = [(p.dt, i, j, p) for (i, r) in enumerate(res) for (j, p) in enumerate(r[3])]
+		for (dt, i, j, p) in sorted(opn, key=lambda e: e[:3]):
+			self.poslist._insert(p)
+
 	### 
 	# this is a mostly internal function
 	# it will handle fills and marking open positions
@@ -801,21 +3027,42 @@ class BackTest(object):
 		if b.date.weekday() == 5 or b.date.weekday() == 6:
 			return
 
+		#the longer timeframe bars this one completes come first
+		if self._timeframes:
+			self._resample(sym, b)
+
+		prof = self.profiler
+		if prof is not None:
+			t = prof.clock()
+
 		#first check if this bar caused any orders to be filled
 		fills = self.book.get_fills(b)
+		if prof is not None:
+			t = prof.lap('get_fills', t)
 		
 		if len(fills) > 1:
 			# we got multiple fills
 			#print "Multiple fills:"
 			for order in fills[:]:
+				#already settled along with another
+				if order not in fills:
+					continue
 				#see if any of the other fills are meant to cancel this order
 				dups = [x for x in fills if order.id in x.cancels]
 				if len(dups) == 0:
 					continue
+				#finer bars may say which came first, the rest are cancelled
+				first = self._drill(b, [order] + dups)
+				if first is not None:
+					for x in [order] + dups:
+						if x is not first:
+							self.book.cancel(x)
+							fills.remove(x)
+					continue
 				#we have 2 orders triggered that would cancel each other
 				# could be they are stops/tp for a parent, in which case
 				# close the parent and cancel these two
-				if order.triggered:
+				if order.triggered():
 					self.poslist.rewind(order.trigger_parent)
 				# cancel the conflicting orders ...
 				self.book.cancel(order)
@@ -824,6 +3071,8 @@ class BackTest(object):
 					#print "DUP cancel %s %s" % (order, d)
 					self.book.cancel(d)
 					fills.remove(d)
+			if prof is not None:
+				t = prof.lap('oco', t)
 
 		#we cleared out any dupes, now fill them
 		for o in fills: 
@@ -831,25 +3080,41 @@ class BackTest(object):
 
 			#add the order to the position mgr for this symbol
 			self.poslist.add(o, b.date)
+			if prof is not None:
+				t = prof.lap('pos_add', t)
 			#update the order book
 			self.book.fill(o)
+			if prof is not None:
+				t = prof.lap('book_fill', t)
 
 		self.poslist.mark(b)
+		if prof is not None:
+			t = prof.lap('mark', t)
 
 		#print "%d active %d cancelled %d filled" % (len(book.active), len(book.cancelled), len(book.filled))
 		#print "%d open positions %d closed" % (len(self.poslist.open), len(self.poslist.closed))
 		
 		if not self.bars.has_key(sym):
-			self.bars[sym] = []
+			self.bars[sym] = BarSeries(sym, b.__class__, maxlen=self.lookback)
+			self._sym_indicators(sym)
 	
 		#if len(self.bars[sym]) == 0:
 		#	self.bars[sym].append(b)
 		#	return
 
-		#pass it to the strat
-		self.bar_close(sym, b)
+		#pass it to the strat, unless it's warming up
+		if not self._warming(b):
+			self.bar_close(sym, b)
+			if prof is not None:
+				t0 = t
+				t = prof.lap('bar_close', t)
+				prof.latency(t - t0)
 		
 		self.bars[sym].append(b)
+		for ind in self._sym_indicators(sym).itervalues():
+			ind.update(b)
+		if prof is not None:
+			prof.lap('history', t)
 
 
 	###
@@ -859,39 +3124,46 @@ class BackTest(object):
 
 		pass
 
-	def print_summary(self):
-
-		nbe = 0
-		nwin = 0
-		nlos = 0
-		totwin = 0
-		totlos = 0
-		for p in self.poslist.closed:
-			if p.value == 0:
-				nbe += 1
-			elif p.value > 0:
-				nwin += 1
-				totwin += p.value
-			else:
-				nlos += 1
-				totlos += p.value
-
-		tot_pos = D(nwin + nlos + nbe)
-		print "%d won %d los" % (nwin, nlos)
+	###
+	# the numbers print_summary shows, as a dict
+	# win_rate, avg_win, avg_los, wl_rat and e are None until there has
+	# been at least one win and one loss
+	def summary(self):
+
+		st = self.poslist.stats
+		(nwin, nlos, nbe) = (st.nwin, st.nlos, st.nbe)
+		(totwin, totlos) = (st.totwin, st.totlos)
+
+		s = {'equity': self.equity, 'max_equity': self.max_equity, 
+			'min_equity': self.min_equity, 'nwin': nwin, 'nlos': nlos, 
+			'nbe': nbe, 'win_rate': None, 'avg_win': None, 'avg_los': None,
+			'wl_rat': None, 'e': None}
 		if nwin == 0 or nlos == 0:
-			print "final equity: %.2f max %.2f min %.2f" % (self.equity, self.max_equity, 
-				self.min_equity)
-			return
+			return s
+
+		tot_pos = NUM.num(nwin + nlos + nbe)
 		pos_won = nwin/tot_pos
 		pos_los = nlos/tot_pos 
-		print "%d won %d los %d be win rate %.2f" % (nwin, nlos, nbe, pos_won)
 		avg_win = totwin/nwin
 		avg_los = totlos/nlos
-		print "avg win %.2f avg los %.2f" % (avg_win, avg_los)
-		print "wl_rat %.2f" % (avg_win/abs(avg_los)),
-		print "e %.2f" % (avg_win * pos_won + avg_los * pos_los)
-		print "final equity: %.2f max %.2f min %.2f" % (self.equity, self.max_equity, 
-			self.min_equity)
+		s['win_rate'] = pos_won
+		s['avg_win'] = avg_win
+		s['avg_los'] = avg_los
+		s['wl_rat'] = avg_win/abs(avg_los)
+		s['e'] = avg_win * pos_won + avg_los * pos_los
+		return s
+
+	def print_summary(self):
+
+		s = self.summary()
+		print "%d won %d los" % (s['nwin'], s['nlos'])
+		if s['win_rate'] is not None:
+			print "%d won %d los %d be win rate %.2f" % (s['nwin'], s['nlos'], s['nbe'], s['win_rate'])
+			print "avg win %.2f avg los %.2f" % (s['avg_win'], s['avg_los'])
+			print "wl_rat %.2f" % (s['wl_rat']),
+			print "e %.2f" % (s['e'])
+		print "final equity: %.2f max %.2f min %.2f" % (s['equity'], s['max_equity'], 
+			s['min_equity'])
 
 	def unq_name(self, outfile_base, outfile_ext):
 		i = 1
@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+
+###
+# benchmarks, to see whether a change makes things faster or slower
+#
+# a seeded random walk gives the same N symbols x M hourly bars every
+# time, and GridBackTest keeps K resting limit orders and up to P open
+# positions per symbol. at each scale it times
+#	parse		Bar() per line, and load_bars
+#	get_fills	an OrderBook with K resting orders per symbol
+#	mark/value	a PositionList with P open positions per symbol
+#	next_bar	the per bar machinery, no strategy
+#	feed		a run with no strategy over csv text, a BarSeries and
+#			a .mbar bar file, i.e. the cost of each kind of input
+#	run		GridBackTest over the csv inputs
+# taking the best of a few repeats of each.
+#
+#	./bench.py small medium -o before.json
+#	(change things)
+#	./bench.py small medium -c before.json
+#
+# -o saves the timings as json, -c compares against a saved file and
+# flags anything more than -t (default 10%) slower. exits 1 if so. -p
+# prints a Profiler report of a run at each scale, -n picks the numeric
+# backend (decimal, float or ticks).
+###
+
+import os
+import sys
+import time
+import json
+import random
+import platform
+import optparse
+import tempfile
+from StringIO import StringIO
+from backtest import *
+
+#name: (symbols, bars per symbol, resting orders, open positions)
+SCALES = collections.OrderedDict([
+	('small', (1, 2000, 5, 5)),
+	('medium', (5, 5000, 20, 20)),
+	('large', (20, 10000, 50, 100)),
+])
+
+###
+# a reproducible hourly random walk as Bar csv lines, weekends left out
+###
+def gen_lines(sym, nbars, seed=0):
+
+	rnd = random.Random("%s-%d" % (sym, seed))
+	dt = datetime(2001, 1, 1)
+	hour = timedelta(hours=1)
+	cl = 100.0
+	lines = []
+	while len(lines) < nbars:
+		if dt.weekday() < 5:
+			op = cl
+			cl = max(1.0, round(op + rnd.gauss(0, 0.25), 2))
+			hi = round(max(op, cl) + abs(rnd.gauss(0, 0.1)), 2)
+			lo = round(min(op, cl) - abs(rnd.gauss(0, 0.1)), 2)
+			lines.append("%s,%s,%.2f,%.2f,%.2f,%.2f" % (dt.strftime("%Y%m%d-%H0000"), sym, op, hi, lo, cl))
+		dt += hour
+	return lines
+
+def gen_market(nsyms, nbars, seed=0):
+	return [("S%03d" % i, gen_lines("S%03d" % i, nbars, seed)) for i in xrange(nsyms)]
+
+###
+# keeps norders limit buys resting below the close, gap apart, topping
+# them up as they fill and dropping ones left far behind, and closes the
+# oldest position once more than npos are open
+###
+class GridBackTest(BackTest):
+
+	norders = 5
+	npos = 5
+	gap = '0.2'
+
+	def bar_close(self, sym, b):
+
+		active = self.book.sym_active(sym)
+		gap = num(self.gap)
+		floor = b.cl - gap * self.norders * 2
+		for o in active[:]:
+			if o.level < floor:
+				self.book.cancel(o)
+				active.remove(o)
+		lowest = min([o.level for o in active] or [b.cl])
+		for i in xrange(self.norders - len(active)):
+			lowest -= gap
+			self.book.add(Order(sym, Order.BUY, Order.LIMIT, level=lowest, size=100))
+
+		ps = self.poslist.sym_open(sym)
+		if len(ps) > self.npos:
+			p = ps[0]
+			self.book.add(Order(sym, Order.SELL, Order.MARKET, level=b.cl, size=-p.size, link=p.order_id))
+
+#best of repeat runs of fn(), in seconds
+def timed(fn, repeat=3):
+	best = None
+	for i in xrange(repeat):
+		t = time.time()
+		fn()
+		t = time.time() - t
+		if best is None or t < best:
+			best = t
+	return best
+
+def bench_scale(name, nsyms, nbars, norders, npos, repeat=3, profile=False):
+
+	market = gen_market(nsyms, nbars)
+	nall = nsyms * nbars
+	texts = [(sym, "\n".join(lines)) for (sym, lines) in market]
+	bars = [Bar(sym, l) for (sym, lines) in market for l in lines]
+	bars.sort(key=lambda b: b.date)
+	res = collections.OrderedDict()
+
+	def add(what, t, n):
+		res["%s/%s" % (name, what)] = t
+		print "%-24s %10.4fs %12.0f/s" % ("%s/%s" % (name, what), t, n / t if t else 0)
+		sys.stdout.flush()
+
+	add('parse.Bar', timed(lambda: [Bar(sym, l) for (sym, lines) in market for l in lines], repeat), nall)
+	add('parse.load_bars', timed(lambda: [load_bars(StringIO(t), sym) for (sym, t) in texts], repeat), nall)
+
+	#resting orders spread either side of the walk's start
+	book = OrderBook()
+	for (sym, lines) in market:
+		for i in xrange(norders):
+			book.add(Order(sym, Order.BUY, Order.LIMIT, level=num(100) - num(i) / 4, size=100))
+	add('get_fills', timed(lambda: [book.get_fills(b) for b in bars], repeat), nall)
+
+	pl = PositionList()
+	for (sym, lines) in market:
+		for i in xrange(npos):
+			pl.add(Order(sym, Order.BUY, Order.MARKET, level=num(100), size=100), bars[0].date)
+	add('mark', timed(lambda: [pl.mark(b) for b in bars], repeat), nall)
+	add('value', timed(lambda: [pl.value() for b in bars], repeat), nall)
+
+	def next_bars():
+		bt = BackTest()
+		for b in bars:
+			bt.next_bar(b.symbol, b)
+	add('next_bar', timed(next_bars, repeat), nall)
+
+	def feed(inputs):
+		bt = BackTest()
+		for (sym, f) in inputs:
+			bt.add_input(sym, f)
+		bt.run()
+	add('feed.text', timed(lambda: feed([(sym, StringIO(t)) for (sym, t) in texts]), repeat), nall)
+	series = [(sym, load_bars(StringIO(t), sym)) for (sym, t) in texts]
+	add('feed.series', timed(lambda: feed(series), repeat), nall)
+	if np is not None:
+		tmp = tempfile.mkdtemp()
+		paths = []
+		for (sym, s) in series:
+			paths.append((sym, os.path.join(tmp, sym + BARFILE_EXT)))
+			write_bars(paths[-1][1], s)
+		add('feed.mbar', timed(lambda: feed(paths), repeat), nall)
+		for (sym, path) in paths:
+			os.remove(path)
+		os.rmdir(tmp)
+
+	def run(prof=None):
+		bt = GridBackTest()
+		bt.profiler = prof
+		(bt.norders, bt.npos) = (norders, npos)
+		for (sym, t) in texts:
+			bt.add_input(sym, StringIO(t))
+		bt.run()
+	add('run', timed(run, repeat), nall)
+	if profile:
+		prof = Profiler()
+		run(prof)
+		print prof
+	return res
+
+###
+# compare timings against a baseline, returns the names that are more
+# than threshold slower
+###
+def compare(results, baseline, threshold=0.1):
+
+	slower = []
+	print "\n%-24s %10s %10s %8s" % ("", "baseline", "now", "ratio")
+	for (k, t) in results.iteritems():
+		if k not in baseline:
+			continue
+		r = t / baseline[k] if baseline[k] else 0
+		flag = ""
+		if r > 1 + threshold:
+			flag = " slower"
+			slower.append(k)
+		elif r < 1 - threshold:
+			flag = " faster"
+		print "%-24s %9.4fs %9.4fs %8.2f%s" % (k, baseline[k], t, r, flag)
+	return slower
+
+if __name__ == '__main__':
+
+	parser = optparse.OptionParser(usage="%prog [options] [scale ...], scales: " + ", ".join(SCALES))
+	parser.add_option("-o", dest="output", help="save the timings to this file")
+	parser.add_option("-c", dest="baseline", help="compare with timings saved with -o")
+	parser.add_option("-t", dest="threshold", type="float", default=0.1,
+		help="slowdown to flag, default 0.1 (10%)")
+	parser.add_option("-r", dest="repeat", type="int", default=3, help="repeats, the best is kept")
+	parser.add_option("-p", dest="profile", action="store_true", help="print where a run's time goes")
+	parser.add_option("-n", dest="numbers", default="decimal", choices=sorted(NUMBERS),
+		help="numeric backend, one of %s" % ", ".join(sorted(NUMBERS)))
+	(opts, args) = parser.parse_args()
+
+	scales = args or ['small']
+	for s in scales:
+		if s not in SCALES:
+			parser.error("unknown scale %s" % s)
+
+	set_numbers(opts.numbers)
+	results = collections.OrderedDict()
+	for s in scales:
+		print "%s: %d symbols x %d bars, %d orders, %d positions" % ((s,) + SCALES[s])
+		results.update(bench_scale(s, *SCALES[s], repeat=opts.repeat, profile=opts.profile))
+
+	if opts.output:
+		f = open(opts.output, 'w')
+		json.dump({'python': platform.python_version(), 'numbers': opts.numbers, 'results': results}, f, indent=1)
+		f.close()
+
+	if opts.baseline:
+		baseline = json.load(open(opts.baseline))['results']
+		if compare(results, baseline, opts.threshold):
+			sys.exit(1)
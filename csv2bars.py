@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+
+###
+# convert Bar or YahooBar csv files to binary bar files, see open_bars
+#
+# writes SPY.mbar next to SPY.csv etc, the symbol is taken from the file
+# name the same way maeg.py does it. files newest first, as they come
+# from yahoo, are written oldest first
+###
+
+import sys
+import os
+from backtest import *
+
+if len(sys.argv) < 2:
+	print "usage: %s <input file> ..." % (sys.argv[0])
+	sys.exit(1)
+
+for fname in sys.argv[1:]:
+	sym = os.path.basename(fname).split('_')[-1]
+	idx = sym.find('.')
+	if idx != -1:
+		sym = sym[0:idx]
+	f = open(fname)
+	l = f.readline()
+	f.seek(0)
+	if l.find('Open,') == -1: #no header
+		t = Bar
+	else:
+		t = YahooBar
+	outfile = os.path.splitext(fname)[0] + BARFILE_EXT
+	series = oldest_first(load_bars(f, sym, t))
+	write_bars(outfile, series)
+	print "%s: %d %s bars for %s -> %s" % (fname, len(series), t.__name__, sym, outfile)
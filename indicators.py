@@ -0,0 +1,359 @@
+###
+# rolling indicators that are updated one bar at a time
+#
+# each keeps just enough state to move its window on by a bar, so an
+# update is O(1) (amortized for Highest/Lowest) whatever the period.
+# register them on a BackTest with add_indicator() and they are updated
+# for each symbol as its bar is added to the history, so in bar_close
+# they cover the bars before the current one, the same as self.bars[sym]
+#
+#	self.add_indicator('ma', SMA, 200)
+#	...
+#	ma = self.indicators[sym]['ma']
+#	if ma.ready and float(b.cl) > ma.value:
+#
+# values are floats, as the BarSeries columns are. value is None until
+# the indicator has seen enough bars to be ready
+#
+# when the whole series is loaded up front (load_bars or a bar file) the
+# same indicators can instead be computed for every bar before the run,
+# see BackTest.precompute and the whole array functions at the end
+###
+
+import collections
+import math
+import array
+
+#numpy is optional, without it the whole series versions run the
+#indicator a bar at a time
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+class Indicator(object):
+
+	def __init__(self, n, field='cl'):
+		if n < 1:
+			raise ValueError("indicator period must be at least 1, got %r" % (n,))
+		self.n = n
+		self.field = field
+		self.count = 0
+		self.value = None
+
+	def __get_ready(self):
+		return self.value is not None
+	ready = property(__get_ready)
+
+	def __float__(self):
+		return float(self.value)
+
+	def __str__(self):
+		return "%s(%d): %s" % (self.__class__.__name__, self.n, self.value)
+
+	#pass the bar being added to the history
+	def update(self, b):
+		self.count += 1
+		self.push(float(getattr(b, self.field)))
+
+	#move the window on by one value
+	def push(self, x):
+		raise NotImplementedError
+
+	###
+	# the value after each bar of a BarSeries, nan where not ready
+	# takes the same arguments as the constructor. this runs an instance
+	# over the bars, subclasses do it over the columns where they can
+	@classmethod
+	def compute(cls, series, *args, **kw):
+		ind = cls(*args, **kw)
+		out = _empty(len(series))
+		for (i, b) in enumerate(series):
+			ind.update(b)
+			if ind.ready:
+				out[i] = ind.value
+		return out
+
+###
+# simple moving average
+#
+# the window sum is kept with a compensation term so adding and dropping
+# values over a long run doesn't drift from summing the window afresh
+###
+class SMA(Indicator):
+
+	def __init__(self, n, field='cl'):
+		Indicator.__init__(self, n, field)
+		self._win = collections.deque()
+		self._sum = 0.0
+		self._c = 0.0
+
+	def _add(self, x):
+		t = self._sum + x
+		if abs(self._sum) >= abs(x):
+			self._c += (self._sum - t) + x
+		else:
+			self._c += (x - t) + self._sum
+		self._sum = t
+
+	def push(self, x):
+		self._win.append(x)
+		self._add(x)
+		if len(self._win) > self.n:
+			self._add(-self._win.popleft())
+		if len(self._win) == self.n:
+			self.value = (self._sum + self._c) / self.n
+
+	@classmethod
+	def compute(cls, series, n, field='cl'):
+		return sma(getattr(series, field), n)
+
+###
+# exponential moving average, alpha defaults to 2/(n+1)
+# seeded with the average of the first n values
+###
+class EMA(Indicator):
+
+	def __init__(self, n, field='cl', alpha=None):
+		Indicator.__init__(self, n, field)
+		if alpha is None:
+			alpha = 2.0 / (n + 1)
+		self.alpha = alpha
+		self._seed = 0.0
+
+	def push(self, x):
+		if self.value is not None:
+			self.value += self.alpha * (x - self.value)
+			return
+		self._seed += x
+		if self.count == self.n:
+			self.value = self._seed / self.n
+
+	@classmethod
+	def compute(cls, series, n, field='cl', alpha=None):
+		return ema(getattr(series, field), n, alpha)
+
+###
+# rolling standard deviation, population (ddof=0) by default
+#
+# Welford's running mean and sum of squared deviations, with the value
+# leaving the window taken back out
+###
+class StdDev(Indicator):
+
+	def __init__(self, n, field='cl', ddof=0):
+		Indicator.__init__(self, n, field)
+		if n - ddof < 1:
+			raise ValueError("StdDev period %d too short for ddof %d" % (n, ddof))
+		self.ddof = ddof
+		self._win = collections.deque()
+		self._mean = 0.0
+		self._m2 = 0.0
+
+	def push(self, x):
+		self._win.append(x)
+		k = len(self._win)
+		if k > self.n:
+			y = self._win.popleft()
+			k -= 1
+			#replace y with x, the count stays the same
+			d = x - y
+			mean = self._mean + d / k
+			self._m2 += d * (x - mean + y - self._mean)
+			self._mean = mean
+		else:
+			d = x - self._mean
+			self._mean += d / k
+			self._m2 += d * (x - self._mean)
+		if k == self.n:
+			self.value = math.sqrt(max(self._m2, 0.0) / (k - self.ddof))
+
+	@classmethod
+	def compute(cls, series, n, field='cl', ddof=0):
+		return stdev(getattr(series, field), n, ddof)
+
+###
+# highest value over the last n bars
+#
+# keeps a deque of (index, value) with values decreasing, so the front
+# is the highest. each value goes on and comes off once
+###
+class Highest(Indicator):
+
+	def __init__(self, n, field='hi'):
+		Indicator.__init__(self, n, field)
+		self._q = collections.deque()
+
+	def _beats(self, x, y):
+		return x >= y
+
+	def push(self, x):
+		q = self._q
+		while q and self._beats(x, q[-1][1]):
+			q.pop()
+		q.append((self.count, x))
+		if q[0][0] <= self.count - self.n:
+			q.popleft()
+		if self.count >= self.n:
+			self.value = q[0][1]
+
+	@classmethod
+	def compute(cls, series, n, field='hi'):
+		return highest(getattr(series, field), n)
+
+class Lowest(Highest):
+
+	def __init__(self, n, field='lo'):
+		Highest.__init__(self, n, field)
+
+	def _beats(self, x, y):
+		return x <= y
+
+	@classmethod
+	def compute(cls, series, n, field='lo'):
+		return lowest(getattr(series, field), n)
+
+###
+# average true range, Wilder's smoothing
+#
+# the true range of the first bar is just its range, the first value is
+# the average of the first n true ranges
+###
+class ATR(Indicator):
+
+	def __init__(self, n):
+		Indicator.__init__(self, n, None)
+		self._prev = None
+		self._seed = 0.0
+
+	def update(self, b):
+		self.count += 1
+		(hi, lo, cl) = (float(b.hi), float(b.lo), float(b.cl))
+		if self._prev is None:
+			tr = hi - lo
+		else:
+			tr = max(hi, self._prev) - min(lo, self._prev)
+		self._prev = cl
+		self.push(tr)
+
+	def push(self, tr):
+		if self.value is not None:
+			self.value += (tr - self.value) / self.n
+			return
+		self._seed += tr
+		if self.count == self.n:
+			self.value = self._seed / self.n
+
+	@classmethod
+	def compute(cls, series, n):
+		return atr(series.hi, series.lo, series.cl, n)
+
+###
+# whole array versions
+#
+# each takes a column (numpy array, array.array or list of floats) and
+# gives back a float array the same length where out[i] is what the 
+# indicator above holds after the values up to and including i, and nan
+# before it is ready. nothing at i looks past i.
+###
+
+def _empty(n):
+	if np is None:
+		return array.array('d', [float('nan')]) * n
+	return np.full(n, np.nan)
+
+#run push() of an indicator over the values, for the recursive ones
+def _run(ind, x):
+	out = _empty(len(x))
+	for (i, v) in enumerate(x):
+		ind.count += 1
+		ind.push(float(v))
+		if ind.value is not None:
+			out[i] = ind.value
+	return out
+
+def sma(x, n):
+	if np is None or len(x) < n:
+		return _run(SMA(n), x)
+	x = np.asarray(x, dtype='float64')
+	out = _empty(len(x))
+	#window sums from a running sum taken relative to the first value,
+	#which keeps the running sum small
+	c = np.cumsum(x - x[0])
+	s = c[n-1:].copy()
+	s[1:] -= c[:-n]
+	out[n-1:] = s / n + x[0]
+	return out
+
+def ema(x, n, alpha=None):
+	return _run(EMA(n, alpha=alpha), x)
+
+#a (len - n + 1, n) strided view of the windows, no copy
+def _windows(x, n):
+	st = x.strides[0]
+	return np.lib.stride_tricks.as_strided(x, shape=(len(x) - n + 1, n), strides=(st, st))
+
+def stdev(x, n, ddof=0):
+	if n - ddof < 1:
+		raise ValueError("StdDev period %d too short for ddof %d" % (n, ddof))
+	if np is None or len(x) < n:
+		return _run(StdDev(n, ddof=ddof), x)
+	x = np.ascontiguousarray(x, dtype='float64')
+	out = _empty(len(x))
+	w = _windows(x, n)
+	#in blocks to bound the size of the temporaries
+	step = max(1, (1 << 20) // n)
+	for i in xrange(0, len(w), step):
+		out[n-1+i:n-1+i+step] = w[i:i+step].std(axis=1, ddof=ddof)
+	return out
+
+###
+# rolling max in O(1) per value (van Herk/Gil-Werman), the values are
+# cut into blocks of n. the max of the window ending at i is the max of
+# what's left of its first block (a suffix max) and what it covers of the
+# next (a prefix max)
+###
+def _rolling(x, n, acc):
+	x = np.asarray(x, dtype='float64')
+	m = len(x)
+	out = _empty(m)
+	if m < n:
+		return out
+	nb = (m + n - 1) // n
+	pad = np.empty(nb * n)
+	pad[:m] = x
+	pad[m:] = x[-1]
+	blocks = pad.reshape(nb, n)
+	pre = acc.accumulate(blocks, axis=1).ravel()
+	suf = acc.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].ravel()
+	out[n-1:] = acc(suf[:m-n+1], pre[n-1:m])
+	return out
+
+def highest(x, n):
+	if np is None:
+		return _run(Highest(n), x)
+	return _rolling(x, n, np.maximum)
+
+def lowest(x, n):
+	if np is None:
+		return _run(Lowest(n), x)
+	return _rolling(x, n, np.minimum)
+
+#true range of each bar, the first is just its range
+def true_range(hi, lo, cl):
+	if np is None:
+		return [float(h) - float(l) if i == 0 else 
+			max(float(h), float(cl[i-1])) - min(float(l), float(cl[i-1]))
+			for (i, (h, l)) in enumerate(zip(hi, lo))]
+	hi = np.asarray(hi, dtype='float64')
+	lo = np.asarray(lo, dtype='float64')
+	cl = np.asarray(cl, dtype='float64')
+	tr = hi - lo
+	if len(tr) > 1:
+		tr[1:] = np.maximum(hi[1:], cl[:-1]) - np.minimum(lo[1:], cl[:-1])
+	return tr
+
+def atr(hi, lo, cl, n):
+	ind = ATR(n)
+	#push() is the smoothing, the ranges are already done
+	return _run(ind, true_range(hi, lo, cl))
@@ -1,21 +1,25 @@
 from backtest import *
+from indicators import SMA
 
 class MABackTest(BackTest):
 
+	ma = 200 
+
+	def __init__(self, *args, **kw):
+		BackTest.__init__(self, *args, **kw)
+		#average of the closes before this bar, updated as bars are added
+		self.add_indicator('ma', SMA, self.ma)
 	
 	def bar_close(self, sym, b):
 
-		ma = 200 
-		if (len(self.bars[sym]) < ma):
+		close_ma = self.indicators[sym]['ma']
+		if not close_ma.ready:
 			return
 
 		# if price is above the ma, we want to be long
 		# if price is below the ma, we want to be out
 
-		#calculate the ma
-		close_ma = sum([x.cl for x in self.bars[sym][-ma:]])/ma
-
-		if b.cl > close_ma: #price is above ma, so make sure we are long
+		if float(b.cl) > close_ma.value: #price is above ma, so make sure we are long
 			if len(self.poslist.sym_open(sym)) == 0: #no open orders
 				base_size = self.equity / b.cl # how many shares we could buy	
 				odd_lot = base_size % 100 
@@ -52,6 +56,9 @@ if __name__ == '__main__':
 		idx = sym.find('.')
 		if idx != -1:
 			sym = sym[0:idx]	
+		if fname.endswith(BARFILE_EXT): #binary bar file, see csv2bars.py
+			bt.add_input(sym, fname)
+			continue
 		f = open(fname)
 		l = f.readline()
 		if l.find('Open,') == -1: #no header
@@ -59,6 +66,12 @@ if __name__ == '__main__':
 			t = Bar
 		else:
 			t = YahooBar
+			#straight from yahoo it's newest first, read it backwards
+			pos = f.tell()
+			(l1, l2) = (f.readline(), f.readline())
+			f.seek(pos)
+			if l2 and l1[:10] > l2[:10]:
+				f = ReverseFile(f)
 		bt.add_input(sym, f, t)
 
 	bt.run()
@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 
 import sys
+from backtest import ReverseFile
 
 if len(sys.argv) != 2:
 	print "usage: ./foo <file>"
@@ -8,12 +9,8 @@ if len(sys.argv) != 2:
 
 infile = sys.argv[1]
 
-f = open(infile, 'r')
-hdr = f.readline()
-lines = f.readlines()
-lines.reverse()
-print hdr,
-for l in lines:
-	print l,
-
-
+#streams the file backwards a block at a time, see ReverseFile
+f = ReverseFile(infile)
+sys.stdout.write(f.header)
+for l in f:
+	sys.stdout.write(l)
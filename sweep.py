@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+
+###
+# run a BackTest subclass over a grid of parameters on a process pool
+#
+#	results = sweep(MABackTest, {'ma': [50, 100, 200]}, ['SPY.csv'])
+#	print_table(results)
+#
+# or from the command line
+#
+#	./sweep.py maeg.MABackTest ma=50,100,200 SPY.csv
+#
+# the parameters are set as class attributes of a subclass made for each
+# job, so they are in place before __init__ runs (MABackTest registers
+# its SMA there). the inputs are loaded once, here, before the pool is
+# started and the workers are forked from this process, so they all read
+# the same columns rather than each parsing the files again.
+#
+# each row of the results is a dict of the parameters and the numbers
+# from BackTest.summary()
+###
+
+import sys
+import os
+import itertools
+import bisect
+import decimal
+import multiprocessing
+from backtest import *
+
+SUMMARY_KEYS = ('equity', 'max_equity', 'min_equity', 'nwin', 'nlos', 'nbe',
+	'win_rate', 'avg_win', 'avg_los', 'wl_rat', 'e')
+
+#SPY from data/daily_SPY.csv, as maeg.py names them
+def sym_from_path(fname):
+	sym = os.path.basename(fname).split('_')[-1]
+	idx = sym.find('.')
+	if idx != -1:
+		sym = sym[0:idx]
+	return sym
+
+###
+# load one input into a BarSeries, returns (sym, series)
+#
+# inp is a path, a (sym, path) or (sym, path, bartype) tuple or a
+# (sym, BarSeries). a csv with a yahoo header is read as YahooBar bars,
+# and put oldest first if it was newest first. compressed csvs are read
+# as they are, see open_input
+###
+def load_input(inp):
+
+	bartype = None
+	if isinstance(inp, basestring):
+		(sym, src) = (sym_from_path(inp), inp)
+	elif len(inp) == 2:
+		(sym, src) = inp
+	else:
+		(sym, src, bartype) = inp
+
+	if isinstance(src, BarSeries):
+		return (sym, src)
+	if src.endswith(BARFILE_EXT):
+		return (sym, open_bars(src, sym))
+
+	if bartype is None:
+		f = open_input(src)
+		l = f.readline()
+		f.close()
+		if l.find('Open,') == -1:
+			bartype = Bar
+		else:
+			bartype = YahooBar
+	return (sym, oldest_first(load_bars(src, sym, bartype)))
+
+###
+# the parameter combinations of a grid, a list of dicts
+# grid is a dict of name: values (taken in name order) or a list of
+# (name, values) pairs
+###
+def grid_params(grid):
+
+	if isinstance(grid, dict):
+		grid = sorted(grid.items())
+	names = [name for (name, vals) in grid]
+	for name in names:
+		if name in SUMMARY_KEYS:
+			raise ValueError("parameter name %s clashes with a summary column" % name)
+	return [dict(zip(names, vals)) for vals in itertools.product(*[v for (n, v) in grid])]
+
+#the bars of a series from start up to (not including) end, epoch seconds
+def window(s, start, end):
+	return s[bisect.bisect_left(s.date, start):bisect.bisect_left(s.date, end)]
+
+#what the workers run, set before the pool is forked
+_job = None
+
+#what of the inputs a span plays, warm up and all
+def _played(span):
+	if len(span) > 2:
+		return (span[2], span[1])
+	return span
+
+#a job is (params, span), span is None for the whole of the inputs, the
+#(start, end) to run them over, see window(), or (start, end, warm) to
+#play the bars from warm up to start first as a warm up, see trade_from
+def _run_job(job):
+
+	(params, span) = job
+	(cls, inputs, quiet, close) = _job
+	bt = type(cls.__name__, (cls,), dict(params))()
+	if span is not None and len(span) > 2:
+		bt.trade_from = ts2dt(span[0])
+	for (sym, s) in inputs:
+		if span is not None:
+			s = window(s, *_played(span))
+		bt.add_input(sym, s)
+
+	if quiet:
+		so = sys.stdout
+		sys.stdout = open(os.devnull, 'w')
+	try:
+		bt.run()
+		if close:
+			bt.poslist.close_all()
+	finally:
+		if quiet:
+			sys.stdout.close()
+			sys.stdout = so
+
+	row = dict(params)
+	row.update(bt.summary())
+	return row
+
+###
+# run the jobs over the loaded inputs on a pool, the rows in job order
+# processes is the size of the pool, None for one per cpu. with 1, or
+# only one job, it all runs in this process.
+###
+def run_jobs(cls, inputs, jobs, processes=None, quiet=True, close=True):
+
+	global _job
+
+	_job = (cls, inputs, quiet, close)
+	try:
+		if processes == 1 or len(jobs) < 2:
+			return [_run_job(j) for j in jobs]
+		if processes is None:
+			processes = multiprocessing.cpu_count()
+		pool = multiprocessing.Pool(min(processes, len(jobs)))
+		try:
+			rows = pool.map(_run_job, jobs, chunksize=1)
+		finally:
+			pool.terminate()
+			pool.join()
+		return rows
+	finally:
+		_job = None
+
+###
+# run cls with each combination of the grid over the inputs
+#
+# quiet throws away what the strategy prints, close closes what's still 
+# open at the end as maeg.py does before its summary. returns the rows 
+# in grid order
+###
+def sweep(cls, grid, inputs, processes=None, quiet=True, close=True):
+
+	jobs = [(p, None) for p in grid_params(grid)]
+	inputs = [load_input(inp) for inp in inputs]
+	return run_jobs(cls, inputs, jobs, processes, quiet, close)
+
+def _fmt(x):
+	if x is None:
+		return '-'
+	if isinstance(x, (decimal.Decimal, float, Ticks)):
+		return "%.2f" % x
+	return str(x)
+
+#print the results as a table, the parameters first
+def print_table(rows, out=None):
+
+	if out is None:
+		out = sys.stdout
+	if len(rows) == 0:
+		return
+	cols = sorted(k for k in rows[0] if k not in SUMMARY_KEYS) + list(SUMMARY_KEYS)
+	cells = [cols] + [[_fmt(r[c]) for c in cols] for r in rows]
+	widths = [max(len(r[i]) for r in cells) for i in xrange(len(cols))]
+	for r in cells:
+		out.write("  ".join(c.rjust(w) for (c, w) in zip(r, widths)) + "\n")
+
+#1 -> int, 1.5 -> float, anything else stays a string
+def _value(s):
+	for t in (int, float):
+		try:
+			return t(s)
+		except ValueError:
+			pass
+	return s
+
+if __name__ == '__main__':
+
+	if len(sys.argv) < 3:
+		print "usage: %s <module.Class> [name=v1,v2 ...] <input file> ..." % (sys.argv[0])
+		sys.exit(1)
+
+	(mod, name) = sys.argv[1].rsplit('.', 1)
+	cls = getattr(__import__(mod), name)
+	grid = []
+	inputs = []
+	for arg in sys.argv[2:]:
+		if '=' in arg:
+			(k, v) = arg.split('=', 1)
+			grid.append((k, [_value(x) for x in v.split(',')]))
+		else:
+			inputs.append(arg)
+
+	print_table(sweep(cls, grid, inputs))
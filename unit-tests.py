@@ -1,12 +1,36 @@
 import unittest
-from backtest import Bar
+import backtest
+from backtest import Bar, YahooBar
+from backtest import BarSeries, load_bars, write_bars, open_bars, ReverseFile, iter_lines
+from backtest import oldest_first, BARFILE_EXT
 from backtest import Order
 from backtest import OrderBook
 from backtest import Position
 from backtest import PositionList
 from backtest import BackTest
-from backtest import InvalidOrderException, InvalidStateException
-from datetime import datetime
+from backtest import Archive, PosStats, EquityCurve, Profiler
+from backtest import InvalidOrderException, InvalidStateException, InvalidBarException
+from backtest import D, ts2dt, dt2ts
+from backtest import Ticks, set_numbers, num
+from backtest import np
+from vector import run_vector, verify
+from sweep import sweep, grid_params, load_input, print_table, window
+from walkforward import walk_forward, windows
+from bench import gen_market, GridBackTest
+from indicators import Indicator, SMA, EMA, StdDev, Highest, Lowest, ATR
+from datetime import datetime, timedelta
+from StringIO import StringIO
+import os
+import sys
+import random
+import subprocess
+import decimal
+import tempfile
+import math
+import pickle
+import gzip
+import bz2
+import itertools
 
 class TestBarFunctions(unittest.TestCase):
 
@@ -70,6 +94,324 @@ class TestBarFunctions(unittest.TestCase):
 		self.assertTrue(b1.lo == bc.lo)
 		self.assertTrue(b1.cl == b2.cl)
 
+class TestBarSeries(unittest.TestCase):
+
+	def setUp(self):
+		self.sym = "ABC"
+		self.aEq = self.assertEqual
+		self.bars = [Bar(self.sym, l) for l in TestBarFunctions.raw_data.split('\n')]
+		self.bs = BarSeries(self.sym)
+		for b in self.bars:
+			self.bs.append(b)
+
+	def test_columns(self):
+		self.aEq(len(self.bs), 5)
+		self.aEq(list(self.bs.cl), [float(b.cl) for b in self.bars])
+		self.aEq(list(self.bs.close[-2:]), [float(b.cl) for b in self.bars[-2:]])
+		self.aEq(list(self.bs.hi), list(self.bs.high))
+
+	def test_rows(self):
+		#rows come back as Bars with the same decimal values
+		for b, r in zip(self.bars, self.bs):
+			self.aEq((b.date, b.symbol, b.op, b.hi, b.lo, b.cl), 
+				(r.date, r.symbol, r.op, r.hi, r.lo, r.cl))
+		self.aEq(self.bs[-1].cl, self.bars[-1].cl)
+		self.aEq([x.cl for x in self.bs[-3:]], [x.cl for x in self.bars[-3:]])
+		self.assertRaises(IndexError, self.bs.row, 5)
+
+	def test_blocks(self):
+		#iterating builds a block of bars at a time, the same as row()
+		bs = BarSeries(self.sym, maxlen=7)
+		for i in range(12):
+			bs.append(self.bars[i % 5])
+		key = lambda x: (x.date, x.symbol, x.op, x.hi, x.lo, x.cl)
+		rows = [key(bs.row(i)) for i in range(len(bs))]
+		self.aEq([key(x) for x in bs], rows)
+		self.aEq([key(x) for x in bs._iter(self.sym, 3)], rows)
+		self.aEq([x.symbol for x in bs._iter("XYZ")], ["XYZ"] * 7)
+
+	def test_view(self):
+		v = self.bs[-3:]
+		self.aEq(len(v), 3)
+		self.assertRaises(InvalidStateException, v.append, self.bars[0])
+		if np is not None:
+			#trailing windows share memory with the history
+			self.assertTrue(np.may_share_memory(self.bs.cl[-3:], self.bs.cl))
+			self.assertTrue(np.may_share_memory(v.cl, self.bs.cl))
+
+	def test_grow(self):
+		bs = BarSeries(self.sym, size=2)
+		for i in range(50):
+			bs.append(self.bars[i % 5])
+		self.aEq(len(bs), 50)
+		self.aEq(bs[49].cl, self.bars[4].cl)
+
+	def test_maxlen(self):
+		full = BarSeries(self.sym)
+		bs = BarSeries(self.sym, maxlen=3)
+		for i in range(20):
+			b = self.bars[i % 5]
+			full.append(b)
+			bs.append(b)
+			#the same as the end of the full history, whatever's been copied
+			self.aEq(len(bs), min(i + 1, 3))
+			self.aEq(bs.total, i + 1)
+			self.aEq(list(bs.cl), list(full.cl[-3:]))
+			self.aEq(bs[-1].cl, b.cl)
+			self.aEq([x.cl for x in bs[-2:]], [x.cl for x in full[-2:]])
+		self.aEq([x.cl for x in bs], [x.cl for x in full[-3:]])
+		self.aEq(bs[0].cl, full[-3].cl)
+		self.assertRaises(IndexError, bs.row, 3)
+		self.assertRaises(IndexError, bs.row, -4)
+		bs.extend([c[:4] for c in (full.date, full.op, full.hi, full.lo, full.cl)])
+		self.aEq((len(bs), bs.total), (3, 24))
+		self.aEq(list(bs.cl), list(full.cl[1:4]))
+		if np is not None:
+			#never more than twice maxlen
+			self.aEq(len(bs._cols[0]), 6)
+		self.assertRaises(ValueError, BarSeries, self.sym, maxlen=0)
+
+class TestLoadBars(unittest.TestCase):
+
+	yahoo_data = """Date,Open,High,Low,Close,Volume,Adj Close
+1999-01-04,123.37,125.22,121.72,123.03,9450400,102.70
+1999-01-05,122.94,124.87,122.94,124.44,8031000,103.87
+
+1999-01-06,125.81,127.75,125.75,127.00,7737700,106.38
+"""
+
+	def setUp(self):
+		self.aEq = self.assertEqual
+
+	def check(self, series, bars):
+		self.aEq(len(series), len(bars))
+		for b, r in zip(bars, series):
+			self.aEq((b.date, b.op, b.hi, b.lo, b.cl), (r.date, r.op, r.hi, r.lo, r.cl))
+			self.aEq(str(b), str(r))
+
+	def test_bar(self):
+		raw = TestBarFunctions.raw_data
+		bars = [Bar("ABC", l) for l in raw.split('\n')]
+		self.check(load_bars(StringIO(raw), "ABC"), bars)
+		#chunks smaller than a line
+		self.check(load_bars(StringIO(raw), "ABC", chunk_size=7), bars)
+
+	@unittest.skipIf(np is None, "needs numpy")
+	def test_yahoo(self):
+		lines = [l for l in self.yahoo_data.split('\n')[1:] if l]
+		bars = [YahooBar("SPY", l) for l in lines]
+		s = load_bars(StringIO(self.yahoo_data), "SPY", YahooBar)
+		self.check(s, bars)
+		self.aEq(s.prec, 2)
+		self.aEq(str(s[-1].cl), "127.00")
+
+	def test_slow_path(self):
+		#a bartype with its own __init__ is parsed a line at a time
+		class MyBar(YahooBar):
+			def __init__(self, sym, str):
+				YahooBar.__init__(self, sym, str)
+		lines = [l for l in self.yahoo_data.split('\n')[1:] if l]
+		self.check(load_bars(StringIO(self.yahoo_data), "SPY", MyBar), [YahooBar("SPY", l) for l in lines])
+
+	def test_mixed_places(self):
+		#the precision covers every line, not just the first
+		raw = "20010102-230000,X,1.5,1.5,1.5,1.5\n20010103-000000,X,1.5125,1.5225,1.4875,1.5125"
+		bars = [Bar("X", l) for l in raw.split('\n')]
+		s = load_bars(StringIO(raw), "X")
+		self.aEq([(b.op, b.hi, b.lo, b.cl) for b in s], [(b.op, b.hi, b.lo, b.cl) for b in bars])
+		#a later chunk with more places
+		self.aEq([b.cl for b in load_bars(StringIO(raw), "X", chunk_size=40)], [b.cl for b in bars])
+		if np is not None:
+			#bulk parsed, prices are given back with the most places seen
+			self.aEq(s.prec, 4)
+
+	def test_bad_line(self):
+		self.assertRaises(InvalidBarException, load_bars, StringIO("20010102-230000,EURUSD,0.9507\n"), "ABC")
+		#a line at a time too
+		class MyBar(Bar):
+			def __init__(self, sym, str):
+				Bar.__init__(self, sym, str)
+		for raw in ("20010102-230000,EURUSD,0.9507\n", "20010102-230000,EURUSD,x,1,1,1\n"):
+			self.assertRaises(InvalidBarException, load_bars, StringIO(raw), "ABC", MyBar)
+
+	def test_path(self):
+		#a path is closed once read
+		(fd, path) = tempfile.mkstemp(suffix='.csv')
+		os.write(fd, TestBarFunctions.raw_data)
+		os.close(fd)
+		files = []
+		def opener(p):
+			files.append(open(p, 'rb'))
+			return files[-1]
+		(old, backtest.open_input) = (backtest.open_input, opener)
+		try:
+			self.aEq(len(load_bars(path, "ABC")), 5)
+			self.aEq([f.closed for f in files], [True])
+			self.assertRaises(InvalidBarException, load_bars, path, "ABC", YahooBar)
+			self.aEq([f.closed for f in files], [True, True])
+		finally:
+			backtest.open_input = old
+			os.remove(path)
+
+	def test_run(self):
+		#a loaded series feeds the backtest the same bars as the file
+		got = []
+		class T(BackTest):
+			def bar_close(self, sym, b):
+				got.append((sym, b.date, b.cl))
+		bt = T()
+		bt.add_input("SPY", load_bars(StringIO(self.yahoo_data), "SPY", YahooBar))
+		bt.run()
+		self.aEq([x[2] for x in got], [D('123.03'), D('124.44'), D('127.00')])
+		self.aEq(got[0][0], "SPY")
+		self.aEq(len(bt.bars["SPY"]), 3)
+
+@unittest.skipIf(np is None, "needs numpy")
+class TestBarFile(unittest.TestCase):
+
+	def setUp(self):
+		self.aEq = self.assertEqual
+		(fd, self.path) = tempfile.mkstemp(suffix='.mbar')
+		os.close(fd)
+		self.series = load_bars(StringIO(TestLoadBars.yahoo_data), "SPY", YahooBar)
+
+	def tearDown(self):
+		os.remove(self.path)
+
+	def test_roundtrip(self):
+		write_bars(self.path, self.series)
+		s = open_bars(self.path)
+		self.aEq(s.symbol, "SPY")
+		self.aEq(s.bartype, YahooBar)
+		self.aEq(s.prec, 2)
+		self.aEq(len(s), 3)
+		self.aEq([str(b) for b in s], [str(b) for b in self.series])
+		#mapped read only
+		self.assertRaises(InvalidStateException, s.append, self.series[0])
+		self.assertRaises(ValueError, s.cl.__setitem__, 0, 1.0)
+
+	def test_csv2bars(self):
+		#newest first, as yahoo gives it, is written oldest first
+		d = tempfile.mkdtemp()
+		csv = os.path.join(d, "daily_SPY.csv")
+		lines = TestLoadBars.yahoo_data.strip().split('\n')
+		open(csv, 'w').write('\n'.join(lines[:1] + list(reversed(lines[1:]))) + '\n')
+		try:
+			out = subprocess.check_output([sys.executable, "csv2bars.py", csv],
+				cwd=os.path.dirname(os.path.abspath(__file__)))
+			s = open_bars(os.path.join(d, "daily_SPY" + BARFILE_EXT))
+			self.aEq(s.symbol, "SPY")
+			self.aEq([str(b) for b in s], [str(b) for b in self.series])
+			self.assertTrue(" 3 YahooBar bars for SPY" in out)
+		finally:
+			for f in os.listdir(d):
+				os.remove(os.path.join(d, f))
+			os.rmdir(d)
+		self.aEq(list(oldest_first(s[::-1]).date), list(s.date))
+		self.assertTrue(oldest_first(s) is s)
+
+	def test_bad_file(self):
+		open(self.path, 'wb').write("Date,Open\n")
+		self.assertRaises(InvalidBarException, open_bars, self.path)
+
+	def test_add_input(self):
+		write_bars(self.path, self.series)
+		closes = []
+		class T(BackTest):
+			def bar_close(self, sym, b):
+				closes.append((sym, str(b.cl)))
+		bt = T()
+		bt.add_input("XYZ", self.path)
+		bt.run()
+		self.aEq(closes, [("XYZ", "123.03"), ("XYZ", "124.44"), ("XYZ", "127.00")])
+
+class TestInputs(unittest.TestCase):
+
+	def setUp(self):
+		self.aEq = self.assertEqual
+		self.raw = TestBarFunctions.raw_data
+		self.closes = [l.split(',')[-1] for l in self.raw.split('\n')]
+		self.paths = []
+
+	def tearDown(self):
+		for p in self.paths:
+			os.remove(p)
+
+	def closes_of(self, inp):
+		seen = []
+		class T(BackTest):
+			def bar_close(self, sym, b):
+				seen.append(str(b.cl))
+		bt = T()
+		bt.add_input("EURUSD", inp)
+		bt.run()
+		return seen
+
+	def write(self, suffix, opener):
+		(fd, path) = tempfile.mkstemp(suffix=suffix)
+		os.close(fd)
+		self.paths.append(path)
+		f = opener(path, 'wb')
+		f.write("date,sym,op,hi,lo,cl\n" + self.raw + "\n")
+		f.close()
+		return path
+
+	def test_lines(self):
+		#blocks smaller than a line, a header and blank lines left out
+		f = StringIO("Date,Open\n\n" + self.raw.replace('\n', '\r\n\n'))
+		self.aEq(list(iter_lines(f, block_size=7)), self.raw.split('\n'))
+		self.aEq(list(iter_lines(iter(["a\n", " 1 \n", "2"]))), ["1", "2"])
+
+	def test_generators(self):
+		self.aEq(self.closes_of(l for l in self.raw.split('\n')), self.closes)
+		bars = [Bar("EURUSD", l) for l in self.raw.split('\n')]
+		self.aEq(self.closes_of(iter(bars)), self.closes)
+		self.aEq(self.closes_of(StringIO(self.raw)), self.closes)
+
+	def test_compressed(self):
+		for (suffix, opener) in (('.csv', open), ('.csv.gz', gzip.open), ('.csv.bz2', bz2.BZ2File)):
+			path = self.write(suffix, opener)
+			self.aEq(self.closes_of(path), self.closes)
+			self.aEq([str(b.cl) for b in load_bars(path, "EURUSD")], self.closes)
+			self.aEq(load_input(("EURUSD", path))[1].total, 5)
+
+class TestReverseFile(unittest.TestCase):
+
+	def setUp(self):
+		self.aEq = self.assertEqual
+		lines = TestLoadBars.yahoo_data.split('\n')
+		self.header = lines[0] + '\n'
+		self.lines = [l + '\n' for l in lines[1:] if l]
+		(fd, self.path) = tempfile.mkstemp()
+		os.write(fd, self.header + ''.join(reversed(self.lines)))
+		os.close(fd)
+
+	def tearDown(self):
+		os.remove(self.path)
+
+	def test_lines(self):
+		#blocks smaller than a line, blocks bigger than the file
+		for bs in (1, 5, 1<<20):
+			f = ReverseFile(self.path, block_size=bs)
+			self.aEq(f.header, self.header)
+			self.aEq(list(f), self.lines)
+			self.aEq(f.readline(), '')
+
+	def test_no_header(self):
+		#no trailing newline on the last line
+		open(self.path, 'w').write('c\nb\na')
+		self.aEq(list(ReverseFile(self.path, header=False, block_size=2)), ['a\n', 'b\n', 'c\n'])
+
+	def test_add_input(self):
+		seen = []
+		class T(BackTest):
+			def bar_close(self, sym, b):
+				seen.append(str(b.cl))
+		bt = T()
+		bt.add_input("SPY", ReverseFile(self.path), YahooBar)
+		bt.run()
+		self.aEq(seen, ["123.03", "124.44", "127.00"])
+
 class TestOrderObject(unittest.TestCase):
 
 	def setUp(self):
@@ -406,6 +748,85 @@ class TestOrderBookObject(unittest.TestCase):
 		self.ob.add(o3)
 		self.aEq([o3], self.ob.get_fills(b1))
 
+	def testSymActive(self):
+
+		o1 = Order(self.sym, dir=Order.BUY, type=Order.LIMIT, level=0.9551, size=1) 
+		o2 = Order("NOPE", dir=Order.BUY, type=Order.LIMIT, level=0.9551, size=1) 
+		o3 = Order(self.sym, dir=Order.SELL, type=Order.LIMIT, level=0.9600, size=-1) 
+		o1.trigger(o3)
+		self.ob.add(o1, o2, o3)
+		self.aEq(self.ob.sym_active(self.sym), [o1])
+		self.aEq(self.ob.sym_active("NOPE"), [o2])
+		self.aEq(self.ob.sym_active("PETE"), [])
+
+		#indexes follow fills and cancels
+		self.ob.fill(o1)
+		self.aEq(self.ob.sym_active(self.sym), [o3])
+		self.aEq(self.ob.filled, [o1.id])
+		self.ob.cancel(o2)
+		self.aEq(self.ob.sym_active("NOPE"), [])
+		self.aEq(self.ob.active, [o3.id])
+		self.aEq(self.ob.cancelled, [o2.id])
+		self.aEq(str(self.ob), "OrderBook: Active=1, Filled=1, Cancelled=1")
+
+	def testGetFillsNbars(self):
+
+		#every bar the book sees counts towards nbars, whatever its symbol
+		o1 = Order(self.sym, dir=Order.BUY, type=Order.LIMIT, level=0.9551, size=1) 
+		self.ob.add(o1)
+		b1 = Bar(self.sym, "20010102-230000,EURUSD,0.9507,0.9509,0.9505,0.9506")
+		b2 = Bar("NOPE", "20010102-230000,EURUSD,0.9507,0.9509,0.9505,0.9506")
+		self.ob.get_fills(b1)
+		self.ob.get_fills(b2)
+		self.ob.get_fills(b1)
+		self.aEq(o1.nbars, 3)
+		#not active yet, not counted
+		o2 = Order("NOPE", dir=Order.BUY, type=Order.LIMIT, level=0.9551, size=1) 
+		self.ob.add(o2)
+		self.ob.get_fills(b1)
+		self.aEq((o1.nbars, o2.nbars), (4, 1))
+
+	def testGetFillsRange(self):
+
+		#the sorted index gives the same fills, in the same order, as
+		#checking every active order
+		rnd = random.Random(7)
+		orders = []
+		for i in range(300):
+			lvl = D(rnd.randint(9400, 9600)) / 10000
+			t = rnd.choice([Order.LIMIT, Order.STOP, Order.LIMIT, Order.MARKET])
+			o = Order(rnd.choice([self.sym, "NOPE"]), dir=Order.BUY, type=t, level=lvl, size=1)
+			orders.append(o)
+		self.ob.add(orders)
+		for i in range(50):
+			lo = rnd.randint(9400, 9600)
+			hi = lo + rnd.randint(0, 40)
+			b = Bar(rnd.choice([self.sym, "NOPE"]), "20010102-230000,X,0.9500,0.%d,0.%d,0.9500" % (hi, lo))
+			fills = self.ob.get_fills(b)
+			self.aEq(fills, self.ob._get_fills_scan(b))
+			#move some orders, fill or cancel others
+			for o in rnd.sample(self.ob.sym_active(b.symbol), min(5, len(self.ob.sym_active(b.symbol)))):
+				o.level = D(rnd.randint(9400, 9600)) / 10000
+			for o in fills[:3]:
+				self.ob.fill(o)
+			for o in fills[3:6]:
+				self.ob.cancel(o)
+
+	def testRelevel(self):
+
+		#moving an active stop moves where it fills
+		sl = Order(self.sym, dir=Order.SELL, type=Order.STOP, level=0.9490, size=-1) 
+		b1 = Bar(self.sym, "20010102-230000,EURUSD,0.9507,0.9509,0.9500,0.9506")
+		self.ob.add(sl)
+		self.aEq([], self.ob.get_fills(b1))
+		sl.level = 0.9501
+		self.aEq([sl], self.ob.get_fills(b1))
+		self.aEq(sl.nbars, 2)
+		self.ob.fill(sl)
+		#no longer active, the book doesn't track it
+		sl.level = 0.9400
+		self.aEq(sl.nbars, 2)
+
 class TestPosition(unittest.TestCase):
 
 	def setUp(self):
@@ -447,6 +868,33 @@ class TestPosition(unittest.TestCase):
 
 		p = Position(self.sym, entry=1.0000, size=10000, exit=1.0001)
 		self.aT(isinstance(str(p), str))
+
+	def testSlots(self):
+
+		#no per object dict, and fields still convert once set up
+		b = Bar(self.sym, "20010102-230000,EURUSD,0.9507,0.9509,0.9505,0.9506")
+		o = Order(self.sym, Order.BUY, Order.LIMIT, level=0.95, size=100)
+		p = Position(self.sym, entry=0.95, size=100, exit=0.96)
+		for x in (b, o, p):
+			self.aT(not hasattr(x, '__dict__'))
+			self.aRaise(AttributeError, setattr, x, 'nosuchfield', 1)
+		self.aEq((o.level, o.nbars), (D('0.95'), 0))
+		self.aEq((p.entry, p.mark, p.size, p.exit), (D('0.95'), D('0.95'), 100, D('0.96')))
+		self.aRaise(InvalidOrderException, Order, self.sym, Order.BUY, Order.LIMIT, 0.95, -100)
+		#every protocol, shelve uses 0
+		y = YahooBar(self.sym, "1999-01-04,123.37,125.22,121.72,123.03,9450400,102.70")
+		for proto in (0, 1, 2):
+			q = pickle.loads(pickle.dumps(p, proto))
+			self.aEq((q.entry, q.size, q.exit, q.value), (p.entry, p.size, p.exit, 0))
+			for x in (b, y):
+				c = pickle.loads(pickle.dumps(x, proto))
+				self.aEq((type(c), c.date, c.symbol, c.op, c.hi, c.lo, c.cl), 
+					(type(x), x.date, x.symbol, x.op, x.hi, x.lo, x.cl))
+			c = pickle.loads(pickle.dumps(o, proto))
+			self.aEq((c.id, c.symbol, c.dir, c.type, c.level, c.size, c.nbars), 
+				(o.id, o.symbol, o.dir, o.type, o.level, o.size, o.nbars))
+		q = pickle.loads(pickle.dumps(p))
+		self.aEq(q.exit, p.exit)
  
 class TestPositionList(unittest.TestCase):
 
@@ -613,6 +1061,798 @@ class TestPositionList(unittest.TestCase):
 		self.aEq(self.pl.sym_open("PETE"), [])
 		self.aEq(self.pl.sym_open(None), [])
 
+	def testIndexes(self):
+
+		#pyramid into a lot of positions on two symbols
+		orders = []
+		ps = []
+		for i in range(200):
+			o = Order(self.sym if i % 2 else "NOPE", dir=Order.BUY, type=Order.MARKET, level=1.0000, size=1) 
+			orders.append(o)
+			ps.append(self.pl.add(o, datetime.now()))
+		self.aEq(self.pl.open, ps)
+		self.aEq(self.pl.sym_open(self.sym), ps[1::2])
+
+		#close some from the middle via linked orders, rewind others
+		for o in orders[50:60]:
+			c = Order(o.symbol, dir=Order.SELL, type=Order.MARKET, level=1.0001, size=-1, link=o.id)
+			self.pl.add(c, datetime.now())
+		for o in orders[60:70]:
+			self.pl.rewind(o.id)
+		self.aEq(self.pl.closed, ps[50:60])
+		self.aEq(self.pl.rewinded, ps[60:70])
+		self.aEq(self.pl.open, ps[:50] + ps[70:])
+		self.aEq(self.pl.sym_open("NOPE"), (ps[:50] + ps[70:])[::2])
+		self.aEq(self.pl.rewind(orders[60].id), None)
+		self.assertRaises(ValueError, self.pl.close, ps[50])
+
+		b1 = Bar(self.sym, "20010102-230000,EURUSD,0.9507,0.9509,0.9505,0.9506")
+		self.pl.mark(b1)
+		self.aEq([p.nbars for p in self.pl.sym_open(self.sym)][:2], [1, 1])
+		self.aEq([p.nbars for p in self.pl.sym_open("NOPE")][:2], [0, 0])
+
+	def testValueRunning(self):
+
+		#the running value matches summing every open position, it is
+		#exact and rounded once rather than rounded at each step
+		rnd = random.Random(3)
+		orders = []
+		syms = [self.sym, "NOPE", "PETE"]
+		for i in range(300):
+			r = rnd.random()
+			sym = rnd.choice(syms)
+			if r < 0.4 or len(self.pl.open) == 0:
+				sz = rnd.choice([-1, 1]) * rnd.randint(1, 1000)
+				o = Order(sym, dir=Order.BUY if sz > 0 else Order.SELL, type=Order.MARKET, 
+					level=D(rnd.randint(9000, 11000)) / 10000, size=sz) 
+				orders.append(o)
+				self.pl.add(o, datetime.now())
+			elif r < 0.7:
+				lvl = rnd.randint(9000, 11000)
+				self.pl.mark(Bar(sym, "20010102-230000,X,1.0,1.1,0.9,%d.%04d" % (lvl // 10000, lvl % 10000)))
+			elif r < 0.8:
+				self.pl.rewind(rnd.choice(orders).id)
+			elif r < 0.9:
+				self.pl.close(rnd.choice(self.pl.open))
+			else:
+				p = rnd.choice(self.pl.open)
+				p.mark = D(rnd.randint(9000, 11000)) / 10000
+			with decimal.localcontext(decimal.Context(prec=28)):
+				exact = self.pl._value_scan()
+			self.aEq(self.pl.value(), +exact)
+		self.assertTrue(len(self.pl.open) > 10)
+		self.assertTrue(len(self.pl.closed) > 10)
+
+	def testValueFlat(self):
+
+		#with floats the rounding left in a symbol's totals is dropped
+		#once it has nothing open, so it doesn't grow with the run
+		set_numbers('float')
+		try:
+			pl = PositionList()
+			rnd = random.Random(5)
+			syms = [self.sym, "NOPE"]
+			for i in range(2000):
+				sym = rnd.choice(syms)
+				if rnd.random() < 0.5:
+					sz = rnd.choice([-1, 1]) * rnd.randint(1, 1000)
+					pl.add(Order(sym, Order.BUY if sz > 0 else Order.SELL, Order.MARKET,
+						level=rnd.randint(9000, 11000) / 10000.0, size=sz), datetime.now())
+				else:
+					lvl = rnd.randint(9000, 11000)
+					pl.mark(Bar(sym, "20010102-230000,X,1.0,1.1,0.9,%d.%04d" % (lvl // 10000, lvl % 10000)))
+				if rnd.random() < 0.05:
+					for p in pl.sym_open(sym):
+						pl.close(p)
+					self.assertAlmostEqual(pl.value(), pl._value_scan(), 6)
+			pl.close_all()
+			self.aEq(pl.value(), 0)
+		finally:
+			set_numbers('decimal')
+
+	def testMarkNbars(self):
+
+		o1 = Order(self.sym, dir=Order.BUY, type=Order.MARKET, level=1.0000, size=10000) 
+		p1 = self.pl.add(o1, datetime.now())
+		b1 = Bar(self.sym, "20010102-230000,EURUSD,0.9507,0.9509,0.9505,0.9506")
+		self.pl.mark(b1)
+		self.pl.mark(b1)
+		self.aEq((p1.nbars, p1.mark), (2, b1.cl))
+		self.pl.close(p1)
+		#closed positions keep their last mark and count
+		self.pl.mark(Bar(self.sym, "20010102-230000,EURUSD,0.9507,0.9509,0.9505,0.9500"))
+		self.aEq((p1.nbars, p1.mark, p1.exit), (2, b1.cl, b1.cl))
+		self.aEq(self.pl.value(), 0)
+
+	def testRewindDup(self):
+
+		#the same order added twice, rewind takes the first
+		o1 = Order(self.sym, dir=Order.BUY, type=Order.MARKET, level=1.0000, size=10000) 
+		p1 = self.pl.add(o1, datetime.now())
+		p2 = self.pl.add(o1, datetime.now())
+		self.aEq(self.pl.rewind(o1.id), p1)
+		self.aEq(self.pl.rewind(o1.id), p2)
+		self.aEq(self.pl.open, [])
+
+class TestArchive(unittest.TestCase):
+
+	def setUp(self):
+		self.sym = "EURUSD"
+		self.aEq = self.assertEqual
+		(fd, self.path) = tempfile.mkstemp()
+		os.close(fd)
+
+	def tearDown(self):
+		os.remove(self.path)
+
+	def run_tp(self, bt):
+		#a filled sl/tp pair and a rewound one
+		b1 = Bar(self.sym, "20010102-230000,EURUSD,0.9507,0.9509,0.9505,0.9506")
+		b2 = Bar(self.sym, "20010103-230000,EURUSD,0.9507,0.9511,0.9505,0.9506")
+		b3 = Bar(self.sym, "20010104-230000,EURUSD,0.9507,0.9510,0.9499,0.9506")
+		for (bar, both) in ((b2, False), (b3, True)):
+			o1 = Order(self.sym, dir=Order.BUY, type=Order.MARKET, level=0.9505, size=10000) 
+			sl = Order(self.sym, dir=Order.SELL, type=Order.STOP, level=0.9499, size=-10000) 
+			tp = Order(self.sym, dir=Order.SELL, type=Order.LIMIT, level=0.9510, size=-10000) 
+			Order.OCO(sl, tp)
+			o1.trigger(sl, tp)
+			bt.book.add(o1, sl, tp)
+			bt.next_bar(self.sym, b1)
+			bt.next_bar(self.sym, bar)
+		return (o1, sl, tp)
+
+	def test_archive(self):
+		bt = BackTest(archive=self.path)
+		(o1, sl, tp) = self.run_tp(bt)
+		self.aEq(bt.equity, 100005)
+
+		#nothing finished is kept in memory
+		self.aEq(bt.book.filled, [])
+		self.aEq(bt.book.cancelled, [])
+		self.aEq(bt.poslist.closed, [])
+		self.aEq(bt.poslist.rewinded, [])
+		self.aEq(str(bt.book), "OrderBook: Active=0, Filled=3, Cancelled=3")
+		self.aEq((bt.poslist.stats.nwin, bt.poslist.stats.nrewound), (1, 1))
+
+		bt.archive.flush()
+		a = Archive.read(self.path)
+		orders = list(a.orders())
+		self.aEq(len(orders), 6)
+		o = [x for x in orders if x.id == sl.id][0]
+		self.aEq((o.symbol, o.state, o.type, o.dir, o.level, o.size, o.trigger_parent, o.cancel_parent),
+			(self.sym, Order.CANCELLED, Order.STOP, Order.SELL, sl.level, -10000, o1.id, tp.id))
+		closed = list(a.positions())
+		self.aEq(len(closed), 1)
+		self.aEq(closed[0].value, 5)
+		self.aEq(closed[0].dt, datetime(2001, 1, 2, 23))
+		rewound = list(a.positions(Archive.REWOUND))
+		self.aEq([p.order_id for p in rewound], [o1.id])
+		self.aEq(rewound[0].exit, None)
+		self.aEq(self.totals(PosStats(closed)), self.totals(bt.poslist.stats))
+
+	def test_run(self):
+		#a buy on the first bar closed on the third
+		def run():
+			bt = BackTest(archive=self.path)
+			seen = []
+			def bar_close(sym, b):
+				seen.append(b)
+				if len(seen) == 1:
+					bt.book.add(Order(sym, Order.BUY, Order.MARKET, level=b.cl, size=10000))
+				elif len(seen) == 3:
+					p = bt.poslist.sym_open(sym)[0]
+					bt.book.add(Order(sym, Order.SELL, Order.MARKET, level=b.cl, size=-p.size, link=p.order_id))
+			bt.bar_close = bar_close
+			bt.add_input(self.sym, StringIO(TestBarFunctions.raw_data))
+			bt.run()
+			return bt
+
+		#flushed at the end of the run
+		bt = run()
+		self.aEq(len(list(Archive.read(self.path).positions())), 1)
+		self.aEq(len(list(Archive.read(self.path).orders())), 2)
+		bt.close()
+		self.aEq(len(list(bt.archive.positions())), 1)
+		#a second run starts the file over
+		run().close()
+		self.aEq(len(list(Archive.read(self.path).positions())), 1)
+		#an Archive appends
+		bt = BackTest(archive=Archive(self.path))
+		bt.archive.write_position(Archive.read(self.path).positions().next(), Archive.CLOSED)
+		bt.close()
+		self.aEq(len(list(Archive.read(self.path).positions())), 2)
+
+	def test_no_archive(self):
+		#same totals when everything is kept
+		bt = BackTest()
+		self.run_tp(bt)
+		self.aEq(len(bt.poslist.closed), 1)
+		self.aEq(len(bt.poslist.rewinded), 1)
+		self.aEq(len(bt.book.filled), 3)
+		self.aEq(self.totals(PosStats(bt.poslist.closed)), self.totals(bt.poslist.stats))
+
+	def totals(self, st):
+		return (st.nwin, st.nlos, st.nbe, st.totwin, st.totlos)
+
+class TestEquityCurve(unittest.TestCase):
+
+	def setUp(self):
+		self.aEq = self.assertEqual
+		#hourly values over three days
+		self.vals = [(datetime(2001, 1, d, h), D(100000 + 10 * d + h)) for d in (2, 3, 4) for h in (1, 5, 9)]
+
+	def feed(self, eq):
+		for (dt, v) in self.vals:
+			eq.record(dt, v)
+		eq.finish()
+		return eq
+
+	def test_every_bar(self):
+		eq = self.feed(EquityCurve())
+		self.aEq(list(eq), self.vals)
+		self.aEq(eq[-1], self.vals[-1])
+		self.aEq(eq[1:3], self.vals[1:3])
+		self.aEq(list(eq.value), [float(v) for (d, v) in self.vals])
+
+	def test_eod(self):
+		eq = self.feed(EquityCurve(sample=EquityCurve.EOD))
+		self.aEq(list(eq), self.vals[2::3])
+
+	def test_every_n(self):
+		#every 4th, and the last one at the finish
+		eq = self.feed(EquityCurve(sample=4))
+		self.aEq(list(eq), [self.vals[0], self.vals[4], self.vals[8]])
+		eq = self.feed(EquityCurve(sample=3))
+		self.aEq(list(eq), [self.vals[0], self.vals[3], self.vals[6], self.vals[8]])
+
+	def test_sink(self):
+		(fd, path) = tempfile.mkstemp()
+		os.close(fd)
+		try:
+			eq = self.feed(EquityCurve(sample=EquityCurve.EOD, sink=path, binary=True, keep=False, flush_every=1))
+			self.aEq(len(eq), 0)
+			self.aEq(list(EquityCurve.read(path)), self.vals[2::3])
+
+			f = StringIO()
+			self.feed(EquityCurve(sink=f, keep=False))
+			self.aEq(f.getvalue().split('\n')[0], "2001-01-02 01:00:00,100021.0")
+		finally:
+			os.remove(path)
+
+	def test_backtest(self):
+		#set the curve you want before running
+		bt = BackTest()
+		bt.eqvals = EquityCurve(sample=EquityCurve.EOD)
+		bt.add_input("EURUSD", StringIO(TestBarFunctions.raw_data))
+		bt.run()
+		self.aEq([d for (d, v) in bt.eqvals], [datetime(2001, 1, 2, 23), datetime(2001, 1, 3, 3)])
+
+class TestIndicators(unittest.TestCase):
+
+	def setUp(self):
+		self.aEq = self.assertEqual
+		self.aAE = self.assertAlmostEqual
+		random.seed(12)
+		self.bars = []
+		cl = 100.0
+		for i in xrange(300):
+			op = cl
+			cl = round(op + random.uniform(-2, 2), 2)
+			hi = max(op, cl) + round(random.uniform(0, 1), 2)
+			lo = min(op, cl) - round(random.uniform(0, 1), 2)
+			self.bars.append(Bar.from_values("SYM", datetime(2001, 1, 1), op, hi, lo, cl))
+		self.cl = [float(b.cl) for b in self.bars]
+
+	#feed the bars, calling check(i, value) once the indicator is ready
+	def run_ind(self, ind, check):
+		for (i, b) in enumerate(self.bars):
+			ind.update(b)
+			if ind.ready:
+				check(i, ind.value)
+		self.assertTrue(ind.ready)
+
+	def testSMA(self):
+		n = 20
+		def check(i, v):
+			self.assertTrue(i >= n - 1)
+			self.aAE(v, sum(self.cl[i-n+1:i+1]) / n, 9)
+		self.run_ind(SMA(n), check)
+		self.assertRaises(ValueError, SMA, 0)
+
+	def testEMA(self):
+		n = 10
+		a = 2.0 / (n + 1)
+		ref = [sum(self.cl[:n]) / n]
+		for x in self.cl[n:]:
+			ref.append(ref[-1] + a * (x - ref[-1]))
+		self.run_ind(EMA(n), lambda i, v: self.aAE(v, ref[i-n+1], 9))
+
+	def testStdDev(self):
+		n = 15
+		def stdev(xs, ddof):
+			m = sum(xs) / len(xs)
+			return math.sqrt(sum((x - m) ** 2 for x in xs) / (len(xs) - ddof))
+		self.run_ind(StdDev(n), lambda i, v: self.aAE(v, stdev(self.cl[i-n+1:i+1], 0), 9))
+		self.run_ind(StdDev(n, ddof=1), lambda i, v: self.aAE(v, stdev(self.cl[i-n+1:i+1], 1), 9))
+
+	def testHighestLowest(self):
+		n = 7
+		hi = [float(b.hi) for b in self.bars]
+		lo = [float(b.lo) for b in self.bars]
+		self.run_ind(Highest(n), lambda i, v: self.aEq(v, max(hi[i-n+1:i+1])))
+		self.run_ind(Lowest(n), lambda i, v: self.aEq(v, min(lo[i-n+1:i+1])))
+		self.run_ind(Highest(n, 'cl'), lambda i, v: self.aEq(v, max(self.cl[i-n+1:i+1])))
+		self.run_ind(Highest(1), lambda i, v: self.aEq(v, hi[i]))
+
+	def testATR(self):
+		n = 14
+		trs = []
+		for (i, b) in enumerate(self.bars):
+			(h, l) = (float(b.hi), float(b.lo))
+			if i == 0:
+				trs.append(h - l)
+			else:
+				p = self.cl[i-1]
+				trs.append(max(h - l, abs(h - p), abs(l - p)))
+		ref = [sum(trs[:n]) / n]
+		for tr in trs[n:]:
+			ref.append((ref[-1] * (n - 1) + tr) / n)
+		self.run_ind(ATR(n), lambda i, v: self.aAE(v, ref[i-n+1], 9))
+
+	def testBackTest(self):
+
+		bt = BackTest()
+		seen = []
+		def bar_close(sym, b):
+			ma = bt.indicators[sym]['ma']
+			#the indicator covers the history, not the current bar
+			self.aEq(ma.count, len(bt.bars[sym]))
+			if ma.ready:
+				seen.append(ma.value)
+		bt.bar_close = bar_close
+		bt.add_input("EURUSD", StringIO(TestBarFunctions.raw_data))
+		bt.add_indicator('ma', SMA, 2)
+		bt.run()
+		cl = [float(l.split(',')[-1]) for l in TestBarFunctions.raw_data.split('\n')]
+		self.aEq(len(seen), len(cl) - 2)
+		for (i, v) in enumerate(seen):
+			self.aAE(v, (cl[i] + cl[i+1]) / 2, 9)
+		self.aEq(bt.indicators["EURUSD"]['ma'].count, len(cl))
+
+	def testCompute(self):
+
+		s = BarSeries("SYM")
+		for b in self.bars:
+			s.append(b)
+		for (cls, args) in [(SMA, (20,)), (SMA, (1,)), (EMA, (10,)), (StdDev, (15,)), 
+			(StdDev, (15, 'cl', 1)), (Highest, (7,)), (Lowest, (7,)), (Highest, (6, 'cl')), 
+			(ATR, (14,)), (SMA, (400,))]:
+			#the whole series at once against a bar at a time
+			v = list(cls.compute(s, *args))
+			ref = list(Indicator.compute.__func__(cls, s, *args))
+			self.aEq(len(v), len(ref))
+			for (x, y) in zip(v, ref):
+				if y != y:
+					self.assertTrue(x != x)
+				else:
+					self.aAE(x, y, 9)
+
+	def run_bt(self, data, pre, lookback=None):
+
+		bt = BackTest()
+		bt.lookback = lookback
+		seen = []
+		def bar_close(sym, b):
+			ma = bt.indicators[sym]['ma']
+			seen.append((b.date, ma.count, ma.value))
+		bt.bar_close = bar_close
+		if pre:
+			bt.add_input("EURUSD", load_bars(StringIO(data), "EURUSD"))
+			bt.precompute('ma', SMA, 2)
+		else:
+			bt.add_input("EURUSD", StringIO(data))
+			bt.add_indicator('ma', SMA, 2)
+		bt.run()
+		return seen
+
+	def testPrecompute(self):
+
+		#the saturday bar is skipped, the precomputed values must line up
+		data = TestBarFunctions.raw_data + """
+20010106-010000,EURUSD,0.9,0.9,0.9,0.9
+20010108-010000,EURUSD,0.9510,0.9512,0.9505,0.9511
+20010108-020000,EURUSD,0.9511,0.9513,0.9508,0.9509"""
+		ref = self.run_bt(data, False)
+		seen = self.run_bt(data, True)
+		self.aEq(len(seen), 7)
+		self.aEq([x[:2] for x in seen], [x[:2] for x in ref])
+		for ((d, c, v), (rd, rc, rv)) in zip(seen, ref):
+			if rv is None:
+				self.aEq(v, None)
+			else:
+				self.aAE(v, rv, 9)
+		self.aEq(seen[0][2], None)
+		self.aAE(seen[-1][2], (0.9503 + 0.9511) / 2, 9)
+		#they go by the count of bars, not how many are kept
+		self.aEq(self.run_bt(data, True, 1), seen)
+		self.aEq(self.run_bt(data, False, 1), ref)
+
+		#needs the whole series up front
+		bt = BackTest()
+		bt.add_input("EURUSD", StringIO(data))
+		bt.precompute('ma', SMA, 2)
+		self.assertRaises(InvalidStateException, bt.run)
+
+		#a symbol in more than one input, computed over them merged
+		lines = data.strip().split('\n')
+		parts = ['\n'.join(lines[0::2]), '\n'.join(lines[1::2])]
+		seen = []
+		for pre in (False, True):
+			bt = BackTest()
+			def bar_close(sym, b):
+				ma = bt.indicators[sym]['ma']
+				seen.append((b.date, ma.count, ma.value))
+			bt.bar_close = bar_close
+			for part in parts:
+				if pre:
+					bt.add_input("EURUSD", load_bars(StringIO(part), "EURUSD"))
+				else:
+					bt.add_input("EURUSD", StringIO(part))
+			if pre:
+				bt.precompute('ma', SMA, 2)
+			else:
+				bt.add_indicator('ma', SMA, 2)
+			bt.run()
+		self.aEq(len(seen), 14)
+		self.aEq(seen[:7], ref)
+		for ((d, c, v), (rd, rc, rv)) in zip(seen[7:], ref):
+			self.aEq((d, c), (rd, rc))
+			if rv is None:
+				self.aEq(v, None)
+			else:
+				self.aAE(v, rv, 9)
+
+@unittest.skipIf(np is None, "needs numpy")
+class TestVector(unittest.TestCase):
+
+	def setUp(self):
+		self.aEq = self.assertEqual
+		self.data = """20010104-000000,A,1.0,1.0,1.0,1.0
+20010105-000000,A,2.0,2.0,2.0,2.0
+20010106-000000,A,9.0,9.0,9.0,9.0
+20010108-000000,A,4.0,4.0,4.0,4.0
+20010109-000000,A,3.0,3.0,3.0,3.0
+20010110-000000,A,5.0,5.0,5.0,5.0"""
+		self.s = load_bars(StringIO(self.data), "A")
+
+	def testRun(self):
+
+		#the saturday's target is dropped with its bar
+		r = run_vector([("A", self.s)], {"A": [10, 0, 99, 0, -10, -10]})
+		self.aEq(len(r.trades), 1)
+		t = r.trades[0]
+		#bought at the first close, filled on the 5th, sold at the 5th's close
+		self.aEq((ts2dt(t['dt']), ts2dt(t['exit_dt']), t['entry'], t['exit'], t['size'], t['nbars']),
+			(datetime(2001, 1, 5), datetime(2001, 1, 8), 1.0, 2.0, 10.0, 1))
+		self.aEq(len(r.open), 1)
+		self.aEq((ts2dt(r.open[0]['dt']), r.open[0]['entry'], r.open[0]['size'], r.open[0]['value']),
+			(datetime(2001, 1, 10), 3.0, -10.0, -20.0))
+		self.aEq([(d.day, float(v)) for (d, v) in r.eqvals], 
+			[(4, 100000), (5, 100010), (6, 100010), (8, 100010), (9, 100010), (10, 99990)])
+		self.aEq((r.equity, r.max_equity, r.min_equity), (100010, 100010, 100000))
+		self.aEq((r.nwin, r.nlos), (1, 0))
+
+		r = run_vector([("A", self.s)], {"A": [10, 0, 99, 0, -10, -10]}, close=True)
+		self.aEq((len(r.trades), len(r.open), r.equity), (2, 0, 99990))
+		self.assertRaises(ValueError, run_vector, [("A", self.s)], {"A": [1]})
+
+	def testVerify(self):
+
+		self.aEq(verify([("A", self.s)], {"A": [10, 0, 99, 0, -10, -10]}), [])
+
+		#random walks and targets, flipping and resizing positions
+		random.seed(5)
+		inputs = []
+		targets = {}
+		for sym in ("X", "Y", "Z"):
+			(lines, cl) = ([], 50.0)
+			for d in xrange(400):
+				if random.random() < 0.1:
+					continue
+				cl = round(cl + random.uniform(-1, 1), 2)
+				dt = datetime(2001, 1, 1) + (datetime(2001, 1, 2) - datetime(2001, 1, 1)) * d
+				lines.append("%s,%s,%.2f,%.2f,%.2f,%.2f" % (dt.strftime("%Y%m%d-000000"), sym, cl, cl, cl, cl))
+			s = load_bars(StringIO("\n".join(lines)), sym)
+			inputs.append((sym, s))
+			tgt = []
+			for i in xrange(len(s)):
+				if i == 0 or random.random() < 0.2:
+					tgt.append(random.choice([0, 0, 10, 20, -10]))
+				else:
+					tgt.append(tgt[-1])
+			targets[sym] = tgt
+		self.aEq(verify(inputs, targets), [])
+		r = run_vector(inputs, targets)
+		self.assertTrue(len(r.trades) > 50)
+
+		#and it notices when they don't agree
+		self.assertTrue(len(verify(inputs, targets, tol=1e-9)) > 0)
+
+#buys size on the first bar, for the sweep tests
+class SizeBackTest(BackTest):
+
+	size = 100
+
+	def bar_close(self, sym, b):
+		if len(self.bars[sym]) == 0:
+			self.book.add(Order(sym, Order.BUY, Order.MARKET, level=b.cl, size=self.size))
+
+#buys once it has seen need bars
+class NeedBackTest(BackTest):
+
+	need = 6
+
+	def bar_close(self, sym, b):
+		if len(self.bars[sym]) == self.need:
+			self.book.add(Order(sym, Order.BUY, Order.MARKET, level=b.cl, size=100))
+
+class TestSweep(unittest.TestCase):
+
+	def setUp(self):
+		self.aEq = self.assertEqual
+		(fd, self.path) = tempfile.mkstemp(suffix='_EURUSD.csv')
+		os.write(fd, TestBarFunctions.raw_data)
+		os.close(fd)
+
+	def tearDown(self):
+		os.remove(self.path)
+
+	def testGrid(self):
+		self.aEq(grid_params({'b': [1, 2], 'a': ['x']}), [{'a': 'x', 'b': 1}, {'a': 'x', 'b': 2}])
+		self.aEq(grid_params([('b', [1]), ('a', [3, 4])]), [{'a': 3, 'b': 1}, {'a': 4, 'b': 1}])
+		self.aEq(grid_params({}), [{}])
+		self.assertRaises(ValueError, grid_params, {'equity': [1]})
+
+	def testLoadInput(self):
+		(sym, s) = load_input(self.path)
+		self.aEq(sym, "EURUSD")
+		self.aEq(len(s), 5)
+		self.aEq(load_input(("X", s)), ("X", s))
+
+	def testSweep(self):
+
+		grid = {'size': [100, 1000, 10000]}
+		rows = sweep(SizeBackTest, grid, [self.path], processes=1)
+		self.aEq([r['size'] for r in rows], [100, 1000, 10000])
+		for r in rows:
+			#filled at the second bar's open, closed at the last close
+			self.aEq(r['equity'], 100000 + D(r['size']) * (D('0.9503') - D('0.9506')))
+			self.aEq((r['nwin'], r['nlos']), (0, 1))
+			self.aEq(r['win_rate'], None)
+		#the class itself is left alone
+		self.aEq(SizeBackTest.size, 100)
+
+		#the same from the pool
+		self.aEq(sweep(SizeBackTest, grid, [self.path], processes=2), rows)
+
+		out = StringIO()
+		print_table(rows, out)
+		lines = out.getvalue().splitlines()
+		self.aEq(len(lines), 4)
+		self.aEq(lines[0].split()[:2], ['size', 'equity'])
+		self.aEq(lines[3].split()[:2], ['10000', '99997.00'])
+
+class TestWalkForward(unittest.TestCase):
+
+	def setUp(self):
+		self.aEq = self.assertEqual
+		lines = []
+		cl = 10.0
+		for d in xrange(40):
+			dt = datetime(2001, 1, 1) + (datetime(2001, 1, 2) - datetime(2001, 1, 1)) * d
+			if dt.weekday() >= 5:
+				continue
+			cl += (d % 7) - 3
+			lines.append("%s,A,%.2f,%.2f,%.2f,%.2f" % (dt.strftime("%Y%m%d-000000"), cl, cl, cl, cl))
+		self.s = load_bars(StringIO("\n".join(lines)), "A")
+		self.dates = [int(d) for d in self.s.date]
+
+	def testWindows(self):
+		self.aEq(windows(range(10), 4, 3), [(0, 4, 7), (3, 7, None)])
+		self.aEq(windows(range(10), 4, 3, 2), [(0, 4, 7), (2, 6, 9), (4, 8, None)])
+		self.aEq(windows(range(4), 4, 3), [])
+		self.assertRaises(ValueError, windows, range(10), 4, 0)
+
+	def testWalkForward(self):
+
+		cache = {}
+		inputs = [("A", self.s)]
+		grid = {'size': [100, 200]}
+		res = walk_forward(SizeBackTest, grid, inputs, 10, 5, processes=1, cache=cache)
+		self.aEq(len(res), 4)
+		#2 params in sample and a winner out of sample for each window
+		self.aEq(len(cache), 4 * 2 + 4)
+		for r in res:
+			span = (dt2ts(r['start']), dt2ts(r['mid']))
+			ins = sweep(SizeBackTest, grid, [("A", window(self.s, *span))], processes=1)
+			self.aEq(r['in_sample'], ins)
+			best = max(ins, key=lambda x: x['equity'])
+			self.aEq(r['params'], {'size': best['size']})
+			end = r['end'] and dt2ts(r['end']) or self.dates[-1] + 1
+			oos = sweep(SizeBackTest, {'size': [best['size']]}, [("A", window(self.s, span[1], end))], processes=1)
+			self.aEq(r['out_of_sample'], oos[0])
+		self.aEq(res[-1]['end'], None)
+
+		#a wider grid only runs the new params, and the results agree
+		before = dict(cache)
+		res2 = walk_forward(SizeBackTest, {'size': [100, 200, 150]}, inputs, 10, 5, processes=2, cache=cache)
+		#150 never wins, so the out of sample runs are the ones cached
+		self.aEq(len(cache) - len(before), 4)
+		for (k, v) in before.items():
+			self.aEq(cache[k], v)
+		for (r, r2) in zip(res, res2):
+			self.aEq(r['in_sample'], r2['in_sample'][:2])
+
+		#without a warm up the test windows are too short to ever trade
+		need = {'need': [6]}
+		wf = walk_forward(NeedBackTest, need, inputs, 10, 5, processes=1)
+		self.aEq([r['out_of_sample']['nwin'] + r['out_of_sample']['nlos'] for r in wf], [0] * 4)
+		wf = walk_forward(NeedBackTest, need, inputs, 10, 5, processes=1, warmup=6)
+		for r in wf[:-1]:
+			oos = r['out_of_sample']
+			self.aEq(oos['nwin'] + oos['nlos'] + oos['nbe'], 1)
+			#the same as playing the warm up by hand
+			mid = dt2ts(r['mid'])
+			i = self.dates.index(mid)
+			bt = NeedBackTest()
+			bt.trade_from = r['mid']
+			bt.add_input("A", window(self.s, self.dates[i - 6], dt2ts(r['end'])))
+			bt.run()
+			self.aEq(bt.eqvals[0][0], r['mid'])
+			self.aEq(len(bt.bars["A"]), 11)
+			bt.poslist.close_all()
+			self.aEq(oos['equity'], bt.summary()['equity'])
+		#in sample runs warm up too, from what there is before the window
+		for r in wf:
+			i = self.dates.index(dt2ts(r['start']))
+			bt = NeedBackTest()
+			if i > 0:
+				bt.trade_from = r['start']
+			bt.add_input("A", window(self.s, self.dates[max(0, i - 6)], dt2ts(r['mid'])))
+			bt.run()
+			bt.poslist.close_all()
+			self.aEq(r['in_sample'][0]['equity'], bt.summary()['equity'])
+		self.assertNotEqual([r['in_sample'] for r in wf[1:]],
+			[r['in_sample'] for r in walk_forward(NeedBackTest, need, inputs, 10, 5, processes=1)[1:]])
+		#or from a function of the params, or a lookback param
+		self.aEq(walk_forward(NeedBackTest, need, inputs, 10, 5, processes=1, warmup=lambda p: p['need']), wf)
+		lb = {'need': [6], 'lookback': [6]}
+		self.aEq(walk_forward(NeedBackTest, lb, inputs, 10, 5, processes=1),
+			walk_forward(NeedBackTest, lb, inputs, 10, 5, processes=1, warmup=6))
+
+		#and a shelve file works the same
+		(fd, path) = tempfile.mkstemp()
+		os.close(fd)
+		os.remove(path)
+		try:
+			res3 = walk_forward(SizeBackTest, grid, inputs, 10, 5, processes=1, cache=path)
+			self.aEq(res3, res)
+			res3 = walk_forward(SizeBackTest, grid, inputs, 10, 5, processes=1, cache=path)
+			self.aEq(res3, res)
+		finally:
+			for f in [path] + [path + ext for ext in ('.db', '.dat', '.dir', '.bak')]:
+				if os.path.exists(f):
+					os.remove(f)
+
+class TestNumbers(unittest.TestCase):
+
+	def setUp(self):
+		self.aEq = self.assertEqual
+
+	def tearDown(self):
+		set_numbers('decimal')
+
+	def testTicks(self):
+		T = Ticks
+		self.aEq(T('0.1') + T('0.2'), T('0.3'))
+		self.aEq(str(T('0.1') + T('0.25')), '0.35')
+		self.aEq(str(T('-0.05')), '-0.05')
+		self.aEq(str(T('1E+2')), '100')
+		self.aEq(str(T(1.5) - 2), '-0.5')
+		self.aEq(T('2.50') * 4, 10)
+		#as Decimal would, the quotient truncates and the remainder keeps the sign
+		self.aEq((T('-7.5') // 2, T('-7.5') % 2), (-3, T('-1.5')))
+		self.aEq(T(1) / 3, T('0.333333333333'))
+		self.aEq(str(T(200) / T('2.00')), '100')
+		#rounded half even past PLACES
+		self.aEq(T('0.0000005') * T('0.000001'), T('0.000000000000'))
+		self.aEq(T('0.0000015') * T('0.000001'), T('0.000000000002'))
+		self.aEq(T('1.25').rescale(1), T('1.2'))
+		self.aEq(T('1.35').rescale(1), T('1.4'))
+		self.assertTrue(T('0.95') < 1 and T('0.95') > 0.9 and T('0.95') < float('inf'))
+		self.assertFalse(T(1) == float('nan'))
+		self.aEq(T('1.0') == D('1'), True)
+		self.aEq(hash(T('3.00')), hash(3))
+		self.aEq("%.2f %d" % (T('1.005'), T('-2.7')), "1.00 -2")
+		self.aEq(pickle.loads(pickle.dumps(T('-1.25'))), T('-1.25'))
+		self.aRaise = self.assertRaises
+		self.aRaise(decimal.InvalidOperation, T, 'abc')
+		self.aRaise(ValueError, T, float('nan'))
+		self.aRaise(ZeroDivisionError, lambda: T(1) / 0)
+		#the rest of the operators a Decimal has
+		self.aEq(T('1.5') ** 2, T('2.25'))
+		self.aEq(str(T('1.5') ** 2), '2.25')
+		self.aEq(T(2) ** -2, T('0.25'))
+		self.aEq(T(4) ** T('0.5'), 2)
+		self.aEq(2 ** T(3), 8)
+		self.aEq(T('0.1') ** 13, 0)
+		self.aEq(7 // T('2.5'), 2)
+		self.aEq(divmod(T('-7.5'), 2), (-3, T('-1.5')))
+		self.aEq(divmod(7, T('2.5')), (2, T('2.0')))
+		self.aEq(divmod(D('-7.5'), D(2)), (D(-3), D('-1.5')))
+
+	def testPrecision(self):
+		l = "20010102-230000,USDJPY,114.125,114.135,114.115,114.13"
+		for (name, t) in (('decimal', decimal.Decimal), ('float', float), ('ticks', Ticks)):
+			set_numbers(name, {'USDJPY': 2})
+			b = Bar("USDJPY", l)
+			self.aEq(type(b.cl), t)
+			self.aEq([b.op, b.hi, b.lo, b.cl], [num(x) for x in ('114.12', '114.14', '114.12', '114.13')])
+			#other symbols are kept as given
+			self.aEq(Bar("X", l).op, num('114.125'))
+			o = Order("USDJPY", Order.BUY, Order.LIMIT, level='114.1', size=100)
+			self.aEq(type(o.level), t)
+		self.aEq(Bar("USDJPY", l).op.e, 2)
+		#bars from columns are rounded the same
+		for name in ('decimal', 'ticks'):
+			set_numbers(name, {'USDJPY': 2})
+			s = load_bars(StringIO(l), "USDJPY")
+			self.aEq([(b.op, b.hi, b.lo, b.cl) for b in (s[0], list(s)[0])],
+				[(num('114.12'), num('114.14'), num('114.12'), num('114.13'))] * 2)
+			self.aEq(str(s[0].hi), '114.14')
+		self.assertRaises(ValueError, set_numbers, 'quad')
+
+	def testBackends(self):
+		m = gen_market(2, 400)
+		res = {}
+		for name in ('decimal', 'float', 'ticks'):
+			set_numbers(name)
+			bt = GridBackTest()
+			for (sym, lines) in m:
+				bt.add_input(sym, StringIO("\n".join(lines)))
+			bt.run()
+			bt.poslist.close_all()
+			st = bt.poslist.stats
+			res[name] = (st.nwin, st.nlos, st.nbe, [(p.symbol, p.dt, str(p.entry)) for p in bt.poslist.closed])
+			self.assertTrue(all(isinstance(v, type(num(0))) for v in (bt.equity, bt.max_equity, st.totwin)))
+			res[name + '.equity'] = float(bt.equity)
+		#the grid's levels drift with floats, so only ticks trade the same
+		self.aEq(res['decimal'], res['ticks'])
+		self.assertTrue(len(res['float'][3]) > 10)
+		#decimal rounds to 6 digits along the way, ticks are exact
+		self.assertTrue(abs(res['decimal.equity'] - res['ticks.equity']) < 1)
+
+class TestBench(unittest.TestCase):
+
+	def testGenerator(self):
+		m = gen_market(2, 300)
+		self.assertEqual(m, gen_market(2, 300))
+		self.assertNotEqual(m[0][1], m[1][1])
+		bars = [Bar(sym, l) for (sym, lines) in m for l in lines]
+		self.assertEqual(len(bars), 600)
+		self.assertTrue(all(b.date.weekday() < 5 and b.lo <= min(b.op, b.cl) and b.hi >= max(b.op, b.cl) for b in bars))
+
+	def testGrid(self):
+		bt = GridBackTest()
+		(bt.norders, bt.npos) = (4, 3)
+		for (sym, lines) in gen_market(2, 500):
+			bt.add_input(sym, StringIO("\n".join(lines)))
+		bt.run()
+		for sym in ("S000", "S001"):
+			self.assertEqual(len([o for o in bt.book.sym_active(sym) if o.type == Order.LIMIT]), 4)
+			self.assertTrue(len(bt.poslist.sym_open(sym)) <= 4)
+		self.assertTrue(len(bt.poslist.closed) > 10)
+
 class TestBackTest(unittest.TestCase):
 
 	def setUp(self):
@@ -629,6 +1869,41 @@ class TestBackTest(unittest.TestCase):
 	def bar_close(self, sym, b):
 		print "bar_close: ", b.date
 
+	def testTimeframes(self):
+
+		data = []
+		for d in (2, 3, 4, 6):
+			for h in (8, 12, 16, 20):
+				x = d * 10 + h
+				data.append("200101%02d-%02d0000,EURUSD,%d,%d,%d,%d" % (d, h, x, x + 5, x - 5, x + 1))
+		seen = []
+		class TFBackTest(BackTest):
+			def bar_close(self, sym, b):
+				seen.append(('bar', b.date, len(self.tf_bars['D'].get(sym, []))))
+			def bar_close_D(self, sym, b):
+				seen.append(('D', b.date, b.op, b.hi, b.lo, b.cl, len(self.bars[sym])))
+		bt = TFBackTest()
+		bt.add_timeframe('D', timedelta(days=1))
+		h8 = []
+		bt.add_timeframe('8h', 8 * 3600, cb=lambda sym, b: h8.append((b.date, b.op, b.cl)))
+		self.aRaise(InvalidStateException, bt.add_timeframe, 'W', timedelta(weeks=1))
+		bt.add_input(self.sym, StringIO("\n".join(data)))
+		bt.run()
+
+		days = [x for x in seen if x[0] == 'D']
+		#the saturday is skipped, the last day closes when the data ends
+		self.aEq([x[1] for x in days], [datetime(2001, 1, d) for d in (2, 3, 4)])
+		self.aEq(days[0][2:], (28, 45, 23, 41, 4))
+		#the day closes before the next day's first bar is seen
+		i = seen.index(days[1])
+		self.aEq((seen[i - 1][1], seen[i + 1][1:]), (datetime(2001, 1, 3, 20), (datetime(2001, 1, 4, 8), 2)))
+		self.aEq(len(bt.tf_bars['D'][self.sym]), 3)
+		self.aEq(bt.tf_bars['D'][self.sym][2].cl, 61)
+		#the bars played are left alone
+		self.aEq([(b.op, b.cl) for b in bt.bars[self.sym]][:2], [(28, 29), (32, 33)])
+		self.aEq(h8[:3], [(datetime(2001, 1, 2, 8), 28, 33), (datetime(2001, 1, 2, 16), 36, 41),
+			(datetime(2001, 1, 3, 8), 38, 43)])
+
 	def testAddSym(self):
 		
 		f = "yo" 
@@ -636,6 +1911,137 @@ class TestBackTest(unittest.TestCase):
 		self.aEq([(self.sym, f, Bar)], self.bt.inputs)
 		self.aEq(self.bt.bars.keys(), [self.sym])
 
+	def testMerge(self):
+
+		#inputs with gaps are played in date order until all are done
+		a = """20010102-010000,A,1.0,1.0,1.0,1.0
+20010102-020000,A,2.0,2.0,2.0,2.0
+20010102-040000,A,4.0,4.0,4.0,4.0
+20010102-050000,A,5.0,5.0,5.0,5.0"""
+		b = """20010102-020000,B,2.5,2.5,2.5,2.5
+20010102-030000,B,3.5,3.5,3.5,3.5"""
+		seen = []
+		class T(BackTest):
+			def bar_close(self, sym, b):
+				seen.append((b.date.hour, sym))
+		bt = T()
+		bt.add_input("A", StringIO(a))
+		bt.add_input("B", StringIO(b))
+		bt.run()
+		self.aEq(seen, [(1, "A"), (2, "A"), (2, "B"), (3, "B"), (4, "A"), (5, "A")])
+		#one equity value per date
+		self.aEq([d.hour for (d, v) in bt.eqvals], [1, 2, 3, 4, 5])
+
+	def testRunBySymbol(self):
+
+		#each symbol trades on its own, so the merged run matches run()
+		random.seed(3)
+		data = {}
+		for sym in ("A", "B", "C"):
+			(lines, cl) = ([], 100.0)
+			for h in xrange(300):
+				if random.random() < 0.2:
+					continue
+				dt = datetime(2001, 1, 1) + (datetime(2001, 1, 1, 1) - datetime(2001, 1, 1)) * h
+				op = cl
+				cl = round(op + random.uniform(-1, 1), 2)
+				lines.append("%s,%s,%.2f,%.2f,%.2f,%.2f" % (dt.strftime("%Y%m%d-%H0000"), sym, 
+					op, max(op, cl) + 0.5, min(op, cl) - 0.5, cl))
+			data[sym] = "\n".join(lines)
+
+		class T(BackTest):
+			def __init__(self):
+				BackTest.__init__(self)
+				(self.opened, self.closes) = ([], [])
+			def on_open(self, p):
+				self.opened.append(p.order_id)
+			def on_close(self, p):
+				self.closes.append((p.order_id, self.equity))
+			def bar_close(self, sym, b):
+				ps = self.poslist.sym_open(sym)
+				if len(ps) == 0:
+					if len(self.bars[sym]) % 3 == 0:
+						self.book.add(Order(sym, Order.BUY, Order.MARKET, level=b.cl, size=100))
+				elif ps[0].nbars >= 2:
+					self.book.add(Order(sym, Order.SELL, Order.MARKET, level=b.cl, size=-100, link=ps[0].order_id))
+
+		def run(par, trade_from=None):
+			bt = T()
+			bt.trade_from = trade_from
+			for sym in ("A", "B", "C"):
+				bt.add_input(sym, StringIO(data[sym]))
+			if par:
+				bt.run_by_symbol(processes=2)
+			else:
+				bt.run()
+			return bt
+
+		(a, b) = (run(False), run(True))
+		self.aEq(list(a.eqvals), list(b.eqvals))
+		self.assertTrue(len(a.poslist.closed) > 50)
+		self.aEq([(p.symbol, p.dt, p.entry, p.exit) for p in a.poslist.closed], 
+			[(p.symbol, p.dt, p.entry, p.exit) for p in b.poslist.closed])
+		self.aEq((a.equity, a.max_equity, a.min_equity), (b.equity, b.max_equity, b.min_equity))
+		self.aEq(a.summary(), b.summary())
+		self.aEq([len(a.bars[s]) for s in "ABC"], [len(b.bars[s]) for s in "ABC"])
+		self.aEq([(p.symbol, p.mark) for p in a.poslist.open], [(p.symbol, p.mark) for p in b.poslist.open])
+		self.aEq(a.poslist.value(), b.poslist.value())
+		#on_close is replayed once per close, in order, on_open isn't
+		self.aEq(len(b.closes), len(a.closes))
+		self.aEq([e for (i, e) in b.closes], [e for (i, e) in a.closes])
+		self.aEq([i for (i, e) in b.closes], [p.order_id for p in b.poslist.closed])
+		self.aEq(len(a.opened), len(a.closes) + len(a.poslist.open))
+		self.aEq(b.opened, [])
+		#order ids stay unique
+		ids = [p.order_id for p in b.poslist.closed]
+		self.aEq(len(ids), len(set(ids)))
+		self.assertTrue(Order(self.sym).id > max(ids))
+
+		a.poslist.close_all()
+		b.poslist.close_all()
+		self.aEq(a.equity, b.equity)
+
+		#a warm up is left out of the merged curve as well
+		(a, b) = (run(False, datetime(2001, 1, 8)), run(True, datetime(2001, 1, 8)))
+		self.assertTrue(len(a.eqvals) > 0)
+		self.aEq(list(a.eqvals), list(b.eqvals))
+		self.assertTrue(a.eqvals[0][0] >= datetime(2001, 1, 8))
+		self.aEq(a.summary(), b.summary())
+
+	def testProfiler(self):
+
+		#a clock that ticks once a call
+		ticks = itertools.count()
+		prof = Profiler(clock=lambda: float(next(ticks)))
+		self.bt.profiler = prof
+		self.bt.book.add(Order(self.sym, Order.BUY, Order.MARKET, level=D('0.95'), size=100))
+		self.bt.add_input(self.sym, StringIO(TestBarFunctions.raw_data))
+		self.bt.run()
+
+		r = prof.report()
+		self.aEq(r['bars'], 5)
+		for k in ('merge', 'get_fills', 'mark', 'bar_close', 'history'):
+			self.aEq(r['phases'][k]['calls'], 5)
+		self.aEq(r['phases']['pos_add']['calls'], 1)
+		self.aEq(r['phases']['book_fill']['calls'], 1)
+		self.assertFalse('oco' in r['phases'])
+		#one eqvals per date change and one at the end
+		self.aEq(r['phases']['eqvals']['calls'], 5)
+		self.aEq(sum(n for (b, n) in r['bar_close_hist']), 5)
+		#each bar_close is one tick
+		self.aEq(r['bar_close_hist'][-2:], [(1.0, 5), (float('inf'), 0)])
+		self.assertAlmostEqual(sum(p['share'] for p in r['phases'].itervalues()), 1.0)
+		self.aEq(r['bars_per_sec'], 5 / r['elapsed'])
+		self.assertTrue(str(prof).startswith("5 bars in"))
+
+		prof.reset()
+		self.aEq((prof.nbars, len(prof.report()['phases'])), (0, 0))
+
+	def testRunEmpty(self):
+		self.bt.add_input(self.sym, StringIO(""))
+		self.bt.run()
+		self.aEq(len(self.bt.eqvals), 0)
+
 	def testBuyMarket(self):
 
 		b1 = Bar(self.sym, "20010102-230000,EURUSD,0.9507,0.9509,0.9505,0.9506")
@@ -805,6 +2211,41 @@ class TestBackTest(unittest.TestCase):
 
 		self.aEq(self.bt.equity, 100000) 
 
+	def testDrillDown(self):
+
+		#as testOpenRewind, but with hourly bars to look inside the 4 hour one
+		fine = """20010103-000000,EURUSD,0.9506,0.9506,0.9502,0.9503
+20010103-010000,EURUSD,0.9503,%s
+20010103-020000,EURUSD,0.9506,0.9506,0.9498,0.9500
+20010103-030000,EURUSD,0.9500,0.9504,0.9500,0.9503
+20010103-040000,EURUSD,0.9503,0.9520,0.9480,0.9503"""
+		b0 = Bar(self.sym, "20010102-200000,EURUSD,0.9507,0.9508,0.9504,0.9506")
+		b1 = Bar(self.sym, "20010103-000000,EURUSD,0.9506,0.9511,0.9498,0.9503")
+		for (hour1, res) in (("0.9511,0.9503,0.9506", 'tp'), ("0.9511,0.9499,0.9506", 'both'), (None, 'none')):
+			bt = BackTest()
+			if hour1 is not None:
+				bt.add_detail(self.sym, StringIO(fine % hour1), timedelta(hours=4))
+			o1 = Order(self.sym, dir=Order.BUY, type=Order.MARKET, level=0.9505, size=10000) 
+			sl = Order(self.sym, dir=Order.SELL, type=Order.STOP, level=0.9499, size=-10000) 
+			tp = Order(self.sym, dir=Order.SELL, type=Order.LIMIT, level=0.9510, size=-10000) 
+			Order.OCO(sl, tp)
+			o1.trigger(sl, tp)
+			bt.book.add(o1, sl, tp)
+			bt.next_bar(self.sym, b0)
+			bt.next_bar(self.sym, b1)
+			self.aEq(len(bt.poslist.open), 0)
+			self.aEq(len(bt.book.active), 0)
+			if res == 'tp':
+				#the take profit was hit in the second hour, before the stop
+				self.aEq((len(bt.poslist.closed), len(bt.poslist.rewinded)), (1, 0))
+				self.aEq(bt.poslist.closed[0].exit, D('0.9510'))
+				self.aEq(bt.equity, 100005)
+				self.aEq((sl.state, tp.state), (Order.CANCELLED, Order.FILLED))
+			else:
+				#an hour hitting both, or no hours at all, can't tell
+				self.aEq((len(bt.poslist.closed), len(bt.poslist.rewinded)), (0, 1))
+				self.aEq(bt.equity, 100000)
+
 	def testOpenRewind(self):
 		
 		#in this case we have a sl/tp, and get a bar which triggers them both
@@ -0,0 +1,293 @@
+###
+# vectorized backtests of target position arrays
+#
+# for strategies that only trade market orders, what BackTest.run()
+# does comes down to: the order placed in bar_close of bar t is filled
+# on bar t+1 at bar t's close. so given, per symbol, the position wanted
+# after each bar (target[t]), the position held through bar t is
+# target[t-1] and the bar's profit is pos[t] * (cl[t] - cl[t-1]). the
+# whole run is then a few numpy passes over the columns, no Order,
+# OrderBook or PositionList objects, which is what you want to screen
+# thousands of variants.
+#
+#	s = load_bars('SPY.csv', 'SPY', YahooBar)
+#	ma = SMA.compute(s, 200)
+#	tgt = np.where(s.cl > ma, 100, 0)
+#	r = run_vector([('SPY', s)], {'SPY': tgt})
+#	print r.summary()
+#
+# a trade is a run of bars with the same non zero position, when the
+# target changes the open trade is closed and a new one opened (as
+# SignalBackTest does with orders). targets line up with the rows of
+# each series, rows that fall on weekends are dropped as next_bar skips
+# them, along with their targets.
+#
+# verify() runs the same targets through SignalBackTest, the event
+# driven version, and lists any differences.
+###
+
+from backtest import *
+
+#the fields of VectorResult.trades and .open
+TRADE_DTYPE = [('sym', 'int32'), ('dt', 'int64'), ('exit_dt', 'int64'), ('entry', 'float64'),
+	('exit', 'float64'), ('size', 'float64'), ('value', 'float64'), ('nbars', 'int64')]
+
+def _weekday_rows(series):
+	return (np.asarray(series.date) // 86400 + 3) % 7 < 5
+
+###
+# the trades of one symbol's positions
+# cl and dates are the weekday rows, pos[t] the position through bar t
+# returns (closed, open) as TRADE_DTYPE arrays, the open ones are valued
+# at the last close and have exit_dt -1 and exit nan
+###
+def _trades(k, cl, dates, pos):
+
+	#pos[0] is always 0, nothing is held before the first bar
+	n = len(pos)
+	ch = np.flatnonzero(pos[1:] != pos[:-1]) + 1
+	opens = ch[pos[ch] != 0]
+	closes = ch[pos[ch - 1] != 0]
+	nc = len(closes)
+
+	t = np.zeros(nc, dtype=TRADE_DTYPE)
+	a = opens[:nc]
+	t['sym'] = k
+	t['dt'] = dates[a]
+	t['exit_dt'] = dates[closes]
+	t['entry'] = cl[a - 1]
+	t['exit'] = cl[closes - 1]
+	t['size'] = pos[a]
+	t['value'] = (t['exit'] - t['entry']) * t['size']
+	t['nbars'] = closes - a
+
+	o = np.zeros(len(opens) - nc, dtype=TRADE_DTYPE)
+	a = opens[nc:]
+	o['sym'] = k
+	o['dt'] = dates[a]
+	o['exit_dt'] = -1
+	o['entry'] = cl[a - 1]
+	o['exit'] = np.nan
+	o['size'] = pos[a]
+	o['value'] = (cl[-1] - o['entry']) * o['size']
+	o['nbars'] = n - a
+	return (t, o)
+
+###
+# the result of run_vector
+#
+# trades are the closed trades in the order BackTest would close them
+# (exit date, then input order), open the ones still open, sym in both
+# is an index into syms. eqvals is an EquityCurve with a value for
+# every date of the inputs, as run() records them.
+###
+class VectorResult(object):
+
+	def __init__(self, syms, equity, trades, open, dates, values):
+		self.syms = syms
+		self.start_equity = equity
+		self.trades = trades
+		self.open = open
+		self.eqvals = EquityCurve.from_arrays(dates, values)
+
+		eq = equity + np.cumsum(trades['value'])
+		self.equity = eq[-1] if len(eq) else equity
+		self.max_equity = max(equity, eq.max()) if len(eq) else equity
+		self.min_equity = min(equity, eq.min()) if len(eq) else equity
+
+		v = trades['value']
+		self.nwin = int((v > 0).sum())
+		self.nlos = int((v < 0).sum())
+		self.nbe = int((v == 0).sum())
+		self.totwin = v[v > 0].sum()
+		self.totlos = v[v < 0].sum()
+
+	def __str__(self):
+		return "VectorResult: %d trades %d open, equity %.2f" % (len(self.trades),
+			len(self.open), self.equity)
+
+	#the same numbers as BackTest.summary(), as floats
+	def summary(self):
+
+		(nwin, nlos, nbe) = (self.nwin, self.nlos, self.nbe)
+		s = {'equity': self.equity, 'max_equity': self.max_equity,
+			'min_equity': self.min_equity, 'nwin': nwin, 'nlos': nlos,
+			'nbe': nbe, 'win_rate': None, 'avg_win': None, 'avg_los': None,
+			'wl_rat': None, 'e': None}
+		if nwin == 0 or nlos == 0:
+			return s
+
+		tot_pos = float(nwin + nlos + nbe)
+		pos_won = nwin / tot_pos
+		pos_los = nlos / tot_pos
+		avg_win = self.totwin / nwin
+		avg_los = self.totlos / nlos
+		s['win_rate'] = pos_won
+		s['avg_win'] = avg_win
+		s['avg_los'] = avg_los
+		s['wl_rat'] = avg_win / abs(avg_los)
+		s['e'] = avg_win * pos_won + avg_los * pos_los
+		return s
+
+###
+# run target position arrays over the inputs
+#
+# inputs is a list of (sym, BarSeries), targets a dict of sym: array
+# the same length as its series. with close=True trades still open at
+# the end are closed at the last close, as poslist.close_all() would.
+###
+def run_vector(inputs, targets, equity=100000, close=False):
+
+	if np is None:
+		raise ImportError("run_vector needs numpy")
+
+	syms = []
+	trades = []
+	opens = []
+	curves = []
+	last = []
+	for (k, (sym, s)) in enumerate(inputs):
+		tgt = np.asarray(targets[sym], dtype='float64')
+		if len(tgt) != len(s):
+			raise ValueError("%s: %d targets for %d bars" % (sym, len(tgt), len(s)))
+		keep = _weekday_rows(s)
+		dates = np.asarray(s.date)[keep]
+		if (np.diff(dates) < 0).any():
+			raise ValueError("%s: bars are not in date order" % sym)
+		cl = np.asarray(s.cl, dtype='float64')[keep]
+		tgt = tgt[keep]
+
+		pos = np.zeros(len(tgt))
+		pos[1:] = tgt[:-1]
+		pnl = np.zeros(len(tgt))
+		pnl[1:] = pos[1:] * (cl[1:] - cl[:-1])
+		(t, o) = _trades(k, cl, dates, pos)
+
+		syms.append(sym)
+		last.append((dates[-1] if len(dates) else -1, cl[-1] if len(cl) else np.nan))
+		trades.append(t)
+		opens.append(o)
+		curves.append((np.asarray(s.date), dates, np.cumsum(pnl)))
+
+	trades = np.concatenate(trades) if trades else np.zeros(0, dtype=TRADE_DTYPE)
+	trades = trades[np.lexsort((trades['sym'], trades['exit_dt']))]
+	opens = np.concatenate(opens) if opens else np.zeros(0, dtype=TRADE_DTYPE)
+	opens = opens[np.lexsort((opens['sym'], opens['dt']))]
+	if close and len(opens):
+		c = opens.copy()
+		c['exit_dt'] = [last[k][0] for k in c['sym']]
+		c['exit'] = [last[k][1] for k in c['sym']]
+		trades = np.concatenate((trades, c))
+		opens = opens[:0]
+
+	#each symbol's profit so far at every date of any input
+	alldates = np.unique(np.concatenate([c[0] for c in curves])) if curves else np.zeros(0, 'int64')
+	values = np.zeros(len(alldates)) + equity
+	for (raw, dates, cum) in curves:
+		i = np.searchsorted(dates, alldates, 'right') - 1
+		values += np.where(i >= 0, cum[np.maximum(i, 0)], 0)
+
+	return VectorResult(syms, equity, trades, opens, alldates, values)
+
+###
+# the event driven counterpart of run_vector
+#
+# places market orders so the position after each bar is the target for
+# that bar, closing the open position (via a linked order) whenever the
+# target changes. targets is a dict of sym: array lined up with the rows
+# of the BarSeries given to add_input.
+###
+class SignalBackTest(BackTest):
+
+	def __init__(self, targets, *args, **kw):
+		BackTest.__init__(self, *args, **kw)
+		self.targets = targets
+		self._tgt = {}
+
+	def bar_close(self, sym, b):
+
+		tgt = self._tgt.get(sym)
+		if tgt is None:
+			for (s, f, bartype) in self.inputs:
+				if s == sym:
+					tgt = np.asarray(self.targets[sym])[_weekday_rows(f)]
+			self._tgt[sym] = tgt
+
+		want = tgt[self.bars[sym].total]
+		ps = self.poslist.sym_open(sym)
+		have = ps[0].size if ps else 0
+		if want == have:
+			return
+		for p in ps:
+			if p.size > 0:
+				d = Order.SELL
+			else:
+				d = Order.BUY
+			self.book.add(Order(sym, d, Order.MARKET, level=b.cl, size=-p.size, link=p.order_id))
+		if want != 0:
+			if want > 0:
+				d = Order.BUY
+			else:
+				d = Order.SELL
+			self.book.add(Order(sym, d, Order.MARKET, level=b.cl, size=want))
+
+###
+# check run_vector against SignalBackTest on the same inputs and targets
+#
+# returns a list of differences, empty if they agree. trades and open
+# positions have to match exactly, the equity figures to within tol as
+# BackTest rounds to 6 digits as it goes. by default tol allows half a
+# unit of the last digit for each close and one for the final sum.
+###
+def verify(inputs, targets, equity=100000, tol=None):
+
+	v = run_vector(inputs, targets, equity)
+	bt = SignalBackTest(targets, equity=equity)
+	for (sym, s) in inputs:
+		bt.add_input(sym, s)
+	so = sys.stdout
+	sys.stdout = open(os.devnull, 'w')
+	try:
+		bt.run()
+	finally:
+		sys.stdout.close()
+		sys.stdout = so
+
+	diffs = []
+	def trade(sym, dt, entry, exit, size):
+		return (sym, dt, float(entry), exit if exit is None else float(exit), float(size))
+	vt = [trade(v.syms[t['sym']], ts2dt(t['dt']), t['entry'], t['exit'], t['size']) for t in v.trades]
+	et = [trade(p.symbol, p.dt, p.entry, p.exit, p.size) for p in bt.poslist.closed]
+	if vt != et:
+		diffs.append("closed trades differ: %d vector %d event" % (len(vt), len(et)))
+		for (x, y) in zip(vt, et):
+			if x != y:
+				diffs.append("first difference: vector %s event %s" % (x, y))
+				break
+	vo = [trade(v.syms[t['sym']], ts2dt(t['dt']), t['entry'], None, t['size']) for t in v.open]
+	eo = [trade(p.symbol, p.dt, p.entry, None, p.size) for p in bt.poslist.open]
+	if sorted(vo) != sorted(eo):
+		diffs.append("open positions differ: vector %s event %s" % (vo, eo))
+
+	st = bt.poslist.stats
+	if (v.nwin, v.nlos, v.nbe) != (st.nwin, st.nlos, st.nbe):
+		diffs.append("win/loss/be differ: vector %s event %s" % ((v.nwin, v.nlos, v.nbe),
+			(st.nwin, st.nlos, st.nbe)))
+
+	if tol is None:
+		unit = 10.0 ** (len(str(int(abs(equity)) or 1)) - decimal.getcontext().prec)
+		tol = unit * (0.5 * len(vt) + 1)
+	for name in ('equity', 'max_equity', 'min_equity'):
+		(a, b) = (getattr(v, name), float(getattr(bt, name)))
+		if abs(a - b) > tol:
+			diffs.append("%s differs: vector %.2f event %.2f" % (name, a, b))
+
+	ev = list(bt.eqvals)
+	if len(ev) != len(v.eqvals):
+		diffs.append("equity curves differ in length: vector %d event %d" % (len(v.eqvals), len(ev)))
+	else:
+		for ((vd, vv), (ed, evv)) in zip(v.eqvals, ev):
+			if vd != ed or abs(float(vv) - float(evv)) > tol:
+				diffs.append("equity curves differ at %s: vector %s event %s %s" % (vd, vv, ed, evv))
+				break
+	return diffs
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+
+###
+# walk forward optimisation
+#
+# the dates of the inputs are cut into windows of train dates (in
+# sample) followed by test dates (out of sample), moving on by step
+# dates (test by default). for each window every combination of the
+# grid is run in sample, the best by objective is then run out of
+# sample. each run starts from fresh equity over just its window.
+#
+# in and out of sample runs first play the warmup dates before their
+# window, so indicators are ready when it starts, without trading or
+# counting any equity for them (see BackTest.trade_from). the first
+# window only gets what there is before it. warmup is a number of dates,
+# a function of the params giving one, or None for the strategy's 
+# lookback (or a lookback param), none if that's None too.
+#
+#	results = walk_forward(MABackTest, {'ma': [50, 100, 200]}, ['SPY.csv'],
+#		train=500, test=125, warmup=200, cache='wf.cache')
+#	print_walk(results)
+#
+# or from the command line
+#
+#	./walkforward.py maeg.MABackTest train=500 test=125 warmup=200 ma=50,100,200 SPY.csv
+#
+# runs go through sweep's pool, all the windows at once. with a cache
+# (a path for a shelve file, or any dict) each run's row is kept under
+# the class, params, window and a fingerprint of the bars in it, so
+# widening the grid or adding windows only runs what's new. changing
+# the strategy's code isn't noticed, give a new tag or a new cache.
+###
+
+import sys
+import bisect
+import shelve
+import hashlib
+import collections
+from sweep import *
+from sweep import _fmt, _value, _played
+
+###
+# the windows over a sorted list of dates, (start, mid, end) with
+# [start, mid) in sample and [mid, end) out of sample, end is None for
+# the last if it runs to the end of the data. a window needs all of its
+# train dates and at least one test date
+###
+def windows(dates, train, test, step=None):
+
+	if step is None:
+		step = test
+	if train < 1 or test < 1 or step < 1:
+		raise ValueError("train, test and step must be at least 1")
+	w = []
+	for a in xrange(0, len(dates) - train, step):
+		b = a + train
+		c = b + test
+		w.append((dates[a], dates[b], dates[c] if c < len(dates) else None))
+	return w
+
+#every date in any of the inputs, in order
+def all_dates(inputs):
+	dates = set()
+	for (sym, s) in inputs:
+		dates.update(int(d) for d in s.date)
+	return sorted(dates)
+
+#what's in the inputs over a window, so the cache notices new data
+def fingerprint(inputs, start, end):
+	h = hashlib.sha1()
+	for (sym, s) in inputs:
+		s = window(s, start, end)
+		h.update(sym)
+		for c in (s.date, s.op, s.hi, s.lo, s.cl):
+			h.update(str(len(c)))
+			h.update(c.tostring())
+	return h.hexdigest()
+
+def _key(cls, tag, params, span, fp, close):
+	return hashlib.sha1(repr((cls.__module__, cls.__name__, tag, sorted(params.items()),
+		span, fp, close))).hexdigest()
+
+#higher is better, objective is a summary key or a function of the row
+def _score(objective, row):
+	if callable(objective):
+		return objective(row)
+	v = row[objective]
+	if v is None:
+		return float('-inf')
+	return v
+
+###
+# returns a list with a dict per window of
+#	start, mid, end: the window's dates, end None if open ended
+#	params: the in sample winner
+#	in_sample: the rows of each combination, in grid order
+#	out_of_sample: the winner's row out of sample
+###
+def walk_forward(cls, grid, inputs, train, test, step=None, objective='equity',
+	processes=None, quiet=True, close=True, cache=None, tag=None, warmup=None):
+
+	inputs = [load_input(inp) for inp in inputs]
+	combos = grid_params(grid)
+	if len(combos) == 0:
+		raise ValueError("empty grid")
+	dates = all_dates(inputs)
+	wins = windows(dates, train, test, step)
+
+	opened = isinstance(cache, basestring)
+	if opened:
+		cache = shelve.open(cache)
+	elif cache is None:
+		cache = {}
+	#past the last bar, for the open ended last window
+	end_ts = dates[-1] + 1 if dates else None
+
+	#the span of a run of params from start to end, with the warm up 
+	#before start. the warm up's start is part of the span, so the cache
+	#key changes with it
+	def span(params, start, end):
+		n = warmup(params) if callable(warmup) else warmup
+		if n is None:
+			n = params.get('lookback', cls.lookback) or 0
+		i = bisect.bisect_left(dates, start)
+		if n < 1 or i == 0:
+			return (start, end or end_ts)
+		return (start, end or end_ts, dates[max(0, i - n)])
+
+	#the rows for (params, span) jobs, from the cache where they can be
+	def rows(jobs):
+		keys = []
+		todo = collections.OrderedDict()
+		fps = {}
+		for (params, span) in jobs:
+			if span not in fps:
+				fps[span] = fingerprint(inputs, *_played(span))
+			k = _key(cls, tag, params, span, fps[span], close)
+			keys.append(k)
+			if k not in cache:
+				todo[k] = (params, span)
+		got = run_jobs(cls, inputs, todo.values(), processes, quiet, close)
+		for (k, row) in zip(todo, got):
+			cache[k] = row
+		return [cache[k] for k in keys]
+
+	try:
+		ins = rows([(p, span(p, start, mid)) for (start, mid, end) in wins for p in combos])
+
+		results = []
+		best = []
+		for (i, (start, mid, end)) in enumerate(wins):
+			r = ins[i * len(combos):(i + 1) * len(combos)]
+			scores = [_score(objective, row) for row in r]
+			p = combos[scores.index(max(scores))]
+			best.append(p)
+			results.append({'start': ts2dt(start), 'mid': ts2dt(mid),
+				'end': end and ts2dt(end), 'params': p, 'in_sample': r})
+
+		outs = rows([(p, span(p, mid, end)) for (p, (start, mid, end)) in zip(best, wins)])
+		for (res, row) in zip(results, outs):
+			res['out_of_sample'] = row
+		return results
+	finally:
+		if opened:
+			cache.close()
+
+def print_walk(results, out=None):
+
+	if out is None:
+		out = sys.stdout
+	for r in results:
+		ins = [x for x in r['in_sample'] if all(x[k] == v for (k, v) in r['params'].items())][0]
+		oos = r['out_of_sample']
+		params = " ".join("%s=%s" % kv for kv in sorted(r['params'].items()))
+		out.write("%s %s %s  %s  in %s out %s (%d won %d los)\n" % (r['start'].date(),
+			r['mid'].date(), r['end'] and r['end'].date() or '-', params,
+			_fmt(ins['equity']), _fmt(oos['equity']), oos['nwin'], oos['nlos']))
+
+if __name__ == '__main__':
+
+	if len(sys.argv) < 3:
+		print "usage: %s <module.Class> train=N test=N [step=N] [warmup=N] [cache=path] [name=v1,v2 ...] <input file> ..." % (sys.argv[0])
+		sys.exit(1)
+
+	(mod, name) = sys.argv[1].rsplit('.', 1)
+	cls = getattr(__import__(mod), name)
+	opts = {'step': None, 'cache': None, 'warmup': None}
+	grid = []
+	inputs = []
+	for arg in sys.argv[2:]:
+		if '=' not in arg:
+			inputs.append(arg)
+			continue
+		(k, v) = arg.split('=', 1)
+		if k in ('train', 'test', 'step', 'warmup'):
+			opts[k] = int(v)
+		elif k == 'cache':
+			opts[k] = v
+		else:
+			grid.append((k, [_value(x) for x in v.split(',')]))
+
+	print_walk(walk_forward(cls, grid, inputs, **opts))